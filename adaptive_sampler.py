@@ -0,0 +1,97 @@
+import time
+import logger
+
+STATE_ACTIVE = 0
+STATE_IDLE = 1
+STATE_NAMES = ("active", "idle")
+
+class AdaptiveSampler:
+    def __init__(self, config):
+        """
+        Duty cycle of the camera motion sampling
+
+        In a quiet scene the camera is sampled every
+        CAMERA_IDLE_SAMPLE_INTERVAL ms only, saving CPU time, power and heat.
+        Any change of at least CAMERA_ACTIVITY_THRESHOLD percent, even below
+        the motion threshold, switches back to the full rate
+        (CAMERA_SAMPLE_INTERVAL) for at least CAMERA_IDLE_TIMEOUT ms, so a
+        person walking in is followed frame by frame.
+
+        Args:
+            config: System configuration
+        """
+        self.config = config
+        self.state = STATE_ACTIVE
+        now = time.ticks_ms()
+        self.state_since = now     # ticks_ms() of the last transition
+        self.last_activity = now   # ticks_ms() of the last frame with activity
+
+        # Statistics
+        self.state_ms = [0, 0]     # Time spent in each state before the current period
+        self.frames = [0, 0]       # Frames sampled in each state
+        self.transitions = 0
+
+    def _set_state(self, state, now):
+        """Switches state, accounting the time spent in the previous one"""
+        self.state_ms[self.state] += time.ticks_diff(now, self.state_since)
+        self.state = state
+        self.state_since = now
+        self.transitions += 1
+        logger.debug(f"Camera sampling {STATE_NAMES[state]}", verbose=True)
+
+    def update(self, activity):
+        """
+        Accounts the activity of the last frame and returns the next sampling interval
+
+        Args:
+            activity: Change measured in the frame (%) by the detector
+
+        Returns:
+            int: Milliseconds to wait before the next sample
+        """
+        now = time.ticks_ms()
+        self.frames[self.state] += 1
+
+        if activity >= self.config.CAMERA_ACTIVITY_THRESHOLD:
+            self.last_activity = now
+            if self.state == STATE_IDLE:
+                self._set_state(STATE_ACTIVE, now)
+        elif self.state == STATE_ACTIVE and time.ticks_diff(now, self.last_activity) >= self.config.CAMERA_IDLE_TIMEOUT:
+            self._set_state(STATE_IDLE, now)
+
+        return self.interval()
+
+    def wake(self):
+        """Switches to the full rate (e.g. after an event)"""
+        now = time.ticks_ms()
+        self.last_activity = now
+        if self.state == STATE_IDLE:
+            self._set_state(STATE_ACTIVE, now)
+
+    def interval(self):
+        """Returns the sampling interval of the current state"""
+        if self.state == STATE_IDLE:
+            return self.config.CAMERA_IDLE_SAMPLE_INTERVAL
+        return self.config.CAMERA_SAMPLE_INTERVAL
+
+    def get_stats(self):
+        """Returns the time and frames spent in each state"""
+        state_ms = list(self.state_ms)
+        state_ms[self.state] += time.ticks_diff(time.ticks_ms(), self.state_since)
+        return {
+            "state": STATE_NAMES[self.state],
+            "active_ms": state_ms[STATE_ACTIVE],
+            "idle_ms": state_ms[STATE_IDLE],
+            "active_frames": self.frames[STATE_ACTIVE],
+            "idle_frames": self.frames[STATE_IDLE],
+            "transitions": self.transitions
+        }
+
+    def format_stats(self):
+        """Returns the sampling statistics as a readable line"""
+        s = self.get_stats()
+        total = s["active_ms"] + s["idle_ms"]
+        idle_percent = s["idle_ms"] * 100 // total if total else 0
+        return (f"⏱️ Camera sampling: {s['state']}, idle {idle_percent}% of the time "
+                f"({s['idle_ms'] // 1000}s idle, {s['active_ms'] // 1000}s active), "
+                f"{s['idle_frames']} idle + {s['active_frames']} active frames, {s['transitions']} transitions")
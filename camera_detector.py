@@ -5,6 +5,7 @@ import sensor
 import image
 import gc
 import logger
+from motion_mask import MotionMask
 
 # LED for visual feedback
 red_led = pyb.LED(1)
@@ -12,10 +13,27 @@ green_led = pyb.LED(2)
 blue_led = pyb.LED(3)
 
 class CameraDetector:
-    def __init__(self, config):
+    def __init__(self, config, sensor_mode, preroll=None, tracker=None, heatmap=None):
         print("### INITIALIZATION OF SIMPLIFIED CAMERA DETECTOR SUCCESSFUL ###")
         self.config = config
+        self.sensor_mode = sensor_mode
+        self.preroll = preroll  # Optional PrerollBuffer fed with the monitoring frames
+        self.tracker = tracker  # Optional MotionTracker filtering the blocks/background detections
+        self.heatmap = heatmap  # Optional MotionHeatmap accumulating the blocks with motion
+
+        # Block-based detection: frame buffers allocated by init_camera()
+        self.reference = None   # Downscaled previous frame
+        self.current = None     # Downscaled current frame
+        self.diff = None        # Absolute difference between the two
+        self.has_reference = False
+        self.changed_fraction = 0.0  # Fraction of changed blocks (foreground pixels in background mode) in the last frame (0-1)
+        self.activity = 0.0          # Change measured in the last frame (%): brightness, changed blocks or foreground pixels
+        self.gain = 1.0              # Background mode: brightness gain applied to the last frame
+        self.bbox = None             # (x, y, w, h) of the changed blocks in frame coordinates
         self.prev_brightness = None
+        self.mask = None             # MotionMask at the analysed resolution, built from MOTION_MASK
+        self.mask_work = None        # Brightness mode: frame cropped to the mask bounding box
+        self.mask_blocks = 0         # Blocks/background mode: blocks touched by the mask
         self.camera_enabled = False
         self.frame_count = 0
 
@@ -33,20 +51,18 @@ class CameraDetector:
         """Initialize the camera with minimal settings"""
         print(">> Simplified camera initialization...")
         try:
-            # Full reset
-            sensor.reset()
-
-            # Use grayscale and minimal resolution
-            sensor.set_pixformat(sensor.GRAYSCALE)
-            sensor.set_framesize(sensor.QVGA)  # 160x120
-
-            # Skip frames for stabilization
-            sensor.skip_frames(time=300)
+            # Use grayscale and minimal resolution, without resetting the sensor
+            # (stabilization only happens if the pixel format changes)
+            if not self.sensor_mode.set_mode("motion", sensor.GRAYSCALE, self.config.FRAME_SIZE, legacy_settle_ms=300):
+                raise RuntimeError("sensor mode not set")
 
             # Capture initial frame
             print(">> Sensor stabilization...")
             sensor.snapshot()
 
+            if self.config.MOTION_DETECTION_MODE in ("blocks", "background"):
+                self._alloc_block_buffers()
+
             self.camera_enabled = True
             print(">> Camera successfully initialized")
 
@@ -59,11 +75,96 @@ class CameraDetector:
             print(f"!!! CAMERA INITIALIZATION ERROR: {e}")
             logger.error(f"Camera initialization error: {e}")
 
+    def _alloc_block_buffers(self):
+        """Allocates the downscaled frame buffers used by the block and background detection"""
+        scale = self.config.MOTION_DOWNSCALE
+        width = sensor.width() // scale
+        height = sensor.height() // scale
+
+        # Extra frame buffers live outside the MicroPython heap
+        self.reference = sensor.alloc_extra_fb(width, height, sensor.GRAYSCALE)
+        self.current = sensor.alloc_extra_fb(width, height, sensor.GRAYSCALE)
+        self.diff = sensor.alloc_extra_fb(width, height, sensor.GRAYSCALE)
+        self.has_reference = False
+        print(f">> Block detection: {width}x{height} reference, {self.config.MOTION_BLOCKS_X}x{self.config.MOTION_BLOCKS_Y} blocks")
+
+    def deinit(self):
+        """Releases the frame buffers of the block detection"""
+        if self.reference is not None:
+            sensor.dealloc_extra_fb()
+            sensor.dealloc_extra_fb()
+            sensor.dealloc_extra_fb()
+            self.reference = self.current = self.diff = None
+
+    def _update_mask(self, width, height):
+        """
+        Rebuilds the motion mask when MOTION_MASK or the analysed size change
+
+        Args:
+            width: Width of the analysed frames
+            height: Height of the analysed frames
+
+        Returns:
+            MotionMask: The current mask
+        """
+        mask = self.mask
+        if mask is not None and mask.spec == self.config.MOTION_MASK and mask.width == width and mask.height == height:
+            return mask
+
+        try:
+            mask = MotionMask(self.config.MOTION_MASK, width, height)
+        except ValueError as e:
+            logger.error(f"Invalid motion mask, watching the whole frame: {e}")
+            self.config.MOTION_MASK = ""
+            mask = MotionMask("", width, height)
+
+        self.mask_work = None
+        if mask.crop is not None and self.reference is None:
+            self.mask_work = image.Image(mask.bbox[2], mask.bbox[3], sensor.GRAYSCALE)
+
+        if self.reference is not None:
+            block_w = width // self.config.MOTION_BLOCKS_X
+            block_h = height // self.config.MOTION_BLOCKS_Y
+            blocks = self.config.MOTION_BLOCKS_X * self.config.MOTION_BLOCKS_Y
+            if mask.full:
+                self.mask_blocks = blocks
+            else:
+                grid = mask.image.mean_pooled(block_w, block_h)
+                grid.binary([(1, 255)])
+                self.mask_blocks = max(1, mask.count(grid))
+
+        self.mask = mask
+        # Frames analysed with the old mask can't be compared with the new ones
+        self.has_reference = False
+        self.prev_brightness = None
+        print(f">> Motion mask: {mask.describe()}")
+        return mask
+
+    def _masked_mean(self, img):
+        """Returns the mean brightness of the watched pixels of a full frame"""
+        mask = self._update_mask(img.width(), img.height())
+        if mask.full:
+            return img.get_histogram().get_statistics().mean()
+        if mask.rectangle:
+            return img.get_histogram(roi=mask.bbox).get_statistics().mean()
+
+        # Crop to the bounding box, clear the excluded pixels, then rescale the
+        # mean from the whole crop to the watched pixels only
+        self.mask_work.draw_image(img, 0, 0, roi=mask.bbox)
+        self.mask_work.b_and(mask.crop)
+        area = mask.bbox[2] * mask.bbox[3]
+        return self.mask_work.get_statistics().mean() * area / mask.pixels
+
     def check_motion(self):
         """Ultra-simplified motion detection method"""
         if not self.camera_enabled:
             return False
 
+        if self.reference is not None:
+            if self.config.MOTION_DETECTION_MODE == "background":
+                return self._check_motion_background()
+            return self._check_motion_blocks()
+
         try:
             # Increment frame counter
             self.frame_count += 1
@@ -71,11 +172,13 @@ class CameraDetector:
             # Capture a frame
             img = sensor.snapshot()
 
-            # Calculate average brightness using the histogram
+            # Calculate average brightness of the watched area using the histogram
             # This is more reliable and avoids type issues
-            hist = img.get_histogram()
-            stats = hist.get_statistics()
-            current_mean = stats.mean()  # This will always be a single numeric value
+            current_mean = self._masked_mean(img)
+
+            # The frame is no longer needed: keep it for the video pre-roll
+            if self.preroll:
+                self.preroll.add(img)
 
             # Debug every 20 frames
             if self.frame_count % 20 == 0:
@@ -90,6 +193,7 @@ class CameraDetector:
             # Calculate brightness difference in percentage
             diff = abs(current_mean - self.prev_brightness)
             diff_percent = (diff / 255) * 100
+            self.activity = diff_percent
 
             # Gradually update the previous value (ensuring it's numeric)
             # This resolves the type issue
@@ -116,10 +220,283 @@ class CameraDetector:
 
         return False
 
+    def _check_motion_blocks(self):
+        """
+        Block-based frame difference
+
+        The frame is downscaled with an area average, subtracted from the
+        previous one and pooled to one pixel per block, so the per-block
+        mean absolute differences come from a few frame buffer operations.
+        Motion is reported when the fraction of changed blocks exceeds
+        MOTION_THRESHOLD; when almost every block changes at once the frame
+        is treated as a lighting change instead. With a tracker, the changed
+        pixels must also form a blob followed across frames (see
+        MotionTracker).
+        """
+        try:
+            self.frame_count += 1
+
+            img = sensor.snapshot()
+            scale = 1.0 / self.config.MOTION_DOWNSCALE
+            self.current.draw_image(img, 0, 0, x_scale=scale, y_scale=scale, hint=image.AREA)
+
+            # The full frame is no longer needed: keep it for the video pre-roll
+            if self.preroll:
+                self.preroll.add(img)
+
+            # Excluded pixels are zeroed in every frame, so they never differ
+            mask = self._update_mask(self.current.width(), self.current.height())
+            if not mask.full:
+                self.current.b_and(mask.image)
+
+            if not self.has_reference:
+                self.reference.replace(self.current)
+                self.has_reference = True
+                if self.tracker:
+                    self.tracker.clear()
+                print(">> First frame, reference stored")
+                return False
+
+            # |current - reference|, then the reference becomes the current frame
+            self.diff.replace(self.current)
+            self.diff.difference(self.reference)
+            self.reference.replace(self.current)
+
+            # One pixel per block holding its mean absolute difference
+            block_w = self.diff.width() // self.config.MOTION_BLOCKS_X
+            block_h = self.diff.height() // self.config.MOTION_BLOCKS_Y
+            grid = self.diff.mean_pooled(block_w, block_h)
+            grid.binary([(self.config.MOTION_BLOCK_THRESHOLD, 255)])
+
+            blocks = self.mask_blocks
+            changed = mask.count(grid)
+            self.changed_fraction = changed / blocks
+            changed_percent = self.changed_fraction * 100
+            self.activity = changed_percent
+            if self.heatmap:
+                moved = changed and changed_percent < self.config.MOTION_LIGHTING_THRESHOLD
+                self.heatmap.add(grid if moved else None, 128)
+
+            if self.frame_count % 20 == 0:
+                print(f">> Frame #{self.frame_count}, changed blocks: {changed}/{blocks} ({changed_percent:.1f}%)")
+
+            if changed_percent <= self.config.MOTION_THRESHOLD:
+                self.bbox = None
+                if self.tracker:
+                    self.tracker.update(())
+                return False
+
+            if changed_percent >= self.config.MOTION_LIGHTING_THRESHOLD:
+                print(f">> Lighting change ignored: {changed_percent:.1f}% of blocks changed")
+                self.bbox = None
+                if self.tracker:
+                    self.tracker.clear()
+                return False
+
+            if self.tracker:
+                if not self._track_motion():
+                    return False
+            else:
+                self.bbox = self._grid_bbox(grid, block_w, block_h)
+
+            print(f"!!! MOTION DETECTED !!! changed blocks: {changed_percent:.1f}%, bbox: {self.bbox}")
+            red_led.on()
+            time.sleep(0.1)
+            red_led.off()
+            return True
+
+        except Exception as e:
+            print(f"!!! MOTION CHECK ERROR: {e}")
+            logger.error(f"Camera check error: {e}")
+            self.has_reference = False
+
+        return False
+
+    def _grid_bbox(self, grid, block_w, block_h):
+        """Returns the bounding box (x, y, w, h) of the set pixels of a block grid, in frame coordinates"""
+        min_x, min_y, max_x, max_y = grid.width(), grid.height(), -1, -1
+        for y in range(grid.height()):
+            for x in range(grid.width()):
+                if grid.get_pixel(x, y):
+                    min_x = min(min_x, x)
+                    max_x = max(max_x, x)
+                    min_y = min(min_y, y)
+                    max_y = max(max_y, y)
+        if max_x < 0:
+            return None
+        cell_w = block_w * self.config.MOTION_DOWNSCALE
+        cell_h = block_h * self.config.MOTION_DOWNSCALE
+        return (min_x * cell_w, min_y * cell_h, (max_x - min_x + 1) * cell_w, (max_y - min_y + 1) * cell_h)
+
+    def _track_motion(self, invert=False):
+        """
+        Extracts the motion blobs of the difference buffer and feeds the tracker
+
+        Args:
+            invert: True if the motion pixels are the dark ones
+
+        Returns:
+            bool: True if a track raised an event (self.bbox is set to its blob)
+        """
+        self.tracker.set_frame_size(self.diff.width(), self.diff.height())
+        min_pixels = self.config.MOTION_BLOB_MIN_PIXELS
+        blobs = self.diff.find_blobs([(self.config.MOTION_FG_THRESHOLD, 255)], invert=invert,
+                                     pixels_threshold=min_pixels, area_threshold=min_pixels,
+                                     merge=True, margin=2)
+        # The largest blobs pick their track first
+        blobs.sort(key=lambda blob: blob.pixels(), reverse=True)
+
+        slot = self.tracker.update(blobs)
+        if slot < 0:
+            self.bbox = None
+            return False
+
+        scale = self.config.MOTION_DOWNSCALE
+        x, y, w, h = self.tracker.rects[slot]
+        self.bbox = (x * scale, y * scale, w * scale, h * scale)
+        print(f">> Track confirmed after {self.tracker.frames[slot]} frames ({len(blobs)} blobs)")
+        return True
+
+    def _check_motion_background(self):
+        """
+        Foreground detection against a running-average background
+
+        The downscaled frame is first brought to the mean brightness of the
+        background (global gain), so a cloud, the sunrise or a light switch
+        doesn't turn the whole frame into foreground. Pixels still differing
+        from the background by more than MOTION_FG_THRESHOLD are foreground;
+        motion is reported when they exceed MOTION_THRESHOLD percent.
+
+        The background then learns the frame with a per-pixel rate: fast
+        (MOTION_BG_LEARN_RATE) where the scene is background, slow
+        (MOTION_BG_FG_LEARN_RATE) under the foreground, so a moving object
+        doesn't smear into the model but one that stops fades in.
+
+        The reference buffer holds the background and the diff buffer the
+        foreground mask. With a tracker, the foreground must also form a blob
+        followed across frames.
+        """
+        try:
+            self.frame_count += 1
+
+            img = sensor.snapshot()
+            scale = 1.0 / self.config.MOTION_DOWNSCALE
+            self.current.draw_image(img, 0, 0, x_scale=scale, y_scale=scale, hint=image.AREA)
+
+            # The full frame is no longer needed: keep it for the video pre-roll
+            if self.preroll:
+                self.preroll.add(img)
+
+            # Excluded pixels are zeroed in every frame, so they never differ
+            mask = self._update_mask(self.current.width(), self.current.height())
+            if not mask.full:
+                self.current.b_and(mask.image)
+
+            if not self.has_reference:
+                self.reference.replace(self.current)
+                self.has_reference = True
+                if self.tracker:
+                    self.tracker.clear()
+                print(">> First frame, background stored")
+                return False
+
+            # Global gain normalization
+            background_mean = self.reference.get_statistics().mean()
+            current_mean = self.current.get_statistics().mean()
+            self.gain = background_mean / max(current_mean, 1)
+            if self.gain > self.config.MOTION_MAX_GAIN or self.gain * self.config.MOTION_MAX_GAIN < 1:
+                # Too dark or too bright to compare: start over from this frame
+                self._reset_background(f"brightness gain {self.gain:.2f}")
+                return False
+            if abs(self.gain - 1.0) > 0.02:  # Skip the pass for sensor noise
+                self.current.gamma_corr(contrast=self.gain)
+
+            # Foreground mask: |current - background| above the threshold
+            self.diff.replace(self.current)
+            self.diff.difference(self.reference)
+            self.diff.binary([(self.config.MOTION_FG_THRESHOLD, 255)])
+            pixels = mask.pixels
+            foreground = mask.count(self.diff)
+            self.changed_fraction = foreground / pixels
+            foreground_percent = self.changed_fraction * 100
+            self.activity = foreground_percent
+
+            # Foreground blocks, for the bounding box
+            block_w = self.diff.width() // self.config.MOTION_BLOCKS_X
+            block_h = self.diff.height() // self.config.MOTION_BLOCKS_Y
+            grid = self.diff.mean_pooled(block_w, block_h)
+            if self.heatmap:
+                # Blocks with at least a quarter of foreground pixels
+                moved = foreground and foreground_percent < self.config.MOTION_LIGHTING_THRESHOLD
+                self.heatmap.add(grid if moved else None, 64)
+
+            # Slow learning everywhere, then the background pixels catch up.
+            # Checked against OpenMV firmware 4.5+, where blend() is draw_image()
+            # blending: alpha (0-255) is the opacity of the image drawn in, so
+            # the learn rates are the weight of the new frame. Firmware < 4.5
+            # took alpha 0-256 as the weight of the background instead.
+            self.reference.blend(self.current, alpha=self.config.MOTION_BG_FG_LEARN_RATE)
+            self.diff.invert()
+            self.reference.blend(self.current, alpha=self.config.MOTION_BG_LEARN_RATE, mask=self.diff)
+
+            if self.frame_count % 20 == 0:
+                print(f">> Frame #{self.frame_count}, foreground: {foreground}/{pixels} pixels ({foreground_percent:.1f}%), gain {self.gain:.2f}")
+
+            if foreground_percent <= self.config.MOTION_THRESHOLD:
+                self.bbox = None
+                if self.tracker:
+                    self.tracker.update(())
+                return False
+
+            if foreground_percent >= self.config.MOTION_LIGHTING_THRESHOLD:
+                self._reset_background(f"{foreground_percent:.1f}% foreground")
+                return False
+
+            if self.tracker:
+                # The foreground mask was inverted for the background update
+                if not self._track_motion(invert=True):
+                    return False
+            else:
+                # Blocks with at least a quarter of foreground pixels
+                grid.binary([(64, 255)])
+                self.bbox = self._grid_bbox(grid, block_w, block_h)
+
+            print(f"!!! MOTION DETECTED !!! foreground: {foreground_percent:.1f}%, gain {self.gain:.2f}, bbox: {self.bbox}")
+            red_led.on()
+            time.sleep(0.1)
+            red_led.off()
+            return True
+
+        except Exception as e:
+            print(f"!!! MOTION CHECK ERROR: {e}")
+            logger.error(f"Camera check error: {e}")
+            self.has_reference = False
+
+        return False
+
+    def _reset_background(self, reason):
+        """Makes the current frame the new background after a change the gain can't compensate"""
+        print(f">> Lighting change ignored ({reason}), background reset")
+        self.reference.replace(self.current)
+        self.bbox = None
+        if self.tracker:
+            self.tracker.clear()
+
+    def feed_preroll(self):
+        """Captures a frame for the video pre-roll only (e.g. during the inhibit period)"""
+        if not self.camera_enabled or not self.preroll or not self.preroll.due():
+            return
+
+        try:
+            self.preroll.add(sensor.snapshot())
+        except Exception as e:
+            logger.debug(f"Pre-roll capture error: {e}", verbose=True)
+
     def reset_detection(self):
         """Reset motion detection"""
         print(">> Resetting motion detection")
         # Ensure proper reset
         self.prev_brightness = None  # This resolves the issue after a reset
+        self.has_reference = False   # The next frame becomes the block reference
         self.frame_count = 0  # Also reset the frame counter
         logger.info("Camera detection reset")
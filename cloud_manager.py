@@ -3,6 +3,7 @@ import time
 from arduino_iot_cloud import ArduinoCloudClient
 from secrets_keys import WIFI_SSID, WIFI_PASS, DEVICE_ID, SECRET_KEY
 import logger
+from motion_mask import parse_mask
 
 class CloudManager:
     def __init__(self, config):
@@ -18,7 +19,18 @@ class CloudManager:
         self.is_connected = False
         self.last_connection_check = 0
         self.connection_check_interval = 5  # Reduced for greater responsiveness
-        self.log_messages = []  # Buffer for log messages
+        self.log_messages = []  # Log messages not yet published
+
+        # Write coalescing: variables changed locally are published together by flush()
+        self.pending = {}              # Cloud variable name -> value not yet published
+        self.first_pending_time = 0    # ticks_ms() of the oldest unpublished write
+        self.last_write_time = 0       # ticks_ms() of the latest write
+        self.status_restore_time = None  # ticks_ms() at which a temporary status expires
+
+        # Statistics
+        self.writes = 0                # Variable writes requested
+        self.flushes = 0               # update() calls that published changed variables
+        self.records_flushed = 0       # Variables published by the flushes
 
         # Set the reference to the cloud manager for logging
         logger.set_cloud_manager(self)
@@ -92,6 +104,8 @@ class CloudManager:
                                on_write=self._on_camera_threshold_change)
             self.client.register("distance_threshold", value=self.config.DISTANCE_THRESHOLD,
                                on_write=self._on_distance_threshold_change)
+            self.client.register("motion_mask", value=self.config.MOTION_MASK,
+                               on_write=self._on_motion_mask_change)
 
             # Video parameters
             self.client.register("video_duration", value=self.config.VIDEO_DURATION,
@@ -113,6 +127,7 @@ class CloudManager:
             self.client.register("current_video", value="")
             self.client.register("event_type", value="")
             self.client.register("video_list", value="[]")
+            self.client.register("latency_summary", value="")
 
             # Video recording
             self.client.register("record_video_enabled", value=self.config.RECORD_VIDEO_ENABLED,
@@ -162,28 +177,28 @@ class CloudManager:
                 self.client.update()
 
                 # Main settings
-                self.config.GLOBAL_ENABLE = self.client["global_enable"]
-                self.config.CAMERA_MONITORING_ENABLED = self.client["camera_monitoring"]
-                self.config.AUDIO_MONITORING_ENABLED = self.client["audio_monitoring"]
-                self.config.DISTANCE_MONITORING_ENABLED = self.client["distance_monitoring"]
+                self.config.GLOBAL_ENABLE = self._get_variable("global_enable")
+                self.config.CAMERA_MONITORING_ENABLED = self._get_variable("camera_monitoring")
+                self.config.AUDIO_MONITORING_ENABLED = self._get_variable("audio_monitoring")
+                self.config.DISTANCE_MONITORING_ENABLED = self._get_variable("distance_monitoring")
 
                 # Thresholds
                 self.config.SOUND_THRESHOLD = self.config.validate_threshold(
-                    self.client["audio_threshold"],
+                    self._get_variable("audio_threshold"),
                     self.config.SOUND_THRESHOLD_MIN,
                     self.config.SOUND_THRESHOLD_MAX,
                     self.config.SOUND_THRESHOLD
                 )
 
                 self.config.MOTION_THRESHOLD = self.config.validate_threshold(
-                    self.client["camera_threshold"],
+                    self._get_variable("camera_threshold"),
                     self.config.MOTION_THRESHOLD_MIN,
                     self.config.MOTION_THRESHOLD_MAX,
                     self.config.MOTION_THRESHOLD
                 )
 
                 self.config.DISTANCE_THRESHOLD = self.config.validate_threshold(
-                    self.client["distance_threshold"],
+                    self._get_variable("distance_threshold"),
                     self.config.DISTANCE_THRESHOLD_MIN,
                     self.config.DISTANCE_THRESHOLD_MAX,
                     self.config.DISTANCE_THRESHOLD
@@ -191,21 +206,21 @@ class CloudManager:
 
                 # Video settings
                 self.config.VIDEO_DURATION = self.config.validate_threshold(
-                    self.client["video_duration"],
+                    self._get_variable("video_duration"),
                     self.config.VIDEO_DURATION_MIN,
                     self.config.VIDEO_DURATION_MAX,
                     self.config.VIDEO_DURATION
                 )
 
                 self.config.VIDEO_FPS = self.config.validate_threshold(
-                    self.client["video_fps"],
+                    self._get_variable("video_fps"),
                     self.config.VIDEO_FPS_MIN,
                     self.config.VIDEO_FPS_MAX,
                     self.config.VIDEO_FPS
                 )
 
                 self.config.VIDEO_QUALITY = self.config.validate_threshold(
-                    self.client["video_quality"],
+                    self._get_variable("video_quality"),
                     self.config.VIDEO_QUALITY_MIN,
                     self.config.VIDEO_QUALITY_MAX,
                     self.config.VIDEO_QUALITY
@@ -213,27 +228,27 @@ class CloudManager:
 
                 # Other settings
                 self.config.INHIBIT_PERIOD = self.config.validate_threshold(
-                    self.client["inhibit_period"],
+                    self._get_variable("inhibit_period"),
                     self.config.INHIBIT_PERIOD_MIN,
                     self.config.INHIBIT_PERIOD_MAX,
                     self.config.INHIBIT_PERIOD
                 )
 
                 # Video settings
-                self.config.RECORD_VIDEO_ENABLED = self.client["record_video_enabled"]
-                self.config.SEND_VIDEOS_TELEGRAM = self.client["send_videos_telegram"]
+                self.config.RECORD_VIDEO_ENABLED = self._get_variable("record_video_enabled")
+                self.config.SEND_VIDEOS_TELEGRAM = self._get_variable("send_videos_telegram")
 
                 # Photo settings
                 if "photo_quality" in self.client:
                     self.config.PHOTO_QUALITY = self.config.validate_threshold(
-                        self.client["photo_quality"],
+                        self._get_variable("photo_quality"),
                         10, 100,
                         self.config.PHOTO_QUALITY
                     )
 
                 if "telegram_photo_quality" in self.client:
                     self.config.TELEGRAM_PHOTO_QUALITY = self.config.validate_threshold(
-                        self.client["telegram_photo_quality"],
+                        self._get_variable("telegram_photo_quality"),
                         10, 100,
                         self.config.TELEGRAM_PHOTO_QUALITY
                     )
@@ -241,7 +256,7 @@ class CloudManager:
                 # Audio settings
                 if "audio_gain" in self.client:
                     self.config.AUDIO_GAIN = self.config.validate_threshold(
-                        self.client["audio_gain"],
+                        self._get_variable("audio_gain"),
                         0, 48,
                         self.config.AUDIO_GAIN
                     )
@@ -249,29 +264,39 @@ class CloudManager:
                 # Distance settings
                 if "distance_recalibration" in self.client:
                     self.config.DISTANCE_RECALIBRATION = self.config.validate_threshold(
-                        self.client["distance_recalibration"],
+                        self._get_variable("distance_recalibration"),
                         60, 3600,
                         self.config.DISTANCE_RECALIBRATION
                     )
 
+                # Motion mask (an invalid mask keeps the current one)
+                if "motion_mask" in self.client:
+                    mask = self._get_variable("motion_mask")
+                    if mask is not None and mask != self.config.MOTION_MASK:
+                        try:
+                            parse_mask(mask)
+                            self.config.MOTION_MASK = mask
+                        except ValueError as e:
+                            logger.warning(f"Invalid motion mask from the cloud ignored: {e}")
+
                 # Storage settings
                 if "max_images" in self.client:
                     self.config.MAX_IMAGES = self.config.validate_threshold(
-                        self.client["max_images"],
+                        self._get_variable("max_images"),
                         5, 100,
                         self.config.MAX_IMAGES
                     )
 
                 if "max_videos" in self.client:
                     self.config.MAX_VIDEOS = self.config.validate_threshold(
-                        self.client["max_videos"],
+                        self._get_variable("max_videos"),
                         2, 20,
                         self.config.MAX_VIDEOS
                     )
 
                 if "max_telegram_photos" in self.client:
                     self.config.MAX_TELEGRAM_PHOTOS = self.config.validate_threshold(
-                        self.client["max_telegram_photos"],
+                        self._get_variable("max_telegram_photos"),
                         2, 20,
                         self.config.MAX_TELEGRAM_PHOTOS
                     )
@@ -297,48 +322,46 @@ class CloudManager:
 
             # Update cloud variables with local configuration values
             try:
-                self.client["global_enable"] = self.config.GLOBAL_ENABLE
-                self.client["camera_monitoring"] = self.config.CAMERA_MONITORING_ENABLED
-                self.client["audio_monitoring"] = self.config.AUDIO_MONITORING_ENABLED
-                self.client["distance_monitoring"] = self.config.DISTANCE_MONITORING_ENABLED
-                self.client["audio_threshold"] = int(self.config.SOUND_THRESHOLD)
-                self.client["camera_threshold"] = int(self.config.MOTION_THRESHOLD)
-                self.client["distance_threshold"] = int(self.config.DISTANCE_THRESHOLD)
-                self.client["video_duration"] = int(self.config.VIDEO_DURATION)
-                self.client["video_fps"] = int(self.config.VIDEO_FPS)
-                self.client["video_quality"] = int(self.config.VIDEO_QUALITY)
-                self.client["inhibit_period"] = int(self.config.INHIBIT_PERIOD)
-                self.client["record_video_enabled"] = self.config.RECORD_VIDEO_ENABLED
-                self.client["send_videos_telegram"] = self.config.SEND_VIDEOS_TELEGRAM
+                self._set_variable("global_enable", self.config.GLOBAL_ENABLE)
+                self._set_variable("camera_monitoring", self.config.CAMERA_MONITORING_ENABLED)
+                self._set_variable("audio_monitoring", self.config.AUDIO_MONITORING_ENABLED)
+                self._set_variable("distance_monitoring", self.config.DISTANCE_MONITORING_ENABLED)
+                self._set_variable("audio_threshold", int(self.config.SOUND_THRESHOLD))
+                self._set_variable("camera_threshold", int(self.config.MOTION_THRESHOLD))
+                self._set_variable("distance_threshold", int(self.config.DISTANCE_THRESHOLD))
+                self._set_variable("motion_mask", self.config.MOTION_MASK)
+                self._set_variable("video_duration", int(self.config.VIDEO_DURATION))
+                self._set_variable("video_fps", int(self.config.VIDEO_FPS))
+                self._set_variable("video_quality", int(self.config.VIDEO_QUALITY))
+                self._set_variable("inhibit_period", int(self.config.INHIBIT_PERIOD))
+                self._set_variable("record_video_enabled", self.config.RECORD_VIDEO_ENABLED)
+                self._set_variable("send_videos_telegram", self.config.SEND_VIDEOS_TELEGRAM)
 
                 # Photo settings
                 if hasattr(self.config, 'PHOTO_QUALITY'):
-                    self.client["photo_quality"] = self.config.PHOTO_QUALITY
+                    self._set_variable("photo_quality", self.config.PHOTO_QUALITY)
                 if hasattr(self.config, 'TELEGRAM_PHOTO_QUALITY'):
-                    self.client["telegram_photo_quality"] = self.config.TELEGRAM_PHOTO_QUALITY
+                    self._set_variable("telegram_photo_quality", self.config.TELEGRAM_PHOTO_QUALITY)
 
                 # Audio settings
                 if hasattr(self.config, 'AUDIO_GAIN'):
-                    self.client["audio_gain"] = self.config.AUDIO_GAIN
+                    self._set_variable("audio_gain", self.config.AUDIO_GAIN)
 
                 # Distance settings
                 if hasattr(self.config, 'DISTANCE_RECALIBRATION'):
-                    self.client["distance_recalibration"] = self.config.DISTANCE_RECALIBRATION
+                    self._set_variable("distance_recalibration", self.config.DISTANCE_RECALIBRATION)
 
                 # Storage settings
                 if hasattr(self.config, 'MAX_IMAGES'):
-                    self.client["max_images"] = self.config.MAX_IMAGES
+                    self._set_variable("max_images", self.config.MAX_IMAGES)
                 if hasattr(self.config, 'MAX_VIDEOS'):
-                    self.client["max_videos"] = self.config.MAX_VIDEOS
+                    self._set_variable("max_videos", self.config.MAX_VIDEOS)
                 if hasattr(self.config, 'MAX_TELEGRAM_PHOTOS'):
-                    self.client["max_telegram_photos"] = self.config.MAX_TELEGRAM_PHOTOS
+                    self._set_variable("max_telegram_photos", self.config.MAX_TELEGRAM_PHOTOS)
 
-                # Update system status
+                # Update system status (published by the next flush)
                 self._update_system_status()
 
-                # Force update for synchronization
-                self.client.update()
-
                 logger.info(f"State synchronized to the cloud")
                 return True
 
@@ -361,9 +384,6 @@ class CloudManager:
             # Update status and log
             self._update_system_status()
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
         except Exception as e:
             logger.error(f"Error callback camera monitoring: {e}")
 
@@ -377,9 +397,6 @@ class CloudManager:
             # Update status and log
             self._update_system_status()
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
         except Exception as e:
             logger.error(f"Error callback audio monitoring: {e}")
 
@@ -393,9 +410,6 @@ class CloudManager:
             # Update status and log
             self._update_system_status()
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
         except Exception as e:
             logger.error(f"Error callback distance monitoring: {e}")
 
@@ -412,24 +426,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Camera threshold corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["camera_threshold"] = validated_value
+                self._set_variable("camera_threshold", validated_value)
 
             self.config.MOTION_THRESHOLD = validated_value
             msg = f"Camera threshold set to {validated_value}%"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Camera threshold set to {validated_value}%"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback camera threshold: {e}")
 
@@ -446,24 +452,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Distance threshold corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["distance_threshold"] = validated_value
+                self._set_variable("distance_threshold", validated_value)
 
             self.config.DISTANCE_THRESHOLD = validated_value
             msg = f"Distance threshold set to {validated_value}mm"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Distance threshold set to {validated_value}mm"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback distance threshold: {e}")
 
@@ -496,18 +494,10 @@ class CloudManager:
                         except Exception as e:
                             logger.error(f"Errore durante la ricalibrazione del detector audio: {e}")
 
-                # Temporarily update status and log
+                # Temporarily show the change in the status and log it
                 temp_status = f"Camera threshold set to {validated}%"
-                client["system_status"] = temp_status
+                self._set_temporary_status(temp_status)
                 self.add_log_message(msg)
-
-                # Update required in synchronous mode
-                client.update()
-
-                # After a while, restore the normal status
-                time.sleep(0.5)
-                self._update_system_status()
-                client.update()
         except Exception as e:
             logger.error(f"Errore nel callback _on_audio_threshold_change: {e}")
 
@@ -524,24 +514,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Inhibit period corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["inhibit_period"] = validated_value
+                self._set_variable("inhibit_period", validated_value)
 
             self.config.INHIBIT_PERIOD = validated_value
             msg = f"Inhibit period set to {validated_value}s"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Inhibit period set to {validated_value}s"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback inhibit period: {e}")
 
@@ -553,7 +535,7 @@ class CloudManager:
             logger.info(status_msg)
 
             # Update status and log
-            client["system_status"] = status_msg
+            self._set_variable("system_status", status_msg)
             self.add_log_message(status_msg)
 
             # If globally disabled, ensure all sensors are turned off
@@ -561,13 +543,10 @@ class CloudManager:
                 self.config.CAMERA_MONITORING_ENABLED = False
                 self.config.AUDIO_MONITORING_ENABLED = False
                 self.config.DISTANCE_MONITORING_ENABLED = False
-                client["camera_monitoring"] = False
-                client["audio_monitoring"] = False
-                client["distance_monitoring"] = False
+                self._set_variable("camera_monitoring", False)
+                self._set_variable("audio_monitoring", False)
+                self._set_variable("distance_monitoring", False)
                 self.add_log_message("All sensors disabled")
-
-            # Update required in synchronous mode
-            client.update()
         except Exception as e:
             logger.error(f"Error callback global enable: {e}")
 
@@ -584,24 +563,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Video duration corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["video_duration"] = validated_value
+                self._set_variable("video_duration", validated_value)
 
             self.config.VIDEO_DURATION = validated_value
             msg = f"Video duration set to {validated_value}s"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Video duration set to {validated_value}s"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback video duration: {e}")
 
@@ -618,24 +589,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Video FPS corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["video_fps"] = validated_value
+                self._set_variable("video_fps", validated_value)
 
             self.config.VIDEO_FPS = validated_value
             msg = f"Video FPS set to {validated_value}"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Video FPS set to {validated_value}"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback video FPS: {e}")
 
@@ -652,24 +615,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Video quality corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["video_quality"] = validated_value
+                self._set_variable("video_quality", validated_value)
 
             self.config.VIDEO_QUALITY = validated_value
             msg = f"Video quality set to {validated_value}%"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Video quality set to {validated_value}%"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback video quality: {e}")
 
@@ -681,16 +636,8 @@ class CloudManager:
             logger.info(msg)
 
             # Update status and log
-            client["system_status"] = msg
+            self._set_temporary_status(msg)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback record video enabled: {e}")
 
@@ -702,16 +649,8 @@ class CloudManager:
             logger.info(msg)
 
             # Update status and log
-            client["system_status"] = msg
+            self._set_temporary_status(msg)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback send videos telegram: {e}")
 
@@ -725,24 +664,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Photo quality corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["photo_quality"] = validated_value
+                self._set_variable("photo_quality", validated_value)
 
             self.config.PHOTO_QUALITY = validated_value
             msg = f"Photo quality set to {validated_value}%"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Photo quality set to {validated_value}%"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback photo quality: {e}")
 
@@ -756,24 +687,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Telegram photo quality corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["telegram_photo_quality"] = validated_value
+                self._set_variable("telegram_photo_quality", validated_value)
 
             self.config.TELEGRAM_PHOTO_QUALITY = validated_value
             msg = f"Telegram photo quality set to {validated_value}%"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Telegram photo quality set to {validated_value}%"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback telegram photo quality: {e}")
 
@@ -821,24 +744,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Distance recalibration corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["distance_recalibration"] = validated_value
+                self._set_variable("distance_recalibration", validated_value)
 
             self.config.DISTANCE_RECALIBRATION = validated_value
             msg = f"Distance recalibration interval set to {validated_value}s"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Distance recalibration: {validated_value}s"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback distance recalibration: {e}")
 
@@ -852,24 +767,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Max images corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["max_images"] = validated_value
+                self._set_variable("max_images", validated_value)
 
             self.config.MAX_IMAGES = validated_value
             msg = f"Maximum number of images set to {validated_value}"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Max images: {validated_value}"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error callback max images: {e}")
 
@@ -883,24 +790,16 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Max videos corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["max_videos"] = validated_value
+                self._set_variable("max_videos", validated_value)
 
             self.config.MAX_VIDEOS = validated_value
             msg = f"Maximum number of videos set to {validated_value}"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Max videos: {validated_value}"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
-
-            # Update required in synchronous mode
-            client.update()
-
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
         except Exception as e:
             logger.error(f"Error in max videos callback: {e}")
 
@@ -914,26 +813,42 @@ class CloudManager:
             if validated_value != value:
                 logger.warning(f"Max Telegram photos corrected from {value} to {validated_value}")
                 # Also correct the value in the cloud
-                client["max_telegram_photos"] = validated_value
+                self._set_variable("max_telegram_photos", validated_value)
 
             self.config.MAX_TELEGRAM_PHOTOS = validated_value
             msg = f"Maximum number of Telegram photos set to {validated_value}"
             logger.info(msg)
 
-            # Temporarily update status and log
+            # Temporarily show the change in the status and log it
             temp_status = f"Max Telegram photos: {validated_value}"
-            client["system_status"] = temp_status
+            self._set_temporary_status(temp_status)
             self.add_log_message(msg)
+        except Exception as e:
+            logger.error(f"Error in max Telegram photos callback: {e}")
 
-            # Update required in synchronous mode
-            client.update()
+    def _on_motion_mask_change(self, client, value):
+        """Callback when the motion mask changes"""
+        try:
+            value = (value or "").strip()
+            try:
+                parse_mask(value)
+            except ValueError as e:
+                logger.warning(f"Invalid motion mask {value}: {e}")
+                # Put the mask in use back in the cloud
+                self._set_variable("motion_mask", self.config.MOTION_MASK)
+                self._set_temporary_status("Invalid motion mask")
+                return
+
+            self.config.MOTION_MASK = value
+            msg = f"Motion mask set to {value or 'whole frame'}"
+            logger.info(msg)
 
-            # After a while, restore the normal status
-            time.sleep(0.5)
-            self._update_system_status()
-            client.update()
+            # Temporarily show the change in the status and log it
+            temp_status = "Motion mask updated"
+            self._set_temporary_status(temp_status)
+            self.add_log_message(msg)
         except Exception as e:
-            logger.error(f"Error in max Telegram photos callback: {e}")
+            logger.error(f"Error in motion mask callback: {e}")
 
     def start(self):
         """Starts the connection to the cloud"""
@@ -959,9 +874,9 @@ class CloudManager:
                     # Initial log message
                     self.add_log_message("System started and connected to the cloud")
 
-                    # Update system status
+                    # Update system status and publish the whole state at once
                     self._update_system_status()
-                    self.client.update()
+                    self.flush(force=True)
 
                     return True
                 except Exception as e:
@@ -982,10 +897,11 @@ class CloudManager:
         """Checks the connection status and attempts reconnection if necessary"""
         current_time = time.time()
 
-        # Additional call for synchronous mode
+        # Additional call for synchronous mode (publishes the dirty variables when due)
         if self.is_connected and self.client:
             try:
-                self.client.update()
+                if not self.flush():
+                    self.client.update()
             except Exception as e:
                 logger.debug(f"Error updating cloud client: {e}", verbose=True)
                 self.is_connected = False
@@ -1031,13 +947,100 @@ class CloudManager:
 
         return self.is_connected
 
+    def _set_variable(self, name, value):
+        """
+        Changes a cloud variable locally, it will be published by the next flush
+
+        Args:
+            name: Name of the cloud variable
+            value: New value
+        """
+        if name not in self.pending and self.client[name] == value:
+            return
+
+        now = time.ticks_ms()
+        if not self.pending:
+            self.first_pending_time = now
+        self.pending[name] = value
+        self.last_write_time = now
+        self.writes += 1
+
+    def _get_variable(self, name):
+        """Returns the value of a cloud variable, including the unpublished changes"""
+        if name in self.pending:
+            return self.pending[name]
+        return self.client[name]
+
+    def _set_temporary_status(self, status, duration=None):
+        """
+        Shows a status for a while, then the normal status is restored by flush()
+
+        Args:
+            status: Temporary status message
+            duration: Seconds the status is shown (default: CLOUD_TEMP_STATUS_TIME)
+        """
+        if duration is None:
+            duration = self.config.CLOUD_TEMP_STATUS_TIME
+        self._set_variable("system_status", status)
+        self.status_restore_time = time.ticks_add(time.ticks_ms(), int(duration * 1000))
+
+    def flush(self, force=False):
+        """
+        Publishes all the changed variables with a single update() call
+
+        The flush happens once no variable has changed for CLOUD_FLUSH_INTERVAL,
+        or when the oldest change has waited CLOUD_MAX_STALENESS.
+
+        Args:
+            force: If True, publishes the changes immediately
+
+        Returns:
+            bool: True if update() was called, False otherwise
+        """
+        if not self.client or not self.is_connected:
+            return False
+
+        now = time.ticks_ms()
+        if self.status_restore_time is not None and time.ticks_diff(now, self.status_restore_time) >= 0:
+            self._update_system_status()
+
+        if not self.pending:
+            return False
+        if not force:
+            quiet = time.ticks_diff(now, self.last_write_time)
+            waited = time.ticks_diff(now, self.first_pending_time)
+            if quiet < self.config.CLOUD_FLUSH_INTERVAL and waited < self.config.CLOUD_MAX_STALENESS:
+                return False
+
+        try:
+            records = len(self.pending)
+            for name, value in self.pending.items():
+                self.client[name] = value
+            self.pending = {}
+            self.log_messages = []
+
+            # In synchronous mode update() publishes every changed record in one message
+            self.client.update()
+            self.flushes += 1
+            self.records_flushed += records
+            logger.debug(f"Cloud flush: {records} variables", verbose=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error flushing cloud variables: {e}", cloud=False)
+            return False
+
+    def format_stats(self):
+        """Returns the write coalescing statistics as a readable line"""
+        return (f"☁️ Cloud: {self.writes} variable writes published by {self.flushes} flushes "
+                f"({self.records_flushed} records), {len(self.pending)} pending")
+
     def update_status(self, status):
-        """Updates the system status on the cloud"""
+        """Updates the system status on the cloud immediately"""
         if self.client and self.is_connected:
             try:
-                self.client["system_status"] = status
-                # In synchronous mode, update() is required after each change
-                self.client.update()
+                self._set_variable("system_status", status)
+                self.status_restore_time = None
+                self.flush(force=True)
                 return True
             except Exception as e:
                 logger.error(f"Error updating status: {e}")
@@ -1054,7 +1057,8 @@ class CloudManager:
             status_msg = f"System {'active' if self.config.GLOBAL_ENABLE else 'inactive'} | Camera: {'ON' if self.config.CAMERA_MONITORING_ENABLED else 'OFF'} | Audio: {'ON' if self.config.AUDIO_MONITORING_ENABLED else 'OFF'} | Distance: {'ON' if self.config.DISTANCE_MONITORING_ENABLED else 'OFF'}"
 
             # Update the cloud variable
-            self.client["system_status"] = status_msg
+            self._set_variable("system_status", status_msg)
+            self.status_restore_time = None
 
             return True
         except Exception as e:
@@ -1075,15 +1079,12 @@ class CloudManager:
                 # Add to the local buffer
                 self.log_messages.append(log_msg)
 
-                # Keep only the last message
-                if len(self.log_messages) > 1:
-                    self.log_messages = self.log_messages[-1:]
+                # Keep only the last messages added since the previous flush
+                if len(self.log_messages) > self.config.CLOUD_LOG_MESSAGES:
+                    self.log_messages = self.log_messages[-self.config.CLOUD_LOG_MESSAGES:]
 
                 # Update the cloud variable
-                self.client["log_messages"] = "\n".join(self.log_messages)
-
-                # In synchronous mode, update() is required after each change
-                self.client.update()
+                self._set_variable("log_messages", "\n".join(self.log_messages))
 
                 return True
             except Exception as e:
@@ -1091,8 +1092,17 @@ class CloudManager:
                 return False
         return False
 
-    def notify_event(self, event_type, details=""):
-        """Notifies an event on the cloud"""
+    def notify_event(self, event_type, details="", restore_status=True):
+        """
+        Notifies an event on the cloud
+
+        Args:
+            event_type: Type of the event ("Camera", "Audio", "Distance")
+            details: Additional details shown with the event
+            restore_status: If True, the normal status is restored by a later
+                            flush. Asynchronous callers can pass False and call
+                            restore_system_status() themselves.
+        """
         if self.client and self.is_connected:
             try:
                 # Record timestamp
@@ -1103,27 +1113,44 @@ class CloudManager:
                 event_msg = f"{event_type}: {details}"
 
                 # Update the cloud variables
-                self.client["last_event"] = event_msg
-                self.client["last_event_time"] = time_str
-                self.client["event_type"] = event_type
+                self._set_variable("last_event", event_msg)
+                self._set_variable("last_event_time", time_str)
+                self._set_variable("event_type", event_type)
 
                 # Also add to the log
                 self.add_log_message(f"Event: {event_msg}")
 
                 # Update status to show the event
                 temp_status = f"Event {event_type} detected: {details}"
-                self.client["system_status"] = temp_status
+                if restore_status:
+                    self._set_temporary_status(temp_status, 2)
+                else:
+                    self._set_variable("system_status", temp_status)
 
-                # In synchronous mode, update() is required after each change
-                self.client.update()
+                return True
+            except Exception as e:
+                logger.error(f"Error notifying event: {e}")
+                return False
+        return False
 
-                # After a while, restore the normal status
-                time.sleep(2)
-                self._update_system_status()
-                self.client.update()
+    def update_latency_summary(self, summary):
+        """Publishes the per-stage latency summary of the event path"""
+        if self.client and self.is_connected:
+            try:
+                self._set_variable("latency_summary", summary)
+                return True
+            except Exception as e:
+                logger.error(f"Error updating latency summary: {e}")
+                return False
+        return False
 
+    def restore_system_status(self):
+        """Restores the normal system status after a temporary one"""
+        if self.client and self.is_connected:
+            try:
+                self._update_system_status()
                 return True
             except Exception as e:
-                logger.error(f"Error notifying event: {e}")
+                logger.error(f"Error restoring system status: {e}")
                 return False
         return False
@@ -15,14 +15,39 @@ class Config:
     DISTANCE_MONITORING_ENABLED = False # Enable/disable monitoring via ToF sensor
 
     # Camera settings
-    MOTION_THRESHOLD = 5       # Threshold for motion detection (%)
+    MOTION_THRESHOLD = 5       # Threshold for motion detection (%): brightness change, changed blocks in blocks mode, foreground pixels in background mode
     MOTION_THRESHOLD_MIN = 1   # Minimum value
     MOTION_THRESHOLD_MAX = 50  # Maximum value
+    MOTION_DETECTION_MODE = "brightness"  # "brightness" (global mean), "blocks" (per-block frame difference) or "background" (background model)
+    MOTION_DOWNSCALE = 2       # Blocks/background mode: reference frame downscale factor
+    MOTION_BLOCKS_X = 8        # Blocks/background mode: horizontal blocks
+    MOTION_BLOCKS_Y = 6        # Blocks/background mode: vertical blocks
+    MOTION_BLOCK_THRESHOLD = 12   # Blocks mode: mean absolute difference (0-255) marking a block as changed
+    MOTION_LIGHTING_THRESHOLD = 90  # Blocks/background mode: changed blocks or foreground pixels (%) treated as a lighting change
+    MOTION_BG_LEARN_RATE = 32  # Background mode: weight (0-255, blend() alpha on OpenMV 4.5+) of a new frame in the background pixels
+    MOTION_BG_FG_LEARN_RATE = 12  # Background mode: weight (0-255) in the foreground pixels, so a stopped object fades in (above 255 / MOTION_FG_THRESHOLD)
+    MOTION_FG_THRESHOLD = 25   # Background mode: difference (0-255) from the background marking a pixel as foreground
+    MOTION_MAX_GAIN = 4.0      # Background mode: largest brightness gain compensated (a larger change resets the background)
+    MOTION_MASK = ""           # Watched area: "roi"/"exclude" rectangles (x,y,w,h) or polygons (x1,y1,x2,y2,...) in percent, separated by ";" ("" = whole frame)
+    MOTION_TRACKING_ENABLED = True  # Blocks/background mode: report motion only for blobs tracked across frames
+    MOTION_BLOB_MIN_PIXELS = 12  # Blocks/background mode: smallest motion blob (pixels of the downscaled frame)
+    MOTION_TRACK_MAX = 8       # Tracks followed at the same time
+    MOTION_TRACK_MIN_FRAMES = 3  # Frames a track must be seen in to raise an event
+    MOTION_TRACK_MAX_DISTANCE = 25  # Largest centroid movement between two frames (% of the frame width)
+    MOTION_TRACK_MAX_MISSED = 1  # Frames a track survives without a matching blob
+    MOTION_TRIPWIRE = ""       # Line "x1,y1,x2,y2" (percent) raising an event as soon as a track crosses it ("" = none)
+    MOTION_HEATMAP_ENABLED = True  # Blocks/background mode: count the blocks with motion for the heatmap
+    MOTION_HEATMAP_SAVE_INTERVAL = 3600  # Seconds between the heatmaps saved in camera_heatmap (0 = only on demand)
+    MOTION_HEATMAP_CELL = 16   # Pixels of each block in the heatmap image
     FRAME_SIZE = sensor.QQVGA   # Resolution for motion detection
     PHOTO_SIZE = sensor.QQVGA   # Resolution for photos
     MAX_IMAGES = 20            # Maximum number of images to keep per camera
+    MAX_HEATMAPS = 24          # Maximum number of motion heatmaps to keep
     PHOTO_QUALITY = 90         # JPEG image quality (0-100)
 
+    SENSOR_INIT_SETTLE_TIME = 2000  # Stabilization after the first configuration of the sensor (ms)
+    SENSOR_SETTLE_TIME = 100   # Stabilization after a pixel format change (ms)
+
     # Audio settings
     SOUND_THRESHOLD = 5        # Increased threshold to reduce false positives
     SOUND_THRESHOLD_MIN = 0
@@ -57,17 +82,65 @@ class Config:
     CLOUD_SYNC_INTERVAL = 5        # Cloud sync interval (seconds)
     DETECTOR_CHECK_INTERVAL = 2     # Detector state check interval (seconds)
 
+    # Detector tasks (each detector runs as its own asyncio task)
+    CAMERA_SAMPLE_INTERVAL = 100    # Camera motion check interval (milliseconds)
+    CAMERA_ADAPTIVE_SAMPLING = True # Sample the camera at a lower rate while the scene is quiet
+    CAMERA_IDLE_SAMPLE_INTERVAL = 500  # Camera motion check interval while quiet (milliseconds)
+    CAMERA_ACTIVITY_THRESHOLD = 1.0    # Change (%) in a frame that switches back to the full rate
+    CAMERA_IDLE_TIMEOUT = 10000     # Time without activity before switching to the idle rate (milliseconds)
+    AUDIO_SAMPLE_INTERVAL = 50      # Audio peak check interval (milliseconds)
+    DISTANCE_SAMPLE_INTERVAL = 100  # Distance check interval (milliseconds)
+    EVENT_QUEUE_SIZE = 8            # Maximum detections waiting for the dispatcher
+
+    # Event pipeline (capture -> persistence -> cloud -> Telegram)
+    # Drop policies: "drop_oldest" or "drop_newest" when a stage queue is full
+    PIPELINE_PERSIST_QUEUE_SIZE = 4             # Events waiting for FIFO cleanup
+    PIPELINE_PERSIST_DROP_POLICY = "drop_oldest"
+    PIPELINE_CLOUD_QUEUE_SIZE = 4               # Events waiting for the cloud notification
+    PIPELINE_CLOUD_DROP_POLICY = "drop_oldest"
+    PIPELINE_TELEGRAM_QUEUE_SIZE = 3            # Events waiting for Telegram delivery
+    PIPELINE_TELEGRAM_DROP_POLICY = "drop_oldest"
+
+    # Latency tracing along the event path
+    TRACE_ENABLED = True            # Record stage timings of each event
+    TRACE_RING_SIZE = 256           # Spans kept in memory (oldest are overwritten)
+    TRACE_CLOUD_INTERVAL = 60       # Latency summary publish interval on the cloud (seconds)
+
     # Cloud settings
     CLOUD_ENABLED = True       # Enable/disable cloud connection
+    CLOUD_FLUSH_INTERVAL = 500      # Publish changed variables after this long without new changes (milliseconds)
+    CLOUD_MAX_STALENESS = 2000      # Maximum delay of a changed variable before it is published (milliseconds)
+    CLOUD_TEMP_STATUS_TIME = 2      # Time a temporary status (e.g. a setting change) is shown (seconds)
+    CLOUD_LOG_MESSAGES = 3          # Log messages published together in log_messages
 
     # Telegram settings
     TELEGRAM_ENABLED = True           # Enable/disable Telegram bot
+    TELEGRAM_UPLOAD_POOL_SIZE = 1     # Keep-alive TLS connections kept open for uploads and messages (1-2; 2 keeps one for the messages sent during an upload)
+    TELEGRAM_UPLOAD_IDLE_TIMEOUT = 60000  # Idle time after which a pooled connection is not reused (milliseconds)
+    TELEGRAM_FILE_ID_CACHE_SIZE = 8   # Uploaded files remembered by file_id, sent again without re-uploading
+    TELEGRAM_UPLOAD_CHUNK_SIZE = 1024 # Smallest chunk written before yielding to the other tasks (grows while the link keeps up)
+    TELEGRAM_UPLOAD_BUFFER_SIZE = 8192  # Preallocated upload buffer, largest chunk written in one go
+    TELEGRAM_UPLOAD_PROGRESS_STEP = 20480  # Upload progress logged every this many bytes
+    TELEGRAM_LONG_POLL_TIMEOUT = 25   # Seconds getUpdates waits on the server for new messages (0 = poll every second)
+    TELEGRAM_UPDATES_LIMIT = 10       # Maximum updates handled per getUpdates reply
+    TELEGRAM_RECEIVE_BUFFER_MAX = 16384  # Size the receive buffer can grow to for replies with many updates
+    TELEGRAM_OUTGOING_MAX = 32        # Queued outgoing messages; when full the oldest least urgent one is dropped
+    TELEGRAM_CHAT_INTERVAL = 1000     # Minimum interval between messages to the same chat once the burst is used (milliseconds)
+    TELEGRAM_CHAT_BURST = 3           # Messages that can be sent back to back to the same chat
+    TELEGRAM_EVENT_BUNDLE = True      # Send the text, photo and video of an event as one album (one request per user)
+    TELEGRAM_OUTBOX_ENABLED = True    # Keep the failed event deliveries on flash and retry them (also after a reboot)
+    TELEGRAM_OUTBOX_FILE = "telegram.outbox"  # Journal of the pending deliveries
+    TELEGRAM_OUTBOX_MAX_ENTRIES = 16  # Pending deliveries kept; when full the oldest one is dropped
+    TELEGRAM_OUTBOX_RETRY_MIN = 5000  # First retry delay of a failed delivery (milliseconds), doubled at every failure
+    TELEGRAM_OUTBOX_RETRY_MAX = 300000  # Longest retry delay (milliseconds)
+    TELEGRAM_OUTBOX_MAX_ATTEMPTS = 20 # Attempts after which a delivery is dropped
 
     # Telegram photo settings
     SEND_PHOTOS_TELEGRAM = True       # Enable/disable automatic photo sending via Telegram
     MAX_TELEGRAM_PHOTOS = 5           # Maximum number of Telegram photos to keep per category
     TELEGRAM_PHOTO_QUALITY = 100      # Quality for Telegram photos (0-100)
     TELEGRAM_PHOTO_SIZE = sensor.HD   # Resolution for Telegram photos
+    TELEGRAM_PHOTO_SCALE = 1.0        # Scale of the event Telegram photo relative to the archive photo (<= 1.0)
 
     # Video recordings settings
     RECORD_VIDEO_ENABLED = True      # Enable/disable video recording
@@ -75,6 +148,13 @@ class Config:
     MAX_VIDEOS = 5                   # Maximum number of videos to keep per category
     MAX_VIDEO_SIZE_TELEGRAM = 10000000  # Maximum video size for Telegram (10MB)
 
+    # Video pre-roll (frames seen before the trigger, kept while the camera monitors)
+    PREROLL_ENABLED = False          # Enable/disable the pre-roll buffer (videos are then recorded in grayscale at FRAME_SIZE, like the buffered motion frames)
+    PREROLL_SECONDS = 3              # Seconds of frames kept before the trigger
+    PREROLL_FPS = 5                  # Frames per second stored in the buffer
+    PREROLL_QUALITY = 50             # JPEG quality of the buffered frames (0-100)
+    PREROLL_MEMORY_BUDGET = 60000    # Bytes preallocated for the buffer (split evenly among the frames)
+
     # Cloud manager instance
     cloud_manager = None
 
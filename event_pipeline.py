@@ -0,0 +1,273 @@
+import pyb
+import uasyncio as asyncio
+import logger
+import tracer
+from event_queue import EventQueue
+
+# LED for visual feedback
+green_led = pyb.LED(2)
+
+class EventPipeline:
+    def __init__(self, config, photo_manager, video_manager, file_manager, detection_queue=None):
+        """
+        Staged pipeline handling detection events
+
+        The capture stage runs in the dispatcher and only grabs photos and
+        video. Persistence (FIFO cleanup and sync), cloud notification and
+        Telegram delivery each run as their own coroutine fed by a bounded
+        queue, so detection resumes as soon as the frames are captured.
+
+        Args:
+            config: System configuration
+            photo_manager: Reference to the photo manager
+            video_manager: Reference to the video manager
+            file_manager: Reference to the file manager
+            detection_queue: Queue feeding the capture stage (for statistics only)
+        """
+        self.config = config
+        self.photo_manager = photo_manager
+        self.video_manager = video_manager
+        self.file_manager = file_manager
+        self.detection_queue = detection_queue
+
+        # References to the notification managers (will be set by the main)
+        self.cloud_manager = None
+        self.telegram_manager = None
+        self.motion_tracker = None  # For statistics only
+        self.camera_sampler = None  # For statistics only
+
+        # Bounded queues between the stages
+        self.persist_queue = EventQueue(config.PIPELINE_PERSIST_QUEUE_SIZE, config.PIPELINE_PERSIST_DROP_POLICY)
+        self.cloud_queue = EventQueue(config.PIPELINE_CLOUD_QUEUE_SIZE, config.PIPELINE_CLOUD_DROP_POLICY)
+        self.telegram_queue = EventQueue(config.PIPELINE_TELEGRAM_QUEUE_SIZE, config.PIPELINE_TELEGRAM_DROP_POLICY)
+
+        self.captured = 0  # Events that completed the capture stage
+        self.telegram_record = None  # Event being delivered by the Telegram stage
+
+    def set_cloud_manager(self, cloud_manager):
+        """Sets the reference to the cloud manager"""
+        self.cloud_manager = cloud_manager
+
+    def set_motion_tracker(self, motion_tracker):
+        """Sets the reference to the camera motion tracker"""
+        self.motion_tracker = motion_tracker
+
+    def set_camera_sampler(self, camera_sampler):
+        """Sets the reference to the camera sampling duty cycle"""
+        self.camera_sampler = camera_sampler
+
+    def set_telegram_manager(self, telegram_manager):
+        """Sets the reference to the Telegram manager"""
+        self.telegram_manager = telegram_manager
+
+    def start(self):
+        """Starts the persistence, cloud and Telegram stages as asyncio tasks"""
+        asyncio.create_task(self._persistence_stage())
+        asyncio.create_task(self._cloud_stage())
+        asyncio.create_task(self._telegram_stage())
+        logger.info("Event pipeline started")
+
+    async def capture(self, event_type, value=None, trace_id=0):
+        """
+        Capture stage: grabs photos and video for an event and queues it
+        for the following stages
+
+        The photo is taken synchronously right away; the video is recorded
+        by a coroutine that yields between frames, so the detector tasks and
+        the other stages keep running during the clip.
+
+        Args:
+            event_type: Type of event ("camera", "audio", "distance")
+            value: Sound level or distance for audio/distance events,
+                   motion bounding box (or None) for camera events
+            trace_id: Tracer event id, carried to the following stages
+
+        Returns:
+            dict: The event record, or None if the photo could not be captured
+        """
+        if event_type == "camera":
+            logger.info("Camera detected, capturing photo...")
+            directory, prefix, tg_prefix, extra_info = "camera_alert", None, "tg", None
+            video_extra_info = None
+        elif event_type == "audio":
+            logger.info(f"Sound detected: level={value:.1f}, capturing photo...")
+            directory, prefix, tg_prefix, extra_info = "audio_alert", "sound", "tg_sound", int(value)
+            video_extra_info = f"sound_{int(value)}"
+        elif event_type == "distance":
+            logger.info(f"Distance changed: {value:.1f}mm, capturing photo...")
+            directory, prefix, tg_prefix, extra_info = "distance_alert", "dist", "tg_dist", int(value)
+            video_extra_info = f"dist_{int(value)}"
+        else:
+            logger.warning(f"Unknown event type: {event_type}")
+            return None
+
+        green_led.on()
+        await asyncio.sleep_ms(100)
+        green_led.off()
+
+        # Other tasks may have changed the current event while we waited
+        tracer.set_event(trace_id)
+
+        # The captures switch the sensor mode: restore it once at the end.
+        # Until then the camera task must not sample. A video requested via
+        # Telegram may still own the sensor: wait for it.
+        sensor_mode = self.photo_manager.sensor_mode
+        while sensor_mode.busy():
+            await asyncio.sleep_ms(50)
+        tracer.set_event(trace_id)
+        sensor_mode.acquire()
+        prev_state = sensor_mode.get_state()
+        sensor_mode.begin_event()
+        record = None
+
+        try:
+            # One frame gives both the archive photo and, if photo sending
+            # is enabled, the photo optimized for Telegram
+            photo, telegram_photo = self.photo_manager.capture_event_photos(
+                directory, prefix, tg_prefix, extra_info,
+                telegram=self.config.SEND_PHOTOS_TELEGRAM, manage_files=False, restore_mode=False)
+            if not photo:
+                return None
+
+            record = {
+                "type": event_type,
+                "value": value,
+                "photo": photo,
+                "telegram_photo": telegram_photo,
+                "video": None,
+                "cleanup": [(directory, self.config.MAX_IMAGES)],
+                "trace_id": trace_id
+            }
+            if telegram_photo:
+                record["cleanup"].append((directory, self.config.MAX_TELEGRAM_PHOTOS))
+
+            # Video recording if enabled
+            if self.config.RECORD_VIDEO_ENABLED:
+                if await self.video_manager.record_video(event_type, video_extra_info, manage_files=False,
+                                                         restore_mode=False, trace_id=trace_id):
+                    record["video"] = self.video_manager.last_video_path
+                    record["cleanup"].append((record["video"].rsplit("/", 1)[0], self.config.MAX_VIDEOS))
+        finally:
+            tracer.set_event(trace_id)
+            sensor_mode.restore(prev_state)
+            sensor_mode.release()
+            saved_ms = sensor_mode.end_event()
+            logger.debug(f"Sensor mode caching saved {saved_ms}ms on this event", verbose=True)
+
+        self.captured += 1
+
+        # Hand the event over to the following stages
+        self.persist_queue.put_nowait(record)
+        if self.cloud_manager:
+            self.cloud_queue.put_nowait(record)
+        if self.telegram_manager:
+            self.telegram_queue.put_nowait(record)
+
+        return record
+
+    def _pending_files(self):
+        """Returns the files the Telegram stage still has to send (queued or in flight)"""
+        records = list(self.telegram_queue.items)
+        if self.telegram_record:
+            records.append(self.telegram_record)
+        return {path for record in records for path in (record["telegram_photo"], record["video"]) if path}
+
+    async def _persistence_stage(self):
+        """
+        Applies the FIFO cleanup of the directories touched by an event
+
+        The Telegram stage may lag several events behind: the files it has
+        not sent yet are skipped, so the cleanup never deletes them.
+        """
+        while True:
+            record = await self.persist_queue.get()
+            try:
+                for directory, max_files in record["cleanup"]:
+                    tracer.set_event(record["trace_id"])
+                    self.file_manager.manage_files(directory, max_files, self._pending_files())
+                    tracer.clear_event()
+                    # Let the detectors run between directories
+                    await asyncio.sleep_ms(0)
+                self.file_manager.sync_filesystem()
+            except Exception as e:
+                logger.error(f"Error in persistence stage: {e}")
+                tracer.clear_event()
+
+    async def _cloud_stage(self):
+        """Publishes the event on the cloud without blocking the loop"""
+        while True:
+            record = await self.cloud_queue.get()
+            try:
+                event_type = record["type"]
+                value = record["value"]
+
+                span_start = tracer.start()
+                if event_type == "camera":
+                    details = f"Camera trigger, area {value}" if value else "Camera trigger"
+                    notified = self.cloud_manager.notify_event("Camera", details, restore_status=False)
+                elif event_type == "audio":
+                    notified = self.cloud_manager.notify_event("Audio", f"Level: {int(value)}", restore_status=False)
+                else:
+                    notified = self.cloud_manager.notify_event("Distance", f"Distance: {int(value)}mm", restore_status=False)
+                tracer.record(tracer.CLOUD_NOTIFY, span_start, record["trace_id"])
+
+                # After a while, restore the normal status
+                if notified:
+                    await asyncio.sleep(2)
+                    self.cloud_manager.restore_system_status()
+            except Exception as e:
+                logger.error(f"Error in cloud stage: {e}")
+
+    async def _telegram_stage(self):
+        """Delivers the event to the Telegram users"""
+        while True:
+            record = await self.telegram_queue.get()
+            self.telegram_record = record
+            try:
+                event_type = record["type"]
+
+                # The uploads yield to the other tasks, so they are attributed
+                # to the event explicitly rather than through the current event
+                trace_id = record["trace_id"]
+                if event_type == "camera":
+                    await self.telegram_manager.notify_motion_event(record["telegram_photo"], record["video"], trace_id)
+                elif event_type == "audio":
+                    await self.telegram_manager.notify_audio_event(int(record["value"]), record["telegram_photo"], record["video"], trace_id)
+                else:
+                    await self.telegram_manager.notify_distance_event(record["value"], record["telegram_photo"], record["video"], trace_id)
+                tracer.finish_event(trace_id)
+            except Exception as e:
+                logger.error(f"Error in Telegram stage: {e}")
+            self.telegram_record = None
+
+    def get_stats(self):
+        """Returns the queue statistics of every stage"""
+        stats = {
+            "persist": self.persist_queue.get_stats(),
+            "cloud": self.cloud_queue.get_stats(),
+            "telegram": self.telegram_queue.get_stats()
+        }
+        if self.detection_queue:
+            stats["capture"] = self.detection_queue.get_stats()
+        return stats
+
+    def format_stats(self):
+        """Returns the pipeline statistics as a readable report"""
+        stats = self.get_stats()
+        report = [f"📦 **Event pipeline** ({self.captured} events captured)"]
+        for stage in ("capture", "persist", "cloud", "telegram"):
+            if stage in stats:
+                s = stats[stage]
+                report.append(f"- {stage}: depth {s['depth']}/{s['size']} (max {s['max_depth']}), processed {s['processed']}, dropped {s['dropped']} [{s['policy']}]")
+        report.append(self.photo_manager.sensor_mode.format_stats())
+        if self.video_manager.preroll:
+            report.append(self.video_manager.preroll.format_stats())
+        if self.motion_tracker:
+            report.append(self.motion_tracker.format_stats())
+        if self.camera_sampler:
+            report.append(self.camera_sampler.format_stats())
+        if self.cloud_manager:
+            report.append(self.cloud_manager.format_stats())
+        if self.telegram_manager:
+            report.append(self.telegram_manager.format_stats())
+        return "\n".join(report)
@@ -0,0 +1,76 @@
+import uasyncio as asyncio
+
+# Drop policies applied when a producer adds an entry to a full queue
+DROP_OLDEST = "drop_oldest"  # Discard the entry at the head to make room
+DROP_NEWEST = "drop_newest"  # Discard the entry being added
+
+class EventQueue:
+    def __init__(self, maxsize=8, drop_policy=DROP_OLDEST):
+        """
+        Bounded queue shared between asynchronous tasks
+
+        Producers call put_nowait() and never wait: when the queue is full
+        an entry is dropped according to the drop policy, so a slow consumer
+        can never stall the producer.
+
+        Args:
+            maxsize: Maximum number of entries kept in the queue
+            drop_policy: DROP_OLDEST or DROP_NEWEST
+        """
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.items = []
+        self.dropped = 0   # Entries discarded because the queue was full
+        self.processed = 0 # Entries handed to a consumer
+        self.max_depth = 0 # Highest number of entries seen waiting
+        self.event = asyncio.Event()
+
+    def put_nowait(self, item):
+        """
+        Adds an item to the queue without blocking
+
+        Returns:
+            bool: True if no entry had to be dropped, False otherwise
+        """
+        if len(self.items) >= self.maxsize:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return False
+            self.items.pop(0)
+            self.items.append(item)
+            self.event.set()
+            return False
+
+        self.items.append(item)
+        if len(self.items) > self.max_depth:
+            self.max_depth = len(self.items)
+        self.event.set()
+        return True
+
+    async def get(self):
+        """Waits until an item is available and returns it (FIFO)"""
+        while not self.items:
+            self.event.clear()
+            await self.event.wait()
+
+        self.processed += 1
+        return self.items.pop(0)
+
+    def qsize(self):
+        """Returns the number of entries waiting in the queue"""
+        return len(self.items)
+
+    def empty(self):
+        """Returns True if the queue is empty"""
+        return not self.items
+
+    def get_stats(self):
+        """Returns depth and counters of the queue"""
+        return {
+            "depth": len(self.items),
+            "max_depth": self.max_depth,
+            "size": self.maxsize,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "policy": self.drop_policy
+        }
@@ -2,10 +2,38 @@ import os
 import time
 import pyb
 import logger
+import tracer
+from collections import deque
+
+# Append-only log of the saved and deleted files, replayed at startup
+MANIFEST_FILE = "files.manifest"
+MANIFEST_TMP_FILE = "files.manifest.tmp"
+
+# Files handled by the FIFO cleanup
+TRACKED_EXTENSIONS = (".jpg", ".mjpeg")
+
+# Maximum number of files indexed per directory
+INDEX_MAX_FILES = 256
+
+# The manifest is rewritten when it holds this many records more than the live files
+MANIFEST_COMPACT_SLACK = 64
 
 def debug_print(msg):
     print(msg)
 
+def _is_tracked(name):
+    for extension in TRACKED_EXTENSIONS:
+        if name.endswith(extension):
+            return True
+    return False
+
+def _entries(queue):
+    """Yields the entries of a deque oldest first, leaving it unchanged"""
+    for _ in range(len(queue)):
+        entry = queue.popleft()
+        queue.append(entry)
+        yield entry
+
 class FileManager:
     def __init__(self):
         # Ensures that the necessary folders exist
@@ -17,6 +45,13 @@ class FileManager:
         self.ensure_directory("audio_videos")
         self.ensure_directory("distance_videos")
         self.ensure_directory("other_videos")
+        self.ensure_directory("camera_heatmap")
+
+        # Per-directory index of the tracked files, oldest first
+        self.index = {}
+        self.manifest_records = 0  # Records currently in the manifest file
+        self.load_index(["camera_alert", "audio_alert", "distance_alert", "telegram_request",
+                         "camera_videos", "audio_videos", "distance_videos", "other_videos", "camera_heatmap"])
 
 
     def ensure_directory(self, directory):
@@ -32,63 +67,206 @@ class FileManager:
         except Exception as e:
             debug_print(f"Error creating folder {directory}: {e}")
 
-    def manage_files(self, directory, max_files):
-        """Manages files in the specified directory (FIFO)"""
+    def load_index(self, directories):
+        """
+        Builds the file index from the manifest
+
+        Directories whose content doesn't match the manifest (or all of them
+        if the manifest is corrupt) are rescanned, then the manifest is
+        rewritten if anything had to be fixed.
+
+        Args:
+            directories: Directories to index
+        """
+        for directory in directories:
+            self.index[directory] = deque((), INDEX_MAX_FILES)
+
+        records = self._read_manifest()
+        valid = records is not None
+        if valid:
+            # Replay the log: a deleted file is dropped from its directory
+            files = {directory: [] for directory in directories}
+            for op, path in records:
+                directory = path.rsplit("/", 1)[0]
+                if directory not in files:
+                    continue
+                if op == "+":
+                    files[directory].append(path)
+                elif path in files[directory]:
+                    files[directory].remove(path)
+        else:
+            logger.warning("File manifest missing or corrupt, rescanning the folders")
+
+        rewrite = not valid
+        for directory in directories:
+            on_flash = self._list_tracked(directory)
+            if valid and sorted(files[directory]) == sorted(on_flash):
+                for path in files[directory]:
+                    self.index[directory].append(path)
+            else:
+                if valid:
+                    logger.warning(f"File manifest out of date for {directory}, rescanning")
+                self._rescan(directory, on_flash)
+                rewrite = True
+
+        if rewrite:
+            self._compact_manifest()
+        logger.info(f"File index loaded: {sum(len(q) for q in self.index.values())} files")
+
+    def _read_manifest(self):
+        """Returns the manifest records as (op, path), or None if missing or corrupt"""
         try:
-            # Get the list of files in the folder
-            files = os.listdir(directory)
+            with open(MANIFEST_FILE, "r") as f:
+                data = f.read()
+        except OSError:
+            return None
 
-            # Filter only jpg files
-            jpg_files = [f for f in files if f.endswith('.jpg')]
+        records = []
+        lines = data.split("\n")
+        # The last line is empty unless a write was interrupted: ignore it,
+        # the comparison with the folders will catch the difference
+        for line in lines[:-1]:
+            if len(line) < 3 or line[0] not in "+-" or "/" not in line or not _is_tracked(line):
+                return None
+            records.append((line[0], line[1:]))
+        self.manifest_records = len(records)
+        return records
 
-            # Print information about the files
-            debug_print(f"Files in {directory}: {len(jpg_files)}")
+    def _list_tracked(self, directory):
+        """Returns the paths of the tracked files in a directory"""
+        try:
+            return [f"{directory}/{name}" for name in os.listdir(directory) if _is_tracked(name)]
+        except OSError:
+            return []
 
-            # If the number of files is greater than or equal to the maximum, delete the oldest ones
-            if len(jpg_files) >= max_files:
-                # Get file information to sort them by date
-                file_info = []
-                for filename in jpg_files:
-                    full_path = f"{directory}/{filename}"
-                    try:
-                        stat = os.stat(full_path)
-                        file_info.append((full_path, stat[8]))  # stat[8] is mtime
-                    except:
-                        debug_print(f"Unable to get stat for {filename}")
+    def _rescan(self, directory, paths=None):
+        """Rebuilds the index of a directory sorting its files by date"""
+        if paths is None:
+            paths = self._list_tracked(directory)
+
+        file_info = []
+        for path in paths:
+            try:
+                file_info.append((path, os.stat(path)[8]))  # stat[8] is mtime
+            except OSError:
+                debug_print(f"Unable to get stat for {path}")
+        file_info.sort(key=lambda x: x[1])
 
-                # Sort files by creation date (oldest to newest)
-                file_info.sort(key=lambda x: x[1])
+        queue = deque((), INDEX_MAX_FILES)
+        for path, _ in file_info[-INDEX_MAX_FILES:]:
+            queue.append(path)
+        self.index[directory] = queue
 
-                # Delete the oldest files until we are below the limit
-                while len(file_info) >= max_files:
-                    oldest_file = file_info.pop(0)[0]
+    def _append_manifest(self, op, path):
+        """Appends one record to the manifest, compacting it when too long"""
+        try:
+            with open(MANIFEST_FILE, "a") as f:
+                f.write(f"{op}{path}\n")
+            self.manifest_records += 1
+        except OSError as e:
+            logger.error(f"Error writing file manifest: {e}")
+            return
+
+        live = sum(len(q) for q in self.index.values())
+        if self.manifest_records > live + MANIFEST_COMPACT_SLACK:
+            self._compact_manifest()
+
+    def _compact_manifest(self):
+        """Rewrites the manifest with only the live files"""
+        try:
+            records = 0
+            with open(MANIFEST_TMP_FILE, "w") as f:
+                for queue in self.index.values():
+                    for path in _entries(queue):
+                        f.write(f"+{path}\n")
+                        records += 1
+            try:
+                os.remove(MANIFEST_FILE)
+            except OSError:
+                pass
+            os.rename(MANIFEST_TMP_FILE, MANIFEST_FILE)
+            self.manifest_records = records
+            debug_print(f"File manifest compacted: {records} files")
+        except Exception as e:
+            logger.error(f"Error compacting file manifest: {e}")
+
+    def register_file(self, path):
+        """Adds a newly written file to the index (as the newest of its directory)"""
+        directory = path.rsplit("/", 1)[0]
+        if directory not in self.index:
+            self._rescan(directory)
+            return
+
+        queue = self.index[directory]
+        if len(queue) >= INDEX_MAX_FILES:
+            # The index is full: forget the oldest file rather than losing the new one
+            self._append_manifest("-", queue.popleft())
+        queue.append(path)
+        self._append_manifest("+", path)
+
+    def manage_files(self, directory, max_files, keep=()):
+        """
+        Manages files in the specified directory (FIFO)
+
+        Args:
+            directory: Directory to clean up
+            max_files: The oldest files are deleted until fewer remain
+            keep: Paths that must not be deleted yet (e.g. still to be sent),
+                  the next oldest files are deleted instead
+        """
+        span_start = tracer.start()
+        try:
+            if directory not in self.index:
+                self._rescan(directory)
+            queue = self.index[directory]
+
+            # Print information about the files
+            debug_print(f"Files in {directory}: {len(queue)}")
+
+            # If the number of files is greater than or equal to the maximum, delete the oldest ones
+            if len(queue) >= max_files:
+                excess = len(queue) - max_files + 1
+                # One pass over the deque, oldest first, keeping the order
+                for _ in range(len(queue)):
+                    oldest_file = queue.popleft()
+                    if excess <= 0 or oldest_file in keep:
+                        queue.append(oldest_file)
+                        continue
+                    excess -= 1
                     debug_print(f"Deleting oldest file: {oldest_file}")
                     try:
                         os.remove(oldest_file)
                     except Exception as e:
                         debug_print(f"Error deleting {oldest_file}: {e}")
-                
+                    self._append_manifest("-", oldest_file)
+                if excess > 0:
+                    debug_print(f"{directory}: {excess} files over the limit kept until sent")
+
                 # Sync the filesystem after deletions
                 self.sync_filesystem()
         except Exception as e:
             debug_print(f"Error managing files in {directory}: {e}")
-    
+        tracer.record(tracer.MANAGE_FILES, span_start)
+
     def save_image(self, img, filename, quality=90):
         """Saves an image with proper flush"""
         try:
             debug_print(f"Saving image: {filename}")
-            
+
             # Direct method: save the image directly to the file
+            span_start = tracer.start()
             img.save(filename, quality=quality)
-            
+            self.register_file(filename)
+
             # Sync the filesystem after saving
             self.sync_filesystem()
+            tracer.record(tracer.JPEG_SAVE, span_start)
             debug_print(f"Image successfully saved: {filename}")
             return True
         except Exception as e:
             debug_print(f"Error saving image {filename}: {e}")
             return False
-    
+
     def sync_filesystem(self):
         """Syncs the filesystem to ensure files are written to flash"""
         try:
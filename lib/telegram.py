@@ -6,32 +6,518 @@
 
 import network, socket, ssl, time, uasyncio as asyncio, json, os, gc
 
+# Incremental parser of one HTTP/1.1 reply accumulated in a buffer.
+# feed() is called every time new data is appended: it only scans the
+# new bytes, tracking the header, the Content-Length or the chunk
+# boundaries of a chunked body, and tells when the reply is complete,
+# so that the body is decoded exactly once.
+class HTTPResponseParser:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.header_end = -1     # Offset of the blank line ending the header.
+        self.scanned = 0         # Bytes already searched for the blank line.
+        self.status = None
+        self.content_length = None
+        self.chunked = False
+        self.keep_alive = True
+        self.body_start = 0
+        self.chunk_pos = 0       # Start of the next chunk size line.
+        self.chunked_body = None # Body of a chunked reply, without framing.
+        self.complete = False
+
+    # Parse the data in buf[:used]. Returns True when the reply is complete,
+    # raises ValueError if the reply is malformed.
+    def feed(self, buf, used):
+        if self.complete:
+            return True
+        if self.header_end == -1:
+            # The blank line may start in the last 3 bytes already scanned.
+            self.header_end = buf.find(b"\r\n\r\n", max(0, self.scanned-3), used)
+            if self.header_end == -1:
+                self.scanned = used
+                return False
+            self.parse_header(buf)
+
+        if self.chunked:
+            self.complete = self.feed_chunks(buf, used)
+        elif self.content_length is not None:
+            self.complete = used - self.body_start >= self.content_length
+        return self.complete
+
+    def parse_header(self, buf):
+        lines = bytes(buf[:self.header_end]).decode('utf-8', 'ignore').split("\r\n")
+        self.status = int(lines[0].split(" ")[1])
+        for line in lines[1:]:
+            key, _, value = line.partition(":")
+            key = key.strip().lower()
+            value = value.strip().lower()
+            if key == "content-length":
+                self.content_length = int(value)
+            elif key == "transfer-encoding" and "chunked" in value:
+                self.chunked = True
+                self.chunked_body = bytearray()
+            elif key == "connection" and value == "close":
+                self.keep_alive = False
+        self.body_start = self.header_end + 4
+        self.chunk_pos = self.body_start
+
+    # Consume the complete chunks in buf[chunk_pos:used], appending
+    # their data to chunked_body. Returns True after the last chunk,
+    # raises ValueError on broken framing.
+    def feed_chunks(self, buf, used):
+        while True:
+            line_end = buf.find(b"\r\n", self.chunk_pos, used)
+            if line_end == -1:
+                return False
+            # The size may be followed by ;extensions
+            size = int(bytes(buf[self.chunk_pos:line_end]).split(b";")[0], 16)
+            if size == 0:
+                # Last chunk: wait for the final CRLF (no trailers expected).
+                return used >= line_end + 4
+            data_start = line_end + 2
+            if used < data_start + size + 2:
+                return False
+            if buf[data_start+size:data_start+size+2] != b"\r\n":
+                raise ValueError("bad chunk framing")
+            self.chunked_body.extend(buf[data_start:data_start+size])
+            self.chunk_pos = data_start + size + 2
+
+    # The reply has no length: it ends when the server closes the
+    # connection. Returns True if the reply is complete this way.
+    def finish_at_close(self):
+        if self.header_end != -1 and not self.chunked and self.content_length is None:
+            self.keep_alive = False
+            self.complete = True
+        return self.complete
+
+    # Return the body of a complete reply in buf[:used].
+    def body(self, buf, used):
+        if self.chunked:
+            return self.chunked_body
+        if self.content_length is None:
+            return buf[self.body_start:used]
+        return buf[self.body_start:self.body_start+self.content_length]
+
+# errno values of a non blocking connect() on the lwIP sockets.
+EALREADY = 114
+EINPROGRESS = 115
+EISCONN = 127
+
+# A TLS connection to api.telegram.org that can serve several HTTP/1.1
+# requests (keep-alive). The socket is non blocking from the start:
+# open() yields while the TCP connection is established, and the TLS
+# handshake is done by the first writes of the request, which yield as
+# well, so opening a connection never stops the other tasks.
+class PooledConnection:
+    def __init__(self, addr):
+        self.addr = addr
+        self.socket = socket.socket(socket.AF_INET)
+        self.socket.setblocking(False)
+        self.ssl = None
+        self.last_used = time.ticks_ms()
+        self.requests = 0   # Requests served by this connection
+
+    # Connect to the server, checking every 'poll_ms' if the connection
+    # is established. Raises OSError on failure, or if the connection is
+    # not established within 'timeout_ms'.
+    async def open(self, timeout_ms, poll_ms):
+        start = time.ticks_ms()
+        while True:
+            try:
+                self.socket.connect(self.addr)
+                break
+            except OSError as e:
+                # The first call starts the connection, the next ones
+                # tell if it is still in progress.
+                if e.args[0] == EISCONN:
+                    break
+                if e.args[0] not in (EINPROGRESS, EALREADY):
+                    raise
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                raise OSError("connection timed out")
+            await asyncio.sleep_ms(poll_ms)
+        self.ssl = ssl.wrap_socket(self.socket, do_handshake=False)
+
+    def close(self):
+        try:
+            if self.ssl != None: self.ssl.close()
+        except Exception:
+            pass
+        try:
+            self.socket.close()
+        except Exception:
+            pass
+
+# Pool of keep-alive connections used by the uploads (sendDocument,
+# sendMediaGroup) and the messages sent during a long poll, so that only
+# the first request pays the TCP connect and the TLS handshake. Idle
+# connections older than idle_timeout_ms are closed instead of being
+# reused, since the server will likely have dropped them. The DNS lookup
+# can't be done without blocking: the address is resolved once, and
+# again only after a failed connection.
+class ConnectionPool:
+    def __init__(self, host="api.telegram.org", port=443, size=1, idle_timeout_ms=60000):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.idle_timeout_ms = idle_timeout_ms
+        self.idle = [] # Connections ready to be reused, most recent last.
+        self.addr = None # Resolved address of the server.
+
+        # Statistics
+        self.handshakes = 0 # New connections opened.
+        self.requests = 0   # Requests sent through the pool.
+        self.reused = 0     # Requests sent on an already open connection.
+        self.failures = 0   # Connections dropped because of errors.
+
+    # Return a connection, reusing an idle one if possible, otherwise
+    # opening a new one without blocking (see PooledConnection.open()).
+    # The second element of the returned tuple tells if the connection
+    # was reused.
+    async def acquire(self, timeout_ms=30000, poll_ms=10):
+        while len(self.idle) > 0:
+            conn = self.idle.pop()
+            if time.ticks_diff(time.ticks_ms(), conn.last_used) < self.idle_timeout_ms:
+                self.requests += 1
+                self.reused += 1
+                return conn, True
+            conn.close()
+        if self.addr == None:
+            self.addr = socket.getaddrinfo(self.host, self.port, socket.AF_INET)[0][-1]
+        conn = PooledConnection(self.addr)
+        try:
+            await conn.open(timeout_ms, poll_ms)
+        except Exception:
+            self.failures += 1
+            self.addr = None # The server may have moved: resolve it again.
+            conn.close()
+            raise
+        self.handshakes += 1
+        self.requests += 1
+        return conn, False
+
+    # Give back a connection after a complete request/reply exchange.
+    # If the server asked to close it, or the pool is full, it is closed.
+    def release(self, conn, keep_alive=True):
+        conn.requests += 1
+        conn.last_used = time.ticks_ms()
+        if keep_alive and len(self.idle) < self.size:
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+    # Close a connection that failed: the next request will open a new one.
+    def discard(self, conn):
+        self.failures += 1
+        conn.close()
+
+    def close_all(self):
+        while len(self.idle) > 0:
+            self.idle.pop().close()
+
+    def reuse_ratio(self):
+        return self.reused / self.requests if self.requests else 0
+
+    def get_stats(self):
+        return {
+            "handshakes": self.handshakes,
+            "requests": self.requests,
+            "reused": self.reused,
+            "failures": self.failures,
+            "idle": len(self.idle),
+            "reuse_ratio": self.reuse_ratio()
+        }
+
+# Small LRU of the file_id assigned by Telegram to the files we uploaded,
+# so that the same file can be sent again (to another chat, or later)
+# by reference instead of uploading its bytes again. Entries remember
+# the file size and mtime, so a file rewritten with the same path is
+# not mistaken for the old one.
+class FileIdCache:
+    def __init__(self, size=8):
+        self.size = size
+        self.entries = {} # path -> (file_size, mtime, file_id)
+        self.order = []   # Paths, least recently used first.
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def get(self, path, file_size, mtime):
+        entry = self.entries.get(path)
+        if entry == None or entry[0] != file_size or entry[1] != mtime:
+            self.misses += 1
+            return None
+        self.order.remove(path)
+        self.order.append(path)
+        self.hits += 1
+        self.bytes_saved += file_size
+        return entry[2]
+
+    def put(self, path, file_size, mtime, file_id):
+        if path in self.entries:
+            self.order.remove(path)
+        elif len(self.order) >= self.size:
+            del self.entries[self.order.pop(0)]
+        self.entries[path] = (file_size, mtime, file_id)
+        self.order.append(path)
+
+    def forget(self, path):
+        if path in self.entries:
+            del self.entries[path]
+            self.order.remove(path)
+
+# Priorities of the outgoing messages, most urgent first.
+PRIORITY_ALERT = 0 # Alarms: delivered before anything else.
+PRIORITY_REPLY = 1 # Replies to the user commands.
+PRIORITY_LOW = 2   # Error chatter and other informational messages.
+
+# Token bucket: up to 'burst' messages can be sent back to back, then
+# one every 'interval_ms'.
+class TokenBucket:
+    def __init__(self, interval_ms, burst):
+        self.interval_ms = interval_ms
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.ticks_ms()
+        self.paused_until = None # Set when the API asked us to slow down.
+
+    def refill(self, now):
+        elapsed = time.ticks_diff(now, self.last)
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed/self.interval_ms)
+            self.last = now
+
+    def ready(self, now):
+        if self.paused_until != None:
+            if time.ticks_diff(self.paused_until, now) > 0:
+                return False
+            self.paused_until = None
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    # Stop sending for 'ms' milliseconds (Telegram 429 retry_after).
+    def pause(self, now, ms):
+        self.paused_until = time.ticks_add(now, ms)
+        self.tokens = 0
+
+# Bounded queue of the outgoing text messages.
+#
+# Messages are kept per priority and per chat. A message queued for a
+# chat that already has a message waiting at the same priority is
+# appended to it (up to max_text characters), so bursts of small
+# notifications become a single sendMessage. Thanks to that each chat
+# list holds one or two entries, and pop() just picks, among the chats
+# allowed to send by their token bucket (and by the global one), the
+# oldest message of the most urgent priority.
+#
+# When the queue is full the oldest message of the lowest priority is
+# dropped, unless the new message is even less urgent: in that case the
+# new message is the one dropped.
+class OutboundQueue:
+    def __init__(self, max_size=32, max_text=2048, chat_interval_ms=1000, chat_burst=3, global_interval_ms=34):
+        self.max_size = max_size
+        self.max_text = max_text
+        self.chat_interval_ms = chat_interval_ms
+        self.chat_burst = chat_burst
+        self.queues = [{}, {}, {}] # Priority -> chat_id -> [[seq, text], ...]
+        self.buckets = {}          # chat_id -> TokenBucket
+        self.global_bucket = TokenBucket(global_interval_ms, chat_burst)
+        self.size = 0              # Messages queued.
+        self.seq = 0               # Order of arrival of the messages.
+        self.retry = None          # Message to send again first, after an error.
+
+        # Statistics
+        self.queued = 0     # Messages passed to push().
+        self.coalesced = 0  # Messages appended to a queued one.
+        self.dropped = 0    # Messages dropped because the queue was full.
+        self.deferred = 0   # pop() calls with messages waiting only on rate limits.
+
+    def __len__(self):
+        return self.size + (1 if self.retry else 0)
+
+    def push(self, chat_id, text, priority=PRIORITY_REPLY):
+        self.queued += 1
+        chats = self.queues[priority]
+        pending = chats.get(chat_id)
+        if pending and len(pending[-1][1])+len(text)+1 < self.max_text:
+            pending[-1][1] += "\n"+text
+            self.coalesced += 1
+            return True
+
+        if self.size >= self.max_size and not self.drop_oldest(priority):
+            self.dropped += 1
+            print(f"[telegram] Outgoing queue full, message to {chat_id} dropped")
+            return False
+
+        if pending == None:
+            pending = []
+            chats[chat_id] = pending
+        self.seq += 1
+        pending.append([self.seq, text])
+        self.size += 1
+        return True
+
+    # Drop the oldest message of the lowest priority, if not more urgent
+    # than 'priority'. Returns True if a message was dropped.
+    def drop_oldest(self, priority):
+        for level in range(len(self.queues)-1, priority-1, -1):
+            chat_id = self.oldest_chat(self.queues[level])
+            if chat_id == None:
+                continue
+            self.remove_head(level, chat_id)
+            self.dropped += 1
+            print(f"[telegram] Outgoing queue full, dropped the oldest message to {chat_id}")
+            return True
+        return False
+
+    # Return the chat whose first message is the oldest, among the ones
+    # accepted by 'ready' (all of them if None).
+    def oldest_chat(self, chats, ready=None):
+        best = None
+        best_seq = 0
+        for chat_id, pending in chats.items():
+            if (best == None or pending[0][0] < best_seq) and (ready == None or ready(chat_id)):
+                best = chat_id
+                best_seq = pending[0][0]
+        return best
+
+    def remove_head(self, priority, chat_id):
+        chats = self.queues[priority]
+        entry = chats[chat_id].pop(0)
+        if len(chats[chat_id]) == 0:
+            del chats[chat_id]
+        self.size -= 1
+        return entry
+
+    def bucket(self, chat_id):
+        bucket = self.buckets.get(chat_id)
+        if bucket == None:
+            bucket = TokenBucket(self.chat_interval_ms, self.chat_burst)
+            self.buckets[chat_id] = bucket
+        return bucket
+
+    # Return the next message to send as a dict with the chat_id and text
+    # fields, or None if the queue is empty or the rate limits don't
+    # allow to send anything now.
+    def pop(self, now):
+        if len(self) == 0:
+            return None
+        if not self.global_bucket.ready(now):
+            self.deferred += 1
+            return None
+
+        message = None
+        if self.retry and self.bucket(self.retry["chat_id"]).ready(now):
+            message = self.retry
+            self.retry = None
+        else:
+            # A paused chat is not ready: its retry doesn't hold the others.
+            ready = lambda chat_id: self.bucket(chat_id).ready(now)
+            for priority in range(len(self.queues)):
+                chat_id = self.oldest_chat(self.queues[priority], ready)
+                if chat_id != None:
+                    message = {"chat_id": chat_id, "text": self.remove_head(priority, chat_id)[1]}
+                    break
+            if message == None:
+                self.deferred += 1
+                return None
+
+        self.global_bucket.take()
+        self.bucket(message["chat_id"]).take()
+        return message
+
+    # Put back a message that could not be sent: it is the next one
+    # sent to its chat. If the API asked to retry after some time, the
+    # chat is paused for that long.
+    def requeue(self, message, retry_after_ms=0):
+        self.retry = message
+        if retry_after_ms:
+            self.bucket(message["chat_id"]).pause(time.ticks_ms(), retry_after_ms)
+
 class TelegramBot:
-    def __init__(self,token,callback):
+    def __init__(self,token,callback,upload_pool_size=1,upload_idle_timeout_ms=60000,file_id_cache_size=8,upload_buffer_size=8192,
+                 long_poll_timeout=0,updates_limit=1,rbuf_max_size=4096,
+                 outgoing_max_size=32,chat_interval_ms=1000,chat_burst=3):
         self.token = token
         self.callback = callback
         self.rbuf = bytearray(4096)
         self.rbuf_mv = memoryview(self.rbuf)
         self.rbuf_used = 0
+        self.rbuf_max_size = rbuf_max_size # The buffer grows up to this size
+                                           # to hold replies with many updates.
+        self.parser = HTTPResponseParser() # Tracks the reply in rbuf.
+        self.surrogate_buf = bytearray(0) # Output of decode_surrogate_pairs(),
+        self.surrogate_mv = memoryview(self.surrogate_buf) # reused.
         self.active = True # So we can stop the task with .stop()
         self.debug = False
         self.missed_write = None # Failed write payload. This is useful
                                  # in order to retransfer after reconnection.
 
-        # Array of outgoing messages. Each entry is a hash with
-        # chat_id and text fields.
-        self.outgoing = []
+        # Outgoing messages, by priority, coalesced per chat and rate
+        # limited like Telegram wants (about one message per second per
+        # chat, 30 per second overall).
+        self.outgoing = OutboundQueue(max_size=outgoing_max_size, chat_interval_ms=chat_interval_ms, chat_burst=chat_burst)
+        self.inflight = None # Message sent on the bot socket, waiting for reply.
         self.pending = False # Pending HTTP request, waiting for reply.
         self.reconnect = True # We need to reconnect the socket, either for
                               # the first time or after errors.
         self.offset = 0     # Next message ID offset.
-        self.watchdog_timeout_ms = 60000 # 60 seconds max idle time.
+
+        # Long polling: getUpdates waits on the server up to
+        # long_poll_timeout seconds for new messages (0 = the old short
+        # polling every second) and returns up to updates_limit updates.
+        # While a poll is pending, outgoing messages are sent on the
+        # pooled upload connection.
+        self.long_poll_timeout = long_poll_timeout
+        self.updates_limit = updates_limit
+        self.single_updates = 0 # Updates still fetched one at a time, after
+                                # a reply too large for the buffer.
+        self.watchdog_timeout_ms = max(60000, (long_poll_timeout+30)*1000) # Max idle time.
+
+        # Statistics
+        self.polls = 0          # getUpdates requests sent.
+        self.updates = 0        # Updates received.
+        self.skipped_updates = 0 # Updates too large for the receive buffer.
+        self.messages_sent = 0  # Outgoing messages delivered.
         self.max_image_size = 50000  # Limit the image size (about 50KB)
 
+        # Keep-alive connections used by uploads, separate from the
+        # non blocking socket of the bot loop.
+        self.wlan = network.WLAN(network.STA_IF)
+        self.upload_pool = ConnectionPool(size=upload_pool_size, idle_timeout_ms=upload_idle_timeout_ms)
+        self.upload_rbuf = bytearray(512)
+        self.upload_rbuf_mv = memoryview(self.upload_rbuf)
+        self.upload_parser = HTTPResponseParser()
+        self.file_ids = FileIdCache(file_id_cache_size)
+
+        # Asynchronous uploads are serialized, one file at a time. Text
+        # messages have their own lock and reply buffer: they take
+        # another pooled connection instead of waiting for an upload.
+        self.upload_lock = asyncio.Lock()
+        self.message_lock = asyncio.Lock()
+        self.message_rbuf = bytearray(512)
+        self.message_rbuf_mv = memoryview(self.message_rbuf)
+        self.message_parser = HTTPResponseParser()
+        self.upload_timeout_ms = 30000 # Max time without upload progress.
+        self.upload_poll_ms = 10       # Wait when the socket is busy.
+
+        # Files are streamed through this buffer, allocated once, so
+        # that uploads don't create garbage. Its size is the largest
+        # chunk written in one go.
+        self.upload_buf = bytearray(upload_buffer_size)
+        self.upload_buf_mv = memoryview(self.upload_buf)
+        self.upload_chunk_target_ms = 50 # Target duration of one async chunk write.
+
     # Stop the task handling the bot. This should be called before
     # destroying the object, in order to also terminate the task.
     def stop(self):
         self.active = False
+        self.upload_pool.close_all()
 
     # Main telegram bot loop.
     # Should be executed asynchronously, like with:
@@ -39,6 +525,12 @@ class TelegramBot:
     async def run(self):
         print("[telegram] Bot task started")
         while self.active:
+            if self.reconnect and not self.wifi_connected():
+                # The connection would fail after blocking in the DNS
+                # lookup: wait for the WiFi to come back.
+                if self.debug: print("[telegram] WiFi not connected, waiting.")
+                await asyncio.sleep(5)
+                continue
             if self.reconnect:
                 if self.debug: print("[telegram] Reconnecting socket.")
                 # Reconnection (or first connection)
@@ -51,6 +543,9 @@ class TelegramBot:
                     self.ssl = ssl.wrap_socket(self.socket)
                     self.reconnect = False
                     self.pending = False
+                    self.inflight = None
+                    self.rbuf_used = 0
+                    self.parser.reset()
                 except Exception as e:
                     print(f"[telegram] Reconnection error: {e}")
                     self.reconnect = True
@@ -60,6 +555,11 @@ class TelegramBot:
             if self.debug and not self.pending:
                 print("[telegram] Checking for updates...")
 
+            # With long polling the bot socket is mostly busy waiting
+            # for updates: deliver messages on the upload connection.
+            if self.long_poll_timeout and len(self.outgoing) > 0:
+                await self.send_outgoing_async()
+
             self.send_api_requests()
             self.read_api_response()
 
@@ -73,11 +573,55 @@ class TelegramBot:
                 self.reconnect = True
                 print("[telegram] *** SOCKET WATCHDOG EXPIRED ***")
 
-            # If there are outgoing messages pending, wait less
-            # to do I/O again.
-            sleep_time = 0.1 if len(self.outgoing) > 0 else 1.0
+            # If there are outgoing messages pending, or a long poll
+            # that may return at any time, wait less to do I/O again.
+            # Checking the socket is local: it costs no radio traffic.
+            if len(self.outgoing) > 0:
+                sleep_time = 0.1
+            elif self.long_poll_timeout and self.pending:
+                sleep_time = 0.2
+            else:
+                sleep_time = 1.0
             await asyncio.sleep(sleep_time)
 
+    # Deliver the queued outgoing messages on the pooled upload
+    # connection, without waiting for the pending long poll to end.
+    # On errors the message is put back and retried later.
+    async def send_outgoing_async(self):
+        while True:
+            message = self.outgoing.pop(time.ticks_ms())
+            if message == None: return # Empty, or rate limited.
+            try:
+                status, body = await self.post_form_async("sendMessage", message, messages=True)
+            except Exception as e:
+                print(f"[telegram] Error sending message: {e}")
+                self.outgoing.requeue(message)
+                return
+            if status == 200:
+                self.messages_sent += 1
+            elif status == 429:
+                # Too many requests: wait as long as the API asks.
+                self.outgoing.requeue(message, self.parse_retry_after(body))
+                return
+            else:
+                # Rejected by the API (e.g. bad chat_id): retrying won't help.
+                print(f"[telegram] sendMessage error response: {body[:200]}")
+
+    # Return the retry_after of a 429 reply in milliseconds (1 second
+    # if missing or unreadable).
+    def parse_retry_after(self, body):
+        try:
+            return json.loads(bytes(body))["parameters"]["retry_after"]*1000
+        except Exception:
+            return 1000
+
+    # Take the next outgoing message to send on the bot socket, if any.
+    # It is remembered until the reply arrives, so that it can be queued
+    # again if Telegram asks us to slow down.
+    def next_inflight(self):
+        self.inflight = self.outgoing.pop(time.ticks_ms())
+        return self.inflight != None
+
     # Send HTTP requests to the server. If there are no special requests
     # to handle (like sendMessage) we just ask for updates with getUpdates.
     def send_api_requests(self):
@@ -91,18 +635,21 @@ class TelegramBot:
             self.missed_write = None
 
         # Issue sendMessage requests if we have pending
-        # messages to deliver.
-        elif len(self.outgoing) > 0:
-            oldest = self.outgoing.pop(0)  # Use FIFO order for messages
-            request = self.build_post_request("sendMessage", oldest)
+        # messages to deliver, and the rate limits allow it.
+        elif not self.long_poll_timeout and self.next_inflight():
+            request = self.build_post_request("sendMessage", self.inflight)
+            self.messages_sent += 1
 
         # Issue a new getUpdates request if there is not
         # some request still pending.
         else:
-            # Limit the fetch to a single message since we are using
-            # a fixed 4k buffer. Very large incoming messages will break
-            # the reading loop: that's a trade off.
-            request = "GET /bot"+self.token+"/getUpdates?offset="+str(self.offset)+"&timeout=0&allowed_udpates=message&limit=1 HTTP/1.1\r\nHost:api.telegram.org\r\n\r\n"
+            # The reply must fit the receive buffer (up to rbuf_max_size):
+            # the limit should be small enough for that. Very large
+            # incoming messages will break the reading loop: that's a
+            # trade off.
+            limit = 1 if self.single_updates > 0 else self.updates_limit
+            request = "GET /bot"+self.token+"/getUpdates?offset="+str(self.offset)+"&timeout="+str(self.long_poll_timeout)+"&allowed_udpates=message&limit="+str(limit)+" HTTP/1.1\r\nHost:api.telegram.org\r\n\r\n"
+            self.polls += 1
 
         # Write the request to the SSL socket.
         if request != None:
@@ -124,6 +671,13 @@ class TelegramBot:
     # and if needed invoke the callback registered by the user for
     # incoming messages.
     def read_api_response(self):
+        # Reply larger than the buffer: grow it if allowed.
+        if self.rbuf_used == len(self.rbuf):
+            if len(self.rbuf) >= self.rbuf_max_size:
+                self.reply_too_large()
+                return
+            self.grow_rbuf()
+
         try:
             # Don't use await to read from the SSL socket (it's not
             # supported). We put the socket in non blocking mode
@@ -137,6 +691,9 @@ class TelegramBot:
 
         if nbytes != None:
             if nbytes == 0:
+                # A reply without length ends with the connection.
+                if self.parser.finish_at_close():
+                    self.process_api_response()
                 self.reconnect = True
                 return
             else:
@@ -144,81 +701,154 @@ class TelegramBot:
                 if self.debug and self.rbuf_used < 100:
                     print(self.rbuf[:self.rbuf_used])
 
-        # Check if we got a well-formed JSON message.
-        self.process_api_response()
-
-    # Check if there is a well-formed JSON reply in the reply buffer:
-    # if so, parses it, marks the current request as no longer "pending"
-    # and resets the buffer. If the JSON reply is an incoming message, the
-    # user callback is invoked.
+        # Check if we got a complete reply.
+        if nbytes:
+            self.process_api_response()
+
+    # A getUpdates reply doesn't fit rbuf_max_size. Asking the same batch
+    # again would fail forever: the next updates_limit updates are
+    # fetched one at a time, and if a single update is still too large
+    # it is skipped, moving the offset past the update_id found at the
+    # start of the reply.
+    def reply_too_large(self):
+        if self.single_updates > 0 or self.updates_limit == 1:
+            update_id = self.first_update_id()
+            if update_id != None:
+                print(f"[telegram] Update {update_id} too large for the receive buffer, skipped")
+                self.offset = update_id + 1
+                self.skipped_updates += 1
+            else:
+                print("[telegram] Reply too large for the receive buffer")
+        else:
+            print("[telegram] Reply too large for the receive buffer, fetching one update at a time")
+            self.single_updates = self.updates_limit
+        self.rbuf_used = 0
+        self.parser.reset()
+        self.reconnect = True
+
+    # Return the update_id of the first update of the (possibly
+    # truncated) reply in the receive buffer, or None if not found.
+    def first_update_id(self):
+        i = self.rbuf.find(b'"update_id":', 0, self.rbuf_used)
+        if i == -1:
+            return None
+        i += 12
+        while i < self.rbuf_used and self.rbuf[i] == 32: i += 1
+        end = i
+        while end < self.rbuf_used and 48 <= self.rbuf[end] <= 57: end += 1
+        if end == i or end == self.rbuf_used:
+            return None
+        return int(bytes(self.rbuf[i:end]))
+
+    # Double the size of the receive buffer (up to rbuf_max_size),
+    # keeping the data already received.
+    def grow_rbuf(self):
+        size = min(len(self.rbuf)*2, self.rbuf_max_size)
+        rbuf = bytearray(size)
+        rbuf[:self.rbuf_used] = self.rbuf_mv[:self.rbuf_used]
+        self.rbuf = rbuf
+        self.rbuf_mv = memoryview(rbuf)
+        if self.debug: print(f"[telegram] Receive buffer grown to {size} bytes")
+
+    # Check if the reply in the buffer is complete: the parser only
+    # looks at the bytes received since the previous call. Once it is,
+    # the body is decoded (just once), the current request is marked as
+    # no longer "pending" and the buffer is reset. If the JSON reply
+    # contains incoming messages, the user callback is invoked.
     def process_api_response(self):
-        if self.rbuf_used > 0:
-            if self.debug: print(f"[telegram] Processing response buffer ({self.rbuf_used} bytes)")
-            # Discard the HTTP request header by looking for the
-            # start of the json message.
-            start_idx = self.rbuf.find(b"{")
-            if start_idx != -1:
-                # It is possible that we read a non complete reply
-                # from the socket. In such case the JSON message
-                # will be broken and will produce a ValueError.
-                try:
-                    mybuf = self.decode_surrogate_pairs(self.rbuf[start_idx:self.rbuf_used])
-                    res = json.loads(mybuf)
-                    if res != False:
-                        if self.debug: print(f"[telegram] Valid JSON response: {res}")
-                except ValueError:
-                    res = False
-                if res != False:
-                    self.pending = False
-                    if 'result' not in res:
-                        # Probably an error response from a sendPhoto or sendMessage request
-                        if self.debug: print(f"[telegram] Error response: {res}")
-                    elif len(res['result']) == 0:
-                        # Empty result set. Try again.
-                        if self.debug: print("No more messages.")
-                    elif not isinstance(res['result'], list):
-                        # This is the reply to SendMessage or other
-                        # non getUpdates related API calls? Discard it.
-                        if self.debug: print("Got reply from sendMessage/sendPhoto")
-                    else:
-                        # Update the last message ID we get so we
-                        # will get only next ones.
-                        offset = res['result'][0]['update_id']
-                        offset += 1
-                        self.offset = offset
-                        if self.debug: print("New offset:", offset)
-
-                        # Process the received message.
-                        entry = res['result'][0]
-                        if "message" in entry:
-                            msg = entry['message']
-                        elif "channel_post" in entry:
-                            msg = entry['channel_post']
-
-                        # Fill the fields depending on the message
-                        msg_type = None
-                        chat_name = None
-                        sender_name = None
-                        chat_id = None
-                        text = None
-
-                        try: msg_type = msg['chat']['type']
-                        except: pass
-                        try: chat_name = msg['chat']['title']
-                        except: pass
-                        try: sender_name = msg['from']['username']
-                        except: pass
-                        try: chat_id = msg['chat']['id']
-                        except: pass
-                        try: text = msg['text']
-                        except: pass
-
-                        # We don't care about join messages and other stuff.
-                        # We report just messages with some text content.
-                        if text != None:
-                            self.callback(self, msg_type, chat_name, sender_name, chat_id, text, entry)
-                            if self.debug: print(f"[telegram] Calling callback with text: {text}")
-                    self.rbuf_used = 0
+        if self.rbuf_used == 0:
+            return
+        try:
+            if not self.parser.feed(self.rbuf, self.rbuf_used):
+                return
+        except (ValueError, IndexError) as e:
+            print(f"[telegram] Malformed reply: {e}")
+            self.reconnect = True
+            return
+        if self.debug: print(f"[telegram] Processing response buffer ({self.rbuf_used} bytes)")
+
+        body = self.parser.body(self.rbuf, self.rbuf_used)
+        if not self.parser.keep_alive:
+            self.reconnect = True
+        self.parser.reset()
+        self.rbuf_used = 0
+        self.pending = False
+
+        try:
+            res = json.loads(self.decode_surrogate_pairs(body))
+            if self.debug: print(f"[telegram] Valid JSON response: {res}")
+        except Exception as e:
+            # Not only ValueError: a bad escape must not stop the bot loop.
+            print(f"[telegram] Invalid JSON reply: {e}")
+            return
+
+        inflight = self.inflight
+        self.inflight = None
+        if 'result' not in res:
+            # Probably an error response from a sendPhoto or sendMessage request
+            if self.debug: print(f"[telegram] Error response: {res}")
+            if inflight and res.get('error_code') == 429:
+                self.messages_sent -= 1
+                self.outgoing.requeue(inflight, self.parse_retry_after(body))
+        elif not isinstance(res['result'], list):
+            # This is the reply to SendMessage or other
+            # non getUpdates related API calls? Discard it.
+            if self.debug: print("Got reply from sendMessage/sendPhoto")
+        elif len(res['result']) == 0:
+            # Empty result set. Try again.
+            if self.debug: print("No more messages.")
+        else:
+            # Process all the updates of the reply.
+            for entry in res['result']:
+                self.process_update(entry)
+                if self.single_updates > 0: self.single_updates -= 1
+
+    # Handle one update returned by getUpdates, invoking the user
+    # callback for text messages.
+    def process_update(self, entry):
+        # Update the last message ID we get so we
+        # will get only next ones.
+        offset = entry['update_id']
+        offset += 1
+        self.offset = offset
+        self.updates += 1
+        if self.debug: print("New offset:", offset)
+
+        # Process the received message.
+        if "message" in entry:
+            msg = entry['message']
+        elif "channel_post" in entry:
+            msg = entry['channel_post']
+        else:
+            return
+
+        # Fill the fields depending on the message
+        msg_type = None
+        chat_name = None
+        sender_name = None
+        chat_id = None
+        text = None
+
+        try: msg_type = msg['chat']['type']
+        except: pass
+        try: chat_name = msg['chat']['title']
+        except: pass
+        try: sender_name = msg['from']['username']
+        except: pass
+        try: chat_id = msg['chat']['id']
+        except: pass
+        try: text = msg['text']
+        except: pass
+
+        # We don't care about join messages and other stuff.
+        # We report just messages with some text content.
+        if text != None:
+            if self.debug: print(f"[telegram] Calling callback with text: {text}")
+            try:
+                self.callback(self, msg_type, chat_name, sender_name, chat_id, text, entry)
+            except Exception as e:
+                # A failing command must not stop the other updates.
+                print(f"[telegram] Callback error: {e}")
 
     # MicroPython seems to lack the urlencode module. We need very
     # little to kinda make it work.
@@ -240,308 +870,478 @@ class TelegramBot:
         return headers+params
 
     # MicroPython JSON library does not handle surrogate UTF-16 pairs
-    # generated by the Telegram API. We need to do it manually by scanning
-    # the input bytearray and converting the surrogates to UTF-8.
+    # generated by the Telegram API. We need to do it manually converting
+    # the surrogates to UTF-8. Instead of scanning every byte in Python,
+    # find() jumps from one \ud escape to the next and the text between
+    # pairs is copied in bulk into a reused output buffer. When there are
+    # no pairs at all (the common case) the input is returned as it is.
     def decode_surrogate_pairs(self, ba):
-        result = bytearray()
-        i = 0
-        while i < len(ba):
-            if ba[i:i+2] == b'\\u' and i + 12 <= len(ba):
-                if ba[i+2:i+4] in [b'd8', b'd9', b'da', b'db'] and ba[i+6:i+8] == b'\\u' and ba[i+8:i+10] in [b'dc', b'dd', b'de', b'df']:
-                    # We found a surrogate pairs. Convert.
-                    high = int(ba[i+2:i+6].decode(), 16)
-                    low = int(ba[i+8:i+12].decode(), 16)
-                    code_point = 0x10000 + (high - 0xD800) * 0x400 + (low - 0xDC00)
-                    result.extend(chr(code_point).encode('utf-8'))
-                    i += 12
-                else:
-                    result.append(ba[i])
-                    i += 1
-            else:
-                result.append(ba[i])
-                i += 1
-        return result
+        i = self.find_surrogate_pair(ba, 0)
+        if i == -1:
+            return ba
+
+        # The output is never longer than the input: each 12 bytes pair
+        # becomes 4 bytes of UTF-8.
+        if len(self.surrogate_buf) < len(ba):
+            self.surrogate_buf = bytearray(len(ba))
+            self.surrogate_mv = memoryview(self.surrogate_buf)
+        out = self.surrogate_mv
+        src = memoryview(ba)
+        o = 0       # Bytes written to the output.
+        start = 0   # Start of the input not copied yet.
+        while i != -1:
+            out[o:o+i-start] = src[start:i]
+            o += i-start
+
+            # We found a surrogate pair. Convert.
+            high = int(bytes(ba[i+2:i+6]).decode(), 16)
+            low = int(bytes(ba[i+8:i+12]).decode(), 16)
+            code_point = 0x10000 + (high - 0xD800) * 0x400 + (low - 0xDC00)
+            utf8 = chr(code_point).encode('utf-8')
+            out[o:o+len(utf8)] = utf8
+            o += len(utf8)
+
+            start = i + 12
+            i = self.find_surrogate_pair(ba, start)
+
+        out[o:o+len(ba)-start] = src[start:]
+        o += len(ba)-start
+        return self.surrogate_buf[:o]
+
+    # Return the offset of the next \ud8xx-\udbxx\udcxx-\udfxx escape
+    # sequence in 'ba' starting from 'start', or -1 if there is none.
+    def find_surrogate_pair(self, ba, start):
+        while True:
+            i = ba.find(b'\\ud', start)
+            if i == -1 or i + 12 > len(ba):
+                return -1
+            # High surrogate: \ud8 to \udb, then the low one: \udc to \udf.
+            # The bytes are compared as integers: MicroPython can't look
+            # for an int in a bytes object.
+            high = ba[i+3] # '8', '9', 'a' or 'b'
+            low = ba[i+9]  # 'c' to 'f'
+            if (0x38 <= high <= 0x39 or 0x61 <= high <= 0x62) and ba[i+6] == 92 and ba[i+7] == 117 and ba[i+8] == 100 and 0x63 <= low <= 0x66:
+                return i
+            start = i + 3
 
     # Send a message via Telegram, to the specified chat_id and containing
     # the specified text. This function will just queue the item. The
     # actual sending will be performed in the main boot loop.
     #
-    # If 'glue' is True, the new text will be glued to the old pending
-    # message up to 2k, in order to reduce the API back-and-forth.
-    def send_message(self, chat_id, text, glue=False):
-        if glue and len(self.outgoing) > 0 and \
-           len(self.outgoing[0]["text"])+len(text)+1 < 2048:
-            self.outgoing[0]["text"] += "\n"
-            self.outgoing[0]["text"] += text
-            return
-        self.outgoing.append({"chat_id": chat_id, "text": text})
-
-    # Fully simplified implementation to send a photo
-    def send_photo(self, chat_id, photo_path, caption=None):
-        try:
-            # Check if file exists and get its size
-            try:
-                stats = os.stat(photo_path)
-                file_size = stats[6]  # Size in bytes
-
-                if file_size > self.max_image_size:
-                    # File is too large
-                    self.send_message(chat_id, f"📷 Photo taken! Size {file_size/1024:.1f}KB (too large for direct sending)")
-                    return False
-            except OSError:
-                self.send_message(chat_id, f"⚠️ Error: unable to find the file '{photo_path}'")
-                return False
-
-            # Force garbage collection before starting
-            gc.collect()
-
-            print(f"[telegram] Sending photo {photo_path} ({file_size} bytes) to {chat_id}")
-
-            # Read the photo into memory
-            try:
-                with open(photo_path, 'rb') as f:
-                    photo_data = f.read()
-            except Exception as e:
-                print(f"[telegram] Error reading photo file: {e}")
-                self.send_message(chat_id, f"⚠️ File read error: {e}")
-                return False
-
-            # Send the photo using a normal POST request with URL param "chat_id"
-            # and the "document" field containing the file
-            try:
-                # Create a new dedicated connection
-                addr = socket.getaddrinfo("api.telegram.org", 443, socket.AF_INET)
-                addr = addr[0][-1]
-                sock = socket.socket(socket.AF_INET)
-                sock.connect(addr)
-                sock.setblocking(True)  # Blocking mode
-                ssl_sock = ssl.wrap_socket(sock)
-
-                # Simple static boundary
-                boundary = "----WebKitFormBoundaryNiclaVision"
-
-                # Form content
-                form_data = bytearray()
-
-                # chat_id field
+    # Messages with a more urgent 'priority' are sent first. The new text
+    # is glued to the message still pending for the same chat and
+    # priority, if any, up to 2k, in order to reduce the API
+    # back-and-forth. Returns False if the queue was full and the message
+    # was dropped.
+    def send_message(self, chat_id, text, priority=PRIORITY_REPLY):
+        return self.outgoing.push(chat_id, text, priority)
+
+    # Build the parts of a multipart/form-data POST request with a file
+    # in the 'document' field. Returns (header, form_data, end_boundary):
+    # the file content goes between form_data and end_boundary.
+    def build_multipart(self, cmd, fields, filename, content_type, file_size):
+        header, form_data, part_heads, end_boundary = self.build_multipart_files(cmd, fields, [("document", filename, content_type, file_size)])
+        form_data.extend(part_heads[0])
+        return header, form_data, end_boundary
+
+    # Build a multipart/form-data POST request with the text 'fields' and
+    # any number of files, each described by a (name, filename,
+    # content_type, file_size) tuple. Returns (header, form_data,
+    # part_heads, end_boundary): the request is the header, the form
+    # data, then for every file its part head followed by its content,
+    # and finally end_boundary.
+    def build_multipart_files(self, cmd, fields, files):
+        # Simple static boundary
+        boundary = "----WebKitFormBoundaryNiclaVision"
+
+        # Form content
+        form_data = bytearray()
+        for name, value in fields.items():
+            if value:
                 form_data.extend(f"--{boundary}\r\n".encode())
-                form_data.extend(f'Content-Disposition: form-data; name="chat_id"\r\n\r\n{chat_id}\r\n'.encode())
-
-                # caption field if present
-                if caption:
-                    form_data.extend(f"--{boundary}\r\n".encode())
-                    form_data.extend(f'Content-Disposition: form-data; name="caption"\r\n\r\n{caption}\r\n'.encode())
-
-                # "document" field with the file
-                form_data.extend(f"--{boundary}\r\n".encode())
-                form_data.extend(f'Content-Disposition: form-data; name="document"; filename="photo.jpg"\r\n'.encode())
-                form_data.extend(f'Content-Type: image/jpeg\r\n\r\n'.encode())
-
-                # Add the file content
-                end_boundary = f"\r\n--{boundary}--\r\n".encode()
-
-                # Calculate the total length
-                total_length = len(form_data) + len(photo_data) + len(end_boundary)
-
-                # Create the HTTP header
-                header = f"POST /bot{self.token}/sendDocument HTTP/1.1\r\n"
-                header += "Host: api.telegram.org\r\n"
-                header += f"Content-Type: multipart/form-data; boundary={boundary}\r\n"
-                header += f"Content-Length: {total_length}\r\n"
-                header += "Connection: close\r\n\r\n"
-
-                # Send the header
-                ssl_sock.write(header.encode())
+                form_data.extend(f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+
+        # One part per file. The CRLF ending the content of a file is at
+        # the start of the head of the next part.
+        part_heads = []
+        total_length = len(form_data)
+        for name, filename, content_type, file_size in files:
+            head = f"\r\n--{boundary}\r\n" if len(part_heads) > 0 else f"--{boundary}\r\n"
+            head += f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            head += f'Content-Type: {content_type}\r\n\r\n'
+            part_heads.append(head.encode())
+            total_length += len(part_heads[-1]) + file_size
+
+        # End of the form (to be added after the file content)
+        end_boundary = f"\r\n--{boundary}--\r\n".encode()
+        total_length += len(end_boundary)
+
+        # Create the HTTP header
+        header = f"POST /bot{self.token}/{cmd} HTTP/1.1\r\n"
+        header += "Host: api.telegram.org\r\n"
+        header += f"Content-Type: multipart/form-data; boundary={boundary}\r\n"
+        header += f"Content-Length: {total_length}\r\n"
+        header += "Connection: keep-alive\r\n\r\n"
+        return header.encode(), form_data, part_heads, end_boundary
+
+    # Send a multipart/form-data POST to the API method 'cmd' using a
+    # pooled keep-alive connection. 'fields' are the text fields, the
+    # file is sent as the 'document' field taking it from 'data' if
+    # given, otherwise streaming 'path' from flash. The request is
+    # streamed with non blocking writes: when the socket can't accept
+    # more data, and after every chunk of the file, the other tasks get
+    # to run, so detection and the bot loop keep working during a long
+    # upload.
+    # progress(sent, total) is called after every chunk of the file, and
+    # 'chunk_size' is the size of the first chunk (see write_file_async()).
+    async def post_file_async(self, cmd, fields, filename, content_type, file_size, data=None, path=None, chunk_size=1024, progress=None):
+        header, form_data, end_boundary = self.build_multipart(cmd, fields, filename, content_type, file_size)
+
+        async def write_request(sock):
+            await self.write_async(sock, header)
+            await self.write_async(sock, form_data)
+            if data is not None:
+                mv = memoryview(data)
+                for start in range(0, file_size, chunk_size):
+                    await self.write_async(sock, mv[start:start+chunk_size])
+                    if progress: progress(min(start+chunk_size, file_size), file_size)
+                    await asyncio.sleep_ms(0)
+            else:
+                await self.write_file_async(sock, path, file_size, chunk_size, progress)
+            await self.write_async(sock, end_boundary)
 
-                # Send the first part of the form
-                ssl_sock.write(form_data)
+        return await self.pool_exchange_async(write_request)
 
-                # Send the file content
-                ssl_sock.write(photo_data)
+    # Send a POST with url-encoded 'fields' to the API method 'cmd' using
+    # a pooled keep-alive connection. With 'messages' True the request
+    # doesn't wait for the upload in progress (see pool_exchange_async()).
+    # Returns (status, body) of the reply.
+    async def post_form_async(self, cmd, fields, messages=False):
+        request = self.build_post_request(cmd, fields).encode()
 
-                # Send the final part
-                ssl_sock.write(end_boundary)
+        async def write_request(sock):
+            await self.write_async(sock, request)
 
-                # Read the response
-                response = bytearray(1024)
-                bytes_read = ssl_sock.readinto(response)
-                response_text = response[:bytes_read].decode('utf-8', 'ignore')
+        return await self.pool_exchange_async(write_request, messages)
 
-                # Close the socket
-                ssl_sock.close()
-                sock.close()
+    # Perform one request/reply exchange on a pooled connection:
+    # 'write_request' is a coroutine called with the socket to write the
+    # request. Uploads are serialized by upload_lock, while with
+    # 'messages' True the exchange is serialized with the other text
+    # messages only, by message_lock: while an upload holds its
+    # connection, the message gets another one from the pool.
+    #
+    # If a reused connection turns out to be closed by the server, the
+    # request is transparently retried once on a new connection.
+    #
+    # Returns (status, body) of the reply, or raises the network error.
+    async def pool_exchange_async(self, write_request, messages=False):
+        lock = self.message_lock if messages else self.upload_lock
+        async with lock:
+            while True:
+                # Without WiFi a new connection can only fail, after
+                # blocking in the DNS lookup: don't even try.
+                if not self.wifi_connected():
+                    raise OSError("WiFi not connected")
+                conn, reused = await self.upload_pool.acquire(self.upload_timeout_ms, self.upload_poll_ms)
+                try:
+                    await write_request(conn.ssl)
+                    status, body, keep_alive = await self.read_http_response_async(conn.ssl, messages)
+                except Exception as e:
+                    self.upload_pool.discard(conn)
+                    if reused:
+                        # Probably closed by the server while idle.
+                        if self.debug: print(f"[telegram] Pooled connection lost ({e}), reconnecting")
+                        continue
+                    raise
+                self.upload_pool.release(conn, keep_alive)
+                return status, body
+
+    # Return True if the WiFi station is connected.
+    def wifi_connected(self):
+        return self.wlan.isconnected()
+
+    # Write all of 'data' to a non blocking socket, yielding while the
+    # socket is busy. Raises OSError if no progress is made for
+    # upload_timeout_ms.
+    async def write_async(self, sock, data):
+        mv = memoryview(data)
+        last_progress = time.ticks_ms()
+        while len(mv) > 0:
+            try:
+                n = sock.write(mv)
+            except OSError as e:
+                if e.args[0] != 11: raise # EAGAIN: retry later.
+                n = None
+            if n:
+                mv = mv[n:]
+                last_progress = time.ticks_ms()
+            else:
+                if time.ticks_diff(time.ticks_ms(), last_progress) > self.upload_timeout_ms:
+                    raise OSError("upload timed out")
+                await asyncio.sleep_ms(self.upload_poll_ms)
+
+    # Stream a file to a non blocking socket, yielding after every chunk.
+    # The file is read with readinto() in the preallocated upload buffer.
+    # The chunk size adapts to the link: it doubles (up to the buffer
+    # size) while chunks are written faster than upload_chunk_target_ms,
+    # and halves (down to 'chunk_size') when a chunk takes longer, so the
+    # other tasks still run often on a slow link.
+    async def write_file_async(self, sock, path, file_size, chunk_size, progress=None):
+        min_chunk = min(chunk_size, len(self.upload_buf))
+        chunk = min_chunk
+        sent_bytes = 0
+        with open(path, 'rb') as f:
+            while True:
+                nbytes = f.readinto(self.upload_buf_mv[:chunk])
+                if not nbytes:
+                    break
+                start = time.ticks_ms()
+                await self.write_async(sock, self.upload_buf_mv[:nbytes])
+                elapsed = time.ticks_diff(time.ticks_ms(), start)
+                sent_bytes += nbytes
+                if progress: progress(sent_bytes, file_size)
+
+                if elapsed * 2 < self.upload_chunk_target_ms:
+                    chunk = min(chunk * 2, len(self.upload_buf))
+                elif elapsed > self.upload_chunk_target_ms:
+                    chunk = max(chunk // 2, min_chunk)
+                await asyncio.sleep_ms(0)
+
+    # Read a whole HTTP reply from a non blocking socket, so that the
+    # connection is ready for the next request, yielding to the other
+    # tasks while waiting. Returns the status code, the body and whether
+    # the server allows to keep the connection open. 'messages' selects
+    # the parser and buffer of the text messages instead of the uploads.
+    async def read_http_response_async(self, sock, messages=False):
+        response = bytearray()
+        parser = self.message_parser if messages else self.upload_parser
+        rbuf_mv = self.message_rbuf_mv if messages else self.upload_rbuf_mv
+        parser.reset()
+        last_progress = time.ticks_ms()
+        while True:
+            nbytes = sock.readinto(rbuf_mv)
+            if nbytes == None:
+                if time.ticks_diff(time.ticks_ms(), last_progress) > self.upload_timeout_ms:
+                    raise OSError("reply timed out")
+                await asyncio.sleep_ms(self.upload_poll_ms)
+                continue
+            if nbytes == 0:
+                # A reply without length ends with the connection.
+                if parser.finish_at_close():
+                    break
+                raise OSError("connection closed by the server")
+            response.extend(rbuf_mv[:nbytes])
+            last_progress = time.ticks_ms()
+            if parser.feed(response, len(response)):
+                break
+        return parser.status, bytes(parser.body(response, len(response))), parser.keep_alive
+
+    # Extract the file_id of the file attached to the message returned
+    # by a successful upload. Returns None if not found.
+    def parse_file_id(self, body):
+        try:
+            message = json.loads(self.decode_surrogate_pairs(body))['result']
+        except Exception:
+            return None
+        return self.message_file_id(message)
+
+    # Return the file_id of the file attached to 'message', or None.
+    def message_file_id(self, message):
+        if not isinstance(message, dict):
+            return None
+        for kind in ("document", "video", "animation"):
+            if kind in message:
+                return message[kind].get('file_id')
+        if "photo" in message and len(message['photo']) > 0:
+            # Several sizes: the last one is the largest.
+            return message['photo'][-1].get('file_id')
+        return None
+
+    # Largest file of the given kind ("photo" or "video") sent by
+    # send_file_async() and send_media_group_async().
+    def max_file_size(self, kind):
+        return self.max_image_size if kind == "photo" else 5000000
+
+    # Send a photo or a video to a chat, 'kind' being "photo" or
+    # "video". The file is sent by file_id if it was already
+    # uploaded, otherwise it is streamed by post_file_async() calling
+    # progress(sent, total) after every chunk.
+    #
+    # Unless 'quiet' is True, failures are reported to the chat.
+    #
+    # Returns True if the file was sent, False otherwise.
+    async def send_file_async(self, chat_id, path, caption=None, kind="photo", progress=None, chunk_size=1024, quiet=False):
+        max_size = self.max_file_size(kind)
+        if kind == "photo":
+            filename, content_type = "photo.jpg", "image/jpeg"
+        else:
+            filename, content_type = "video.mjpeg", "video/mjpeg"
 
-                # Check if the response is positive
-                if "HTTP/1.1 200" in response_text:
-                    print("[telegram] Photo sent successfully!")
-                    return True
-                else:
-                    # Look for more error information in the response
-                    error_info = response_text.split("\r\n\r\n")[-1] if "\r\n\r\n" in response_text else response_text
-                    print(f"[telegram] Error response: {error_info[:200]}")
-                    self.send_message(chat_id, f"⚠️ Error 1 sending photo. Please try again.\nIf the problem persists, please report to @destone28, sending screenshot of the last messages with this bot.")
-                    return False
+        try:
+            stats = os.stat(path)
+            file_size = stats[6]  # Size in bytes
+        except OSError:
+            if not quiet:
+                self.send_message(chat_id, f"⚠️ Error: unable to find the file '{path}'", PRIORITY_LOW)
+            return False
+        if file_size > max_size:
+            # File is too large
+            if not quiet:
+                self.send_message(chat_id, f"{'📷 Photo taken' if kind == 'photo' else '🎥 Video recorded'}! Size {file_size/1024:.1f}KB (too large for direct sending)", PRIORITY_LOW)
+            return False
 
+        # Already uploaded: send it by reference.
+        file_id = self.file_ids.get(path, file_size, stats[8])
+        if file_id:
+            fields = {"chat_id": chat_id, "document": file_id}
+            if caption:
+                fields["caption"] = caption
+            try:
+                status, body = await self.post_form_async("sendDocument", fields)
             except Exception as e:
-                print(f"[telegram] Error in send_photo transaction: {e}")
-                self.send_message(chat_id, f"⚠️ Error 2 sending photo. Please try again.\nIf the problem persists, please report to @destone28, sending screenshot of the last messages with this bot.")
-                return False
-
+                print(f"[telegram] Error sending {path} by file_id: {e}")
+                status = None
+            if status == 200:
+                print(f"[telegram] {path} sent by file_id")
+                return True
+            self.file_ids.forget(path)
+
+        print(f"[telegram] Sending {kind} {path} ({file_size} bytes) to {chat_id}")
+        try:
+            status, body = await self.post_file_async("sendDocument", {"chat_id": chat_id, "caption": caption},
+                                                      filename, content_type, file_size, path=path,
+                                                      chunk_size=chunk_size, progress=progress)
         except Exception as e:
-            print(f"[telegram] Error in send_photo: {e}")
-            self.send_message(chat_id, f"⚠️ Error 3 sending photo. Please try again.\nIf the problem persists, please report to @destone28, sending screenshot of the last messages with this bot.")
+            print(f"[telegram] Error in {kind} upload: {e}")
+            if not quiet:
+                self.send_message(chat_id, f"⚠️ Error sending the {kind}. Please try again later.", PRIORITY_LOW)
             return False
 
-    def send_video(self, chat_id, video_path, caption=None):
-        """
-        Send a video via Telegram using a chunked approach to save memory
-
-        Args:
-            chat_id: Chat ID
-            video_path: Video file path
-            caption: Optional description
+        if status != 200:
+            # Look for more error information in the response
+            print(f"[telegram] Error response: {body[:200]}")
+            if not quiet:
+                self.send_message(chat_id, f"⚠️ Error sending the {kind}. Please try again later.", PRIORITY_LOW)
+            return False
 
-        Returns:
-            bool: True if the video was sent, False otherwise
-        """
-        try:
-            # Check if the file exists and get its size
+        file_id = self.parse_file_id(body)
+        if file_id:
+            self.file_ids.put(path, file_size, stats[8], file_id)
+        print(f"[telegram] {path} sent successfully!")
+        return True
+
+    # Send several files to a chat as one album, with a single
+    # sendMediaGroup request instead of one upload per file. 'files' is a
+    # list of (path, kind) tuples, kind being "photo" or "video", and the
+    # caption goes with the first file. Files already uploaded are
+    # referenced by file_id, the others are streamed in the same request
+    # as attach://fileN parts. The files are sent as documents, since an
+    # MJPEG clip is not a video for Telegram, and albums can't mix
+    # documents with photos.
+    #
+    # Telegram wants at least two files in an album: with just one,
+    # send_file_async() is used instead. progress(sent, total) reports the
+    # bytes uploaded for the whole album.
+    #
+    # Unless 'quiet' is True, failures are reported to the chat.
+    #
+    # Returns True if the files were sent, False otherwise.
+    async def send_media_group_async(self, chat_id, files, caption=None, progress=None, chunk_size=1024, quiet=False):
+        items = [] # (path, kind, file_size, mtime)
+        for path, kind in files:
+            max_size = self.max_file_size(kind)
             try:
-                stats = os.stat(video_path)
-                file_size = stats[6]  # Size in bytes
-
-                # Use a hardcoded value
-                max_video_size = 5000000  # Reduce to 5MB to avoid memory issues
-
-                if file_size > max_video_size:
-                    # File is too large
-                    self.send_message(chat_id, f"🎥 Video recorded! Size {file_size/1024/1024:.1f}MB (too large for direct sending)")
-                    return False
+                stats = os.stat(path)
             except OSError:
-                self.send_message(chat_id, f"⚠️ Error: unable to find the file '{video_path}'")
-                return False
-
-            # Force garbage collection before starting
-            gc.collect()
-
-            print(f"[telegram] Sending video {video_path} ({file_size} bytes) to {chat_id}")
-
-            # Send the video using a normal POST request with URL param "chat_id"
-            # and the "document" field containing the file
-            try:
-                # Create a new dedicated connection
-                addr = socket.getaddrinfo("api.telegram.org", 443, socket.AF_INET)
-                addr = addr[0][-1]
-                sock = socket.socket(socket.AF_INET)
-                sock.connect(addr)
-                sock.setblocking(True)  # Blocking mode
-                ssl_sock = ssl.wrap_socket(sock)
-
-                # Simple static boundary
-                boundary = "----WebKitFormBoundaryNiclaVision"
-
-                # Form content
-                form_data = bytearray()
-
-                # chat_id field
-                form_data.extend(f"--{boundary}\r\n".encode())
-                form_data.extend(f'Content-Disposition: form-data; name="chat_id"\r\n\r\n{chat_id}\r\n'.encode())
-
-                # caption field if present
-                if caption:
-                    form_data.extend(f"--{boundary}\r\n".encode())
-                    form_data.extend(f'Content-Disposition: form-data; name="caption"\r\n\r\n{caption}\r\n'.encode())
-
-                # "document" field with the file
-                form_data.extend(f"--{boundary}\r\n".encode())
-                form_data.extend(f'Content-Disposition: form-data; name="document"; filename="video.mjpeg"\r\n'.encode())
-                form_data.extend(f'Content-Type: video/mjpeg\r\n\r\n'.encode())
-
-                # End of the form (to be added after the file content)
-                end_boundary = f"\r\n--{boundary}--\r\n".encode()
-
-                # Calculate the total length
-                total_length = len(form_data) + file_size + len(end_boundary)
-
-                # Create the HTTP header
-                header = f"POST /bot{self.token}/sendDocument HTTP/1.1\r\n"
-                header += "Host: api.telegram.org\r\n"
-                header += f"Content-Type: multipart/form-data; boundary={boundary}\r\n"
-                header += f"Content-Length: {total_length}\r\n"
-                header += "Connection: close\r\n\r\n"
-
-                # Send the header
-                ssl_sock.write(header.encode())
-
-                # Send the first part of the form
-                ssl_sock.write(form_data)
-
-                # Read and send the file in SMALLER chunks to save memory
-                chunk_size = 1024  # Reduced from 4096 to 1024 bytes
-                sent_bytes = 0
-
-                try:
-                    with open(video_path, 'rb') as f:
-                        while True:
-                            chunk = f.read(chunk_size)
-                            if not chunk:
-                                break
-                            ssl_sock.write(chunk)
-                            sent_bytes += len(chunk)
-                            # Feedback on stdout every 20KB
-                            if sent_bytes % 20480 == 0:
-                                print(f"[telegram] Sent {sent_bytes/1024:.1f}KB/{file_size/1024:.1f}KB")
-                                
-                            # Force garbage collection after each chunk
-                            del chunk
-                            gc.collect()
-                            
-                            # Short pause to allow memory cleanup
-                            time.sleep(0.01)
-                except Exception as e:
-                    print(f"[telegram] Error during video data sending: {e}")
-                    ssl_sock.close()
-                    sock.close()
-                    self.send_message(chat_id, f"⚠️ Error during video sending: {e}")
-                    return False
-
-                # Send the final part
-                ssl_sock.write(end_boundary)
-
-                # Read the response
-                response = bytearray(512)  # Reduced from 1024 to 512 bytes
-                bytes_read = ssl_sock.readinto(response)
-                response_text = response[:bytes_read].decode('utf-8', 'ignore')
-
-                # Clean up immediately
-                del response
-                gc.collect()
-
-                # Close the socket
-                ssl_sock.close()
-                sock.close()
-
-                # Check if the response is positive
-                if "HTTP/1.1 200" in response_text:
-                    print("[telegram] Video sent successfully!")
-                    return True
+                if not quiet:
+                    self.send_message(chat_id, f"⚠️ Error: unable to find the file '{path}'", PRIORITY_LOW)
+                continue
+            if stats[6] > max_size:
+                if not quiet:
+                    self.send_message(chat_id, f"{'📷 Photo taken' if kind == 'photo' else '🎥 Video recorded'}! Size {stats[6]/1024:.1f}KB (too large for direct sending)", PRIORITY_LOW)
+                continue
+            items.append((path, kind, stats[6], stats[8]))
+
+        if len(items) == 0:
+            return False
+        if len(items) == 1:
+            return await self.send_file_async(chat_id, items[0][0], caption, items[0][1], progress, chunk_size, quiet)
+
+        # A file_id may be rejected if Telegram forgot it: in that case
+        # the file_ids are dropped and the whole album is uploaded.
+        for attempt in range(2):
+            media = []
+            uploads = [] # (path, name, filename, content_type, file_size)
+            for path, kind, file_size, mtime in items:
+                file_id = self.file_ids.get(path, file_size, mtime) if attempt == 0 else None
+                if file_id:
+                    media.append({"type": "document", "media": file_id})
                 else:
-                    # Look for more error information in the response
-                    error_info = response_text.split("\r\n\r\n")[-1] if "\r\n\r\n" in response_text else response_text
-                    print(f"[telegram] Error response: {error_info[:100]}")
-                    self.send_message(chat_id, f"⚠️ Error sending video. Please try again later.")
-                    return False
-
+                    name = "file"+str(len(uploads))
+                    filename, content_type = ("photo.jpg", "image/jpeg") if kind == "photo" else ("video.mjpeg", "video/mjpeg")
+                    uploads.append((path, name, filename, content_type, file_size))
+                    media.append({"type": "document", "media": "attach://"+name})
+            if caption:
+                media[0]["caption"] = caption
+
+            print(f"[telegram] Sending album of {len(items)} files ({len(uploads)} uploaded) to {chat_id}")
+            try:
+                status, body = await self.post_files_async("sendMediaGroup", {"chat_id": chat_id, "media": json.dumps(media)},
+                                                           uploads, chunk_size, progress)
             except Exception as e:
-                print(f"[telegram] Error in send_video transaction: {e}")
-                self.send_message(chat_id, f"⚠️ Sending video error: {e}")
-                return False
-
-        except Exception as e:
-            print(f"[telegram] Error in send_video: {e}")
-            self.send_message(chat_id, f"⚠️ Generic video sending error: {e}")
+                print(f"[telegram] Error in album upload: {e}")
+                status, body = None, b""
+            if status == 400 and len(uploads) < len(items):
+                for path, kind, file_size, mtime in items:
+                    self.file_ids.forget(path)
+                continue
+            break
+
+        if status != 200:
+            if status: print(f"[telegram] Error response: {body[:200]}")
+            if not quiet:
+                self.send_message(chat_id, "⚠️ Error sending the event files. Please try again later.", PRIORITY_LOW)
             return False
-        
+
+        # Remember the file_id of the uploaded files.
+        try:
+            messages = json.loads(self.decode_surrogate_pairs(body))['result']
+        except Exception:
+            messages = []
+        for i in range(min(len(items), len(messages))):
+            file_id = self.message_file_id(messages[i])
+            if file_id:
+                path, kind, file_size, mtime = items[i]
+                self.file_ids.put(path, file_size, mtime, file_id)
+        print(f"[telegram] Album of {len(items)} files sent successfully!")
+        return True
+
+    # Like post_file_async(), but with several files, each described by
+    # a (path, name, filename, content_type, file_size) tuple and streamed
+    # from flash.
+    async def post_files_async(self, cmd, fields, uploads, chunk_size=1024, progress=None):
+        header, form_data, part_heads, end_boundary = self.build_multipart_files(cmd, fields, [upload[1:] for upload in uploads])
+        total = 0
+        for upload in uploads:
+            total += upload[4]
+
+        async def write_request(sock):
+            await self.write_async(sock, header)
+            await self.write_async(sock, form_data)
+            done = 0
+            for i in range(len(uploads)):
+                path, file_size = uploads[i][0], uploads[i][4]
+                await self.write_async(sock, part_heads[i])
+                file_progress = None
+                if progress:
+                    file_progress = lambda sent, size: progress(done+sent, total)
+                await self.write_file_async(sock, path, file_size, chunk_size, file_progress)
+                done += file_size
+            await self.write_async(sock, end_boundary)
+
+        return await self.pool_exchange_async(write_request)
+
     # This is just a utility method that can be used in order to wait
     # for the WiFi network to be connected.
     def connect_wifi(self, ssid, password, timeout=30):
@@ -8,14 +8,22 @@ import uasyncio as asyncio
 import secrets_keys
 from config import Config
 import logger
+import tracer
 from camera_detector import CameraDetector
 from audio_detector import AudioDetector
 from distance_detector import DistanceDetector
 from file_manager import FileManager
+from sensor_mode import SensorModeManager
+from preroll_buffer import PrerollBuffer
+from motion_tracker import MotionTracker
+from adaptive_sampler import AdaptiveSampler
+from motion_heatmap import MotionHeatmap
 from photo_manager import PhotoManager
 from cloud_manager import CloudManager
 from video_manager import VideoManager
 from telegram_manager import TelegramManager
+from event_queue import EventQueue
+from event_pipeline import EventPipeline
 
 # LEDs for visual feedback
 red_led = pyb.LED(1)
@@ -29,8 +37,15 @@ distance_detector = None
 cloud_manager = None
 photo_manager = None
 file_manager = None
+sensor_mode = None
+preroll_buffer = None
+motion_tracker = None
+camera_sampler = None
+motion_heatmap = None
 telegram_manager = None
 video_manager = None
+event_queue = None
+event_pipeline = None
 loop = None
 
 # Control variables for the loop
@@ -42,15 +57,18 @@ last_check_state_time = 0
 last_cloud_sync_time = 0
 last_distance_recalibration = 0
 last_audio_recalibration = 0
-main_interval = 100  # Interval in milliseconds for the main loop execution
+last_trace_publish_time = 0
+last_trace_span_count = 0
+main_interval = 100  # Interval in milliseconds for the supervision loop execution
 
-# Asynchronous task that runs the main loop
+# Asynchronous task that runs the supervision loop (connections, synchronization,
+# detector lifecycle). Detection itself runs in the per-detector tasks below.
 async def main_loop():
     global camera_detector, audio_detector, distance_detector
-    global cloud_manager, last_motion_time, last_audio_time, last_distance_time
+    global cloud_manager
     global last_sync_time, last_check_state_time, last_cloud_sync_time
     global last_distance_recalibration, last_audio_recalibration
-    global video_manager, telegram_manager
+    global last_trace_publish_time, last_trace_span_count
 
     print("Starting the main loop...")
 
@@ -62,6 +80,10 @@ async def main_loop():
             if cloud_manager and cloud_manager.is_connected:
                 cloud_manager.check_connection()
 
+            # Motion heatmap of the last period
+            if motion_heatmap and motion_heatmap.due():
+                motion_heatmap.save_period()
+
             # Filesystem synchronization
             if current_time - last_sync_time > Config.FILESYSTEM_SYNC_INTERVAL:
                 file_manager.sync_filesystem()
@@ -72,6 +94,13 @@ async def main_loop():
                 cloud_manager.sync_from_cloud()
                 last_cloud_sync_time = current_time
 
+            # Latency summary on the cloud, only when new spans were traced
+            if cloud_manager and cloud_manager.is_connected and (current_time - last_trace_publish_time > Config.TRACE_CLOUD_INTERVAL):
+                last_trace_publish_time = current_time
+                if tracer.span_count() != last_trace_span_count:
+                    last_trace_span_count = tracer.span_count()
+                    cloud_manager.update_latency_summary(tracer.format_compact())
+
             # Detector initialization management
             if current_time - last_check_state_time > Config.DETECTOR_CHECK_INTERVAL:
                 last_check_state_time = current_time
@@ -80,12 +109,16 @@ async def main_loop():
                 if Config.GLOBAL_ENABLE:
                     # Camera detector
                     if Config.CAMERA_MONITORING_ENABLED:
-                        if not camera_detector:
+                        # Not while an event capture owns the sensor
+                        if not camera_detector and not sensor_mode.busy():
                             photo_manager.init_camera_for_motion()
-                            camera_detector = CameraDetector(Config)
+                            camera_detector = CameraDetector(Config, sensor_mode, preroll_buffer, motion_tracker, motion_heatmap)
+                            if camera_sampler:
+                                camera_sampler.wake()
                             logger.info("Camera detector initialized (on-demand)")
                     else:
                         if camera_detector:
+                            camera_detector.deinit()
                             camera_detector = None
                             logger.info("Camera detector deactivated")
 
@@ -133,6 +166,7 @@ async def main_loop():
                 else:
                     # Deactivation of all detectors if GLOBAL_ENABLE is disabled
                     if camera_detector:
+                        camera_detector.deinit()
                         camera_detector = None
                         logger.info("Camera detector deactivated (global disable)")
 
@@ -146,145 +180,129 @@ async def main_loop():
                         distance_detector = None
                         logger.info("Distance detector deactivated (global disable)")
 
-            # EVENT DETECTION SECTION
-            # For camera motion detection
-            if Config.CAMERA_MONITORING_ENABLED and camera_detector:
-                if current_time - last_motion_time > Config.INHIBIT_PERIOD:
-                    if camera_detector.check_motion():
-                        event_msg = "Camera detected, capturing photo..."
-                        logger.info(event_msg)
-                        green_led.on()
-                        time.sleep(0.1)
-                        green_led.off()
+            # System disabled
+            if not Config.GLOBAL_ENABLE:
+                if int(time.time() * 2) % 10 == 0:
+                    red_led.toggle()
 
-                        # Capture photo (standard for local storage)
-                        photo_path = None
-                        telegram_photo_path = None
+            # System activity indication
+            if int(time.time() * 10) % 30 == 0:
+                blue_led.toggle()
 
-                        # First save a normal photo for local storage
-                        if photo_manager.capture_save_photo("camera_alert"):
-                            photo_path = photo_manager.last_photo_path
-                            last_motion_time = current_time
+        except Exception as e:
+            logger.error(f"Error in main loop: {e}")
 
-                            # Now capture a photo optimized for Telegram if photo sending is enabled
-                            if Config.SEND_PHOTOS_TELEGRAM:
-                                if photo_manager.capture_telegram_photo("camera_alert", "tg"):
-                                    telegram_photo_path = photo_manager.last_photo_path
+        # Wait for the next iteration (asynchronously)
+        await asyncio.sleep_ms(main_interval)
 
-                            # Reset motion detection
-                            camera_detector.reset_detection()
+# Asynchronous task sampling the camera at its own rate
+async def camera_task():
+    global last_motion_time
 
-                            # Cloud notification
-                            if cloud_manager:
-                                cloud_manager.notify_event("Camera", "Camera trigger")
+    while True:
+        interval = camera_sampler.interval() if camera_sampler else Config.CAMERA_SAMPLE_INTERVAL
+        try:
+            # While an event capture (photo, video) owns the sensor the
+            # camera waits; the other detectors keep running
+            if Config.CAMERA_MONITORING_ENABLED and camera_detector and not sensor_mode.busy():
+                current_time = time.time()
+                if current_time - last_motion_time > Config.INHIBIT_PERIOD:
+                    detect_start = tracer.start()
+                    motion = camera_detector.check_motion()
+                    if camera_sampler:
+                        # Full rate after any activity, low rate in a quiet scene
+                        interval = camera_sampler.update(camera_detector.activity)
+                    if motion:
+                        # Start the inhibit period as soon as the event is queued
+                        last_motion_time = current_time
+                        if camera_sampler:
+                            camera_sampler.wake()
+                        event_id = tracer.new_event(detect_start)
+                        tracer.record(tracer.DETECT, detect_start, event_id)
+                        # The value is the bounding box of the motion (blocks/background modes only)
+                        event_queue.put_nowait(("camera", camera_detector.bbox, tracer.start(), event_id))
+                elif preroll_buffer:
+                    # Keep the pre-roll current while detection is inhibited
+                    camera_detector.feed_preroll()
+        except Exception as e:
+            logger.error(f"Error in camera task: {e}")
 
-                            # Video recording if enabled
-                            video_path = None
-                            if Config.RECORD_VIDEO_ENABLED:
-                                if video_manager.record_video("camera"):
-                                    video_path = video_manager.last_video_path
+        # The pre-roll needs its frame rate even in a quiet scene
+        if preroll_buffer:
+            interval = min(interval, preroll_buffer.frame_interval)
+        await asyncio.sleep_ms(interval)
 
-                            # Telegram notification
-                            if telegram_manager:
-                                telegram_manager.notify_motion_event(telegram_photo_path, video_path)
+# Asynchronous task sampling the audio detector at its own rate
+async def audio_task():
+    global last_audio_time
 
-            # For audio sound detection
+    while True:
+        try:
             if Config.AUDIO_MONITORING_ENABLED and audio_detector and audio_detector.audio_streaming_active:
+                current_time = time.time()
                 if current_time - last_audio_time > Config.INHIBIT_PERIOD:
-                    # Use the same pattern as camera and distance detection
+                    detect_start = tracer.start()
                     sound_detected, level = audio_detector.check_sound()
-                    
                     if sound_detected:
-                        event_msg = f"Sound detected: level={level:.1f}, capturing photo..."
-                        logger.info(event_msg)
-                        green_led.on()
-                        time.sleep(0.1)
-                        green_led.off()
-                        
-                        # Capture photo (standard for local storage)
-                        photo_path = None
-                        telegram_photo_path = None
-                        
-                        # First save a normal photo for local storage
-                        if photo_manager.capture_save_photo("audio_alert", "sound", int(level)):
-                            photo_path = photo_manager.last_photo_path
-                            last_audio_time = current_time
-                            
-                            # Now capture a photo optimized for Telegram if photo sending is enabled
-                            if Config.SEND_PHOTOS_TELEGRAM:
-                                if photo_manager.capture_telegram_photo("audio_alert", f"tg_sound", int(level)):
-                                    telegram_photo_path = photo_manager.last_photo_path
-                            
-                            # Cloud notification
-                            if cloud_manager:
-                                cloud_manager.notify_event("Audio", f"Level: {int(level)}")
-                            
-                            # Video recording if enabled
-                            video_path = None
-                            if Config.RECORD_VIDEO_ENABLED:
-                                if video_manager.record_video("audio", f"sound_{int(level)}"):
-                                    video_path = video_manager.last_video_path
-                            
-                            # Telegram notification
-                            if telegram_manager:
-                                telegram_manager.notify_audio_event(int(level), telegram_photo_path, video_path)
+                        last_audio_time = current_time
+                        event_id = tracer.new_event(detect_start)
+                        tracer.record(tracer.DETECT, detect_start, event_id)
+                        event_queue.put_nowait(("audio", level, tracer.start(), event_id))
+        except Exception as e:
+            logger.error(f"Error in audio task: {e}")
+
+        await asyncio.sleep_ms(Config.AUDIO_SAMPLE_INTERVAL)
 
-            # For distance variation detection
+# Asynchronous task sampling the distance sensor at its own rate
+async def distance_task():
+    global last_distance_time
+
+    while True:
+        try:
             if Config.DISTANCE_MONITORING_ENABLED and distance_detector and distance_detector.distance_enabled:
+                current_time = time.time()
                 if current_time - last_distance_time > Config.INHIBIT_PERIOD:
+                    detect_start = tracer.start()
                     if distance_detector.check_distance():
+                        last_distance_time = current_time
                         current_distance = distance_detector.read_distance()
-                        event_msg = f"Distance changed: {current_distance:.1f}mm, capturing photo..."
-                        logger.info(event_msg)
-                        green_led.on()
-                        time.sleep(0.1)
-                        green_led.off()
+                        event_id = tracer.new_event(detect_start)
+                        tracer.record(tracer.DETECT, detect_start, event_id)
+                        event_queue.put_nowait(("distance", current_distance, tracer.start(), event_id))
+        except Exception as e:
+            logger.error(f"Error in distance task: {e}")
 
-                        # Capture photo
-                        photo_path = None
-                        telegram_photo_path = None
-
-                        # First save a normal photo for local storage
-                        if photo_manager.capture_save_photo("distance_alert", "dist", int(current_distance)):
-                            photo_path = photo_manager.last_photo_path
-                            last_distance_time = current_time
-
-                            # Now capture a photo optimized for Telegram if photo sending is enabled
-                            if Config.SEND_PHOTOS_TELEGRAM:
-                                if photo_manager.capture_telegram_photo("distance_alert", f"tg_dist", int(current_distance)):
-                                    telegram_photo_path = photo_manager.last_photo_path
-
-                            # Cloud notification
-                            if cloud_manager:
-                                cloud_manager.notify_event("Distance", f"Distance: {int(current_distance)}mm")
-
-                            # Video recording if enabled
-                            video_path = None
-                            if Config.RECORD_VIDEO_ENABLED:
-                                if video_manager.record_video("distance", f"dist_{int(current_distance)}"):
-                                    video_path = video_manager.last_video_path
-
-                            # Telegram notification with TelegramManager
-                            if telegram_manager:
-                                telegram_manager.notify_distance_event(current_distance, telegram_photo_path, video_path)
-            else:
-                # System disabled
-                if int(time.time() * 2) % 10 == 0:
-                    red_led.toggle()
+        await asyncio.sleep_ms(Config.DISTANCE_SAMPLE_INTERVAL)
 
-            # System activity indication
-            if int(time.time() * 10) % 30 == 0:
-                blue_led.toggle()
+# Asynchronous task consuming the detections published by the detector tasks.
+# It awaits the capture stage of the event pipeline, which yields while the
+# video is recorded, so the detector tasks keep sampling during the clip;
+# persistence and notifications continue in the pipeline's own tasks.
+async def dispatcher_task():
+    while True:
+        event_type, value, queued_at, event_id = await event_queue.get()
 
-        except Exception as e:
-            logger.error(f"Error in main loop: {e}")
+        try:
+            tracer.record(tracer.QUEUE, queued_at, event_id)
+            logger.debug(f"Dispatching {event_type} event queued {time.ticks_diff(tracer.start(), queued_at) // 1000}ms ago", verbose=True)
 
-        # Wait for the next iteration (asynchronously)
-        await asyncio.sleep_ms(main_interval)
+            # Spans recorded by the managers during the capture belong to this event
+            tracer.set_event(event_id)
+            await event_pipeline.capture(event_type, value, event_id)
+
+            # Reset motion detection after the capture changed the camera mode
+            if event_type == "camera" and camera_detector:
+                camera_detector.reset_detection()
+        except Exception as e:
+            logger.error(f"Error handling {event_type} event: {e}")
+        finally:
+            tracer.clear_event()
 
 def main():
     global camera_detector, audio_detector, distance_detector
     global cloud_manager, photo_manager, file_manager, telegram_manager, video_manager, loop
+    global sensor_mode, preroll_buffer, motion_tracker, camera_sampler, motion_heatmap
+    global event_queue, event_pipeline
 
     try:
         # Memory cleanup at startup
@@ -318,19 +336,61 @@ def main():
                     except Exception as e:
                         logger.error(f"Error during cloud client startup: {e}")
 
+        # Camera sensor shared by the photo and video managers and the camera
+        # detector: it is reset once here, then only the mode deltas are applied
+        sensor_mode = SensorModeManager(Config)
+        sensor_mode.init()
+
         # Initialization of the photo manager anyway
-        photo_manager = PhotoManager(Config, file_manager)
+        photo_manager = PhotoManager(Config, file_manager, sensor_mode)
+
+        # Optional ring of the frames preceding an event, allocated once
+        if Config.PREROLL_ENABLED:
+            try:
+                preroll_buffer = PrerollBuffer(Config)
+            except MemoryError:
+                logger.error("Not enough memory for the pre-roll buffer, disabled")
+
+        # Tracker confirming the camera motion, kept across detector restarts
+        if Config.MOTION_TRACKING_ENABLED:
+            motion_tracker = MotionTracker(Config)
+
+        # Where and when the camera sees motion
+        if Config.MOTION_HEATMAP_ENABLED:
+            motion_heatmap = MotionHeatmap(Config, file_manager)
+
+        # Idle/active duty cycle of the camera sampling
+        if Config.CAMERA_ADAPTIVE_SAMPLING:
+            camera_sampler = AdaptiveSampler(Config)
 
         # Initialization of the video manager
-        video_manager = VideoManager(Config, file_manager)
+        video_manager = VideoManager(Config, file_manager, sensor_mode, preroll_buffer)
 
         # Startup indication with blue LED
         blue_led.on()
         time.sleep(1)
         blue_led.off()
 
-        # Start main loop task
+        # Shared queue between the detector tasks and the dispatcher
+        event_queue = EventQueue(Config.EVENT_QUEUE_SIZE)
+
+        # Event pipeline: capture in the dispatcher, then persistence,
+        # cloud notification and Telegram delivery in their own tasks
+        event_pipeline = EventPipeline(Config, photo_manager, video_manager, file_manager, event_queue)
+        if cloud_manager:
+            event_pipeline.set_cloud_manager(cloud_manager)
+        if motion_tracker:
+            event_pipeline.set_motion_tracker(motion_tracker)
+        if camera_sampler:
+            event_pipeline.set_camera_sampler(camera_sampler)
+        event_pipeline.start()
+
+        # Start the supervision loop, one task per detector and the dispatcher
         asyncio.create_task(main_loop())
+        asyncio.create_task(camera_task())
+        asyncio.create_task(audio_task())
+        asyncio.create_task(distance_task())
+        asyncio.create_task(dispatcher_task())
 
         # Initialization and startup of TelegramManager
         if hasattr(Config, 'TELEGRAM_ENABLED') and Config.TELEGRAM_ENABLED:
@@ -344,10 +404,14 @@ def main():
                     telegram_manager.set_cloud_manager(cloud_manager)
                 telegram_manager.set_photo_manager(photo_manager)
                 telegram_manager.set_video_manager(video_manager)
+                telegram_manager.set_event_pipeline(event_pipeline)
+                if motion_heatmap:
+                    telegram_manager.set_motion_heatmap(motion_heatmap)
                 
                 # Initialization and startup
                 if telegram_manager.initialize():
                     telegram_manager.start_bot()
+                    event_pipeline.set_telegram_manager(telegram_manager)
                     
                     # Indicate Telegram startup completion with LED
                     for _ in range(3):
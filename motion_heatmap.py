@@ -0,0 +1,156 @@
+import time
+import image
+import sensor
+from array import array
+import logger
+
+HEATMAP_DIRECTORY = "camera_heatmap"
+HOUR_BARS_HEIGHT = 32  # Pixels of the activity-per-hour chart below the grid
+
+class MotionHeatmap:
+    def __init__(self, config, file_manager):
+        """
+        Where and when the camera sees motion
+
+        Every analysed frame adds one to the counter of each block with
+        motion (the detection already computes the block grid, so this costs
+        a few comparisons) and frames with motion are counted per hour of the
+        day. The counters are rendered on demand into one small JPEG, and
+        every MOTION_HEATMAP_SAVE_INTERVAL seconds the period is saved in
+        camera_heatmap and the block counters start over.
+
+        Args:
+            config: System configuration
+            file_manager: Reference to the file manager
+        """
+        self.config = config
+        self.file_manager = file_manager
+        self.cols = config.MOTION_BLOCKS_X
+        self.rows = config.MOTION_BLOCKS_Y
+
+        self.counts = array("H", [0] * (self.cols * self.rows))  # Frames with motion per block
+        self.hours = array("H", [0] * 24)  # Frames with motion per hour of the day (never reset)
+        self.frames = 0                    # Frames analysed in the current period
+        self.active_frames = 0             # Frames with motion in the current period
+        self.period_start = time.time()
+        self.saved = 0                     # Periods saved to flash
+
+    def add(self, grid, level):
+        """
+        Accounts an analysed frame
+
+        Args:
+            grid: Block grid of the frame (one pixel per block), None if nothing moved
+            level: Smallest grid value counted as motion
+        """
+        self.frames += 1
+        if grid is None:
+            return
+
+        counts = self.counts
+        cols = min(self.cols, grid.width())
+        active = False
+        for y in range(min(self.rows, grid.height())):
+            row = y * self.cols
+            for x in range(cols):
+                if grid.get_pixel(x, y) >= level:
+                    active = True
+                    if counts[row + x] == 0xFFFF:
+                        self._halve(counts)
+                    counts[row + x] += 1
+        if not active:
+            return
+
+        self.active_frames += 1
+        hour = time.localtime()[3]
+        if self.hours[hour] == 0xFFFF:
+            self._halve(self.hours)
+        self.hours[hour] += 1
+
+    def _halve(self, counters):
+        """Halves saturated counters, keeping their proportions"""
+        for i in range(len(counters)):
+            counters[i] >>= 1
+
+    def render(self, path):
+        """
+        Saves the heatmap as a grayscale JPEG: brighter blocks saw more
+        motion, the bars below are the frames with motion per hour (0-23)
+
+        Returns:
+            bool: True if the image was saved, False otherwise
+        """
+        try:
+            cell = self.config.MOTION_HEATMAP_CELL
+            width = self.cols * cell
+            grid_height = self.rows * cell
+            img = image.Image(width, grid_height + HOUR_BARS_HEIGHT, sensor.GRAYSCALE)
+
+            peak = max(self.counts) or 1
+            for y in range(self.rows):
+                for x in range(self.cols):
+                    shade = self.counts[y * self.cols + x] * 255 // peak
+                    if shade:
+                        img.draw_rectangle(x * cell, y * cell, cell, cell, color=shade, fill=True)
+
+            img.draw_rectangle(0, grid_height, width, 1, color=128, fill=True)
+            peak = max(self.hours) or 1
+            bar_w = max(1, width // 24)
+            for hour in range(24):
+                bar_h = self.hours[hour] * (HOUR_BARS_HEIGHT - 2) // peak
+                if bar_h:
+                    img.draw_rectangle(hour * bar_w, grid_height + HOUR_BARS_HEIGHT - bar_h,
+                                       max(1, bar_w - 1), bar_h, color=255, fill=True)
+
+            return self.file_manager.save_image(img, path, self.config.PHOTO_QUALITY)
+        except Exception as e:
+            logger.error(f"Error rendering motion heatmap: {e}")
+            return False
+
+    def save_snapshot(self):
+        """
+        Saves the heatmap so far in camera_heatmap, without starting a new period
+
+        Returns:
+            str: Path of the saved image, None on error
+        """
+        path = f"{HEATMAP_DIRECTORY}/heatmap_{int(time.time())}.jpg"
+        if not self.render(path):
+            return None
+        self.file_manager.manage_files(HEATMAP_DIRECTORY, self.config.MAX_HEATMAPS)
+        return path
+
+    def due(self):
+        """Returns True if the current period has to be saved"""
+        interval = self.config.MOTION_HEATMAP_SAVE_INTERVAL
+        return interval > 0 and time.time() - self.period_start >= interval
+
+    def save_period(self):
+        """
+        Saves the heatmap of the current period (if anything moved) and starts a new one
+
+        Returns:
+            str: Path of the saved image, None if nothing was saved
+        """
+        path = None
+        if self.active_frames:
+            path = self.save_snapshot()
+            if path:
+                self.saved += 1
+                logger.info(f"Motion heatmap saved: {path}")
+
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.frames = 0
+        self.active_frames = 0
+        self.period_start = time.time()
+        return path
+
+    def format_summary(self):
+        """Returns the activity of the current period as a readable line"""
+        minutes = int(time.time() - self.period_start) // 60
+        percent = self.active_frames * 100 // self.frames if self.frames else 0
+        busiest = max(range(24), key=lambda hour: self.hours[hour])
+        busiest = f", busiest hour {busiest}:00" if self.hours[busiest] else ""
+        return (f"🔥 Motion heatmap: motion in {self.active_frames}/{self.frames} frames ({percent}%) "
+                f"in the last {minutes} min{busiest}")
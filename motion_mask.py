@@ -0,0 +1,142 @@
+import image
+import sensor
+
+def parse_mask(spec):
+    """
+    Parses a motion mask specification
+
+    The specification is a list of shapes separated by ";". Each shape is
+    "roi" (area to watch) or "exclude" (area to ignore) followed by its
+    coordinates in percent of the frame (0-100): four numbers are a
+    rectangle (x, y, w, h), six or more a polygon (x1, y1, x2, y2, ...).
+    Without any "roi" the whole frame is watched. Example:
+    "roi 20,0,60,100; exclude 70,0,100,0,100,30"
+
+    Args:
+        spec: Mask specification ("" = whole frame)
+
+    Returns:
+        list: (include, points) for each shape, points in percent
+
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    shapes = []
+    for part in spec.split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        fields = part.split(None, 1)
+        if len(fields) != 2 or fields[0] not in ("roi", "exclude"):
+            raise ValueError(f"'{part}': expected 'roi' or 'exclude' followed by coordinates")
+        try:
+            values = [int(v) for v in fields[1].replace(" ", "").split(",")]
+        except ValueError:
+            raise ValueError(f"'{part}': coordinates must be integers")
+        for v in values:
+            if v < 0 or v > 100:
+                raise ValueError(f"'{part}': coordinates must be between 0 and 100")
+
+        if len(values) == 4:
+            x, y, w, h = values
+            if w <= 0 or h <= 0:
+                raise ValueError(f"'{part}': empty rectangle")
+            points = [(x, y), (min(100, x + w), y), (min(100, x + w), min(100, y + h)), (x, min(100, y + h))]
+        elif len(values) >= 6 and len(values) % 2 == 0:
+            points = [(values[i], values[i + 1]) for i in range(0, len(values), 2)]
+        else:
+            raise ValueError(f"'{part}': expected 4 numbers (rectangle) or 3+ points (polygon)")
+        shapes.append((fields[0] == "roi", points))
+    return shapes
+
+class MotionMask:
+    def __init__(self, spec, width, height):
+        """
+        Bitmask of the pixels analysed by the motion detection
+
+        The specification (see parse_mask()) is rasterized once into a
+        grayscale image of the analysed frame size: 255 where motion is
+        watched, 0 where it is ignored. The detection then only has to AND
+        its frames with it, or crop them to the bounding box of the mask
+        when the mask is a plain rectangle.
+
+        Args:
+            spec: Mask specification ("" = whole frame)
+            width: Width of the analysed frames
+            height: Height of the analysed frames
+
+        Raises:
+            ValueError: If the specification is malformed
+        """
+        self.spec = spec
+        self.width = width
+        self.height = height
+        shapes = parse_mask(spec)
+
+        self.full = not shapes     # The whole frame is watched: nothing to mask
+        self.image = None
+        self.bbox = (0, 0, width, height)
+        self.pixels = width * height
+        self.crop = None           # The mask cropped to its bounding box
+        self.rectangle = False     # The mask is exactly its bounding box
+        if self.full:
+            return
+
+        self.image = image.Image(width, height, sensor.GRAYSCALE)
+        includes = [points for include, points in shapes if include]
+        if not includes:
+            self.image.draw_rectangle(0, 0, width, height, color=255, fill=True)
+        for include, points in shapes:
+            self._fill_polygon([self._to_pixels(x, y) for x, y in points], 255 if include else 0)
+
+        # Bounding box of the watched area (the exclusions may make it smaller)
+        if includes:
+            xs = [self._to_pixels(x, y)[0] for points in includes for x, y in points]
+            ys = [self._to_pixels(x, y)[1] for points in includes for x, y in points]
+            x0, y0 = max(0, min(xs)), max(0, min(ys))
+            x1, y1 = min(width, max(xs)), min(height, max(ys))
+            self.bbox = (x0, y0, max(1, x1 - x0), max(1, y1 - y0))
+
+        self.pixels = self.count(self.image)
+        bbox_pixels = self.bbox[2] * self.bbox[3]
+        self.rectangle = self.pixels == bbox_pixels
+        if not self.rectangle:
+            self.crop = image.Image(self.bbox[2], self.bbox[3], sensor.GRAYSCALE)
+            self.crop.draw_image(self.image, 0, 0, roi=self.bbox)
+
+    def _to_pixels(self, x, y):
+        """Converts percent coordinates to pixels"""
+        return (x * self.width + 50) // 100, (y * self.height + 50) // 100
+
+    def _fill_polygon(self, points, color):
+        """Fills a polygon with horizontal spans (even-odd rule, pixel centers)"""
+        top = max(0, min(p[1] for p in points))
+        bottom = min(self.height, max(p[1] for p in points))
+        edges = [(points[i], points[(i + 1) % len(points)]) for i in range(len(points))]
+        for y in range(top, bottom):
+            center = y + 0.5
+            crossings = []
+            for (xa, ya), (xb, yb) in edges:
+                if (ya <= center) != (yb <= center):
+                    crossings.append(xa + (center - ya) * (xb - xa) / (yb - ya))
+            crossings.sort()
+            for i in range(0, len(crossings) - 1, 2):
+                x0 = max(0, int(crossings[i] + 0.5))
+                x1 = min(self.width, int(crossings[i + 1] + 0.5))
+                if x1 > x0:
+                    self.image.draw_rectangle(x0, y, x1 - x0, 1, color=color, fill=True)
+
+    def count(self, img):
+        """Returns the number of set (255) pixels of a binary image"""
+        # The histogram bins are exact fractions, the integer mean is not
+        return int(img.get_histogram().bins()[-1] * img.width() * img.height() + 0.5)
+
+    def coverage(self):
+        """Returns the watched fraction of the frame (0-1)"""
+        return self.pixels / (self.width * self.height)
+
+    def describe(self):
+        """Returns the mask as a readable line"""
+        if self.full:
+            return "whole frame"
+        return f"{self.spec} ({self.coverage() * 100:.0f}% of the frame watched)"
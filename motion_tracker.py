@@ -0,0 +1,173 @@
+from array import array
+import logger
+
+class MotionTracker:
+    def __init__(self, config):
+        """
+        Centroid tracker of the motion blobs
+
+        Each frame the blobs found in the difference image are matched to
+        the tracks of the previous frames by nearest centroid. A track
+        raises an event once, when it has been seen for
+        MOTION_TRACK_MIN_FRAMES frames or when its centroid crosses the
+        MOTION_TRIPWIRE line, so single-frame noise never gets to the photo
+        and video capture. The tracks live in fixed arrays of
+        MOTION_TRACK_MAX slots, so tracking never allocates.
+
+        Args:
+            config: System configuration
+        """
+        self.config = config
+        self.capacity = config.MOTION_TRACK_MAX
+
+        # One slot per track (frames = 0 marks a free slot)
+        self.cx = array("h", [0] * self.capacity)       # Centroid in analysed pixels
+        self.cy = array("h", [0] * self.capacity)
+        self.frames = array("H", [0] * self.capacity)   # Frames the track was seen in
+        self.missed = array("B", [0] * self.capacity)   # Consecutive frames without a blob
+        self.reported = array("B", [0] * self.capacity) # The track already raised its event
+        self.matched = array("B", [0] * self.capacity)  # Scratch: matched in the current frame
+        self.rects = [None] * self.capacity             # Last blob rectangle (x, y, w, h)
+
+        self.width = 0            # Size of the analysed frames
+        self.height = 0
+        self.tripwire = None      # (x1, y1, x2, y2) in analysed pixels
+        self.tripwire_spec = None
+
+        # Statistics
+        self.tracks = 0           # Tracks started
+        self.events = 0           # Tracks that raised an event
+        self.crossings = 0        # Events raised by the tripwire
+        self.ignored = 0          # Tracks that ended without an event
+        self.overflows = 0        # Blobs dropped because every slot was taken
+
+    def clear(self):
+        """Forgets every track (e.g. after a lighting change)"""
+        for i in range(self.capacity):
+            self.frames[i] = 0
+
+    def set_frame_size(self, width, height):
+        """Sets the size of the analysed frames, rebuilding the tripwire"""
+        if width == self.width and height == self.height and self.tripwire_spec == self.config.MOTION_TRIPWIRE:
+            return
+        self.width = width
+        self.height = height
+        self.tripwire_spec = self.config.MOTION_TRIPWIRE
+        self.tripwire = None
+        self.clear()
+        if not self.tripwire_spec:
+            return
+        try:
+            values = [int(v) for v in self.tripwire_spec.split(",")]
+            if len(values) != 4:
+                raise ValueError("expected x1,y1,x2,y2")
+            self.tripwire = ((values[0] * width + 50) // 100, (values[1] * height + 50) // 100,
+                             (values[2] * width + 50) // 100, (values[3] * height + 50) // 100)
+        except ValueError as e:
+            logger.error(f"Invalid motion tripwire {self.tripwire_spec}: {e}")
+
+    def _side(self, x, y):
+        """Returns on which side of the tripwire a point lies (-1, 0, 1)"""
+        x1, y1, x2, y2 = self.tripwire
+        cross = (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+        return (cross > 0) - (cross < 0)
+
+    def _crosses(self, x0, y0, x1, y1):
+        """Returns True if the segment from (x0, y0) to (x1, y1) crosses the tripwire"""
+        if self.tripwire is None:
+            return False
+        before = self._side(x0, y0)
+        after = self._side(x1, y1)
+        if before == after or before == 0:
+            return False
+
+        # The tripwire ends must be on opposite sides of the movement as well
+        wx1, wy1, wx2, wy2 = self.tripwire
+        dx, dy = x1 - x0, y1 - y0
+        end1 = dx * (wy1 - y0) - dy * (wx1 - x0)
+        end2 = dx * (wy2 - y0) - dy * (wx2 - x0)
+        return (end1 > 0) != (end2 > 0) or end1 == 0 or end2 == 0
+
+    def update(self, blobs):
+        """
+        Matches the blobs of a frame to the tracks
+
+        Args:
+            blobs: Blobs found in the difference image (largest first is best)
+
+        Returns:
+            int: Slot of the track raising an event in this frame, or -1
+        """
+        max_distance = self.config.MOTION_TRACK_MAX_DISTANCE * self.width // 100
+        max_distance *= max_distance
+        event = -1
+
+        for i in range(self.capacity):
+            self.matched[i] = 0
+
+        for blob in blobs:
+            x, y = blob.cx(), blob.cy()
+
+            # Nearest track not matched yet
+            best = -1
+            best_distance = max_distance + 1
+            for i in range(self.capacity):
+                if self.frames[i] and not self.matched[i]:
+                    distance = (self.cx[i] - x) ** 2 + (self.cy[i] - y) ** 2
+                    if distance < best_distance:
+                        best = i
+                        best_distance = distance
+
+            if best < 0:
+                # New track in the first free slot
+                for i in range(self.capacity):
+                    if not self.frames[i]:
+                        best = i
+                        break
+                else:
+                    self.overflows += 1
+                    continue
+                self.cx[best] = x
+                self.cy[best] = y
+                self.frames[best] = 0
+                self.reported[best] = 0
+                self.tracks += 1
+
+            crossed = self.frames[best] and self._crosses(self.cx[best], self.cy[best], x, y)
+            self.cx[best] = x
+            self.cy[best] = y
+            self.frames[best] = min(self.frames[best] + 1, 0xFFFF)
+            self.missed[best] = 0
+            self.matched[best] = 1
+            self.rects[best] = blob.rect()
+
+            if self.reported[best]:
+                continue
+            if crossed or self.frames[best] >= self.config.MOTION_TRACK_MIN_FRAMES:
+                self.reported[best] = 1
+                self.events += 1
+                if crossed:
+                    self.crossings += 1
+                if event < 0:
+                    event = best
+
+        # Tracks without a blob survive a few frames (occlusion, a pause)
+        for i in range(self.capacity):
+            if self.frames[i] and not self.matched[i]:
+                self.missed[i] += 1
+                if self.missed[i] > self.config.MOTION_TRACK_MAX_MISSED:
+                    if not self.reported[i]:
+                        self.ignored += 1
+                    self.frames[i] = 0
+
+        return event
+
+    def active(self):
+        """Returns the number of live tracks"""
+        return sum(1 for i in range(self.capacity) if self.frames[i])
+
+    def format_stats(self):
+        """Returns the tracker statistics as a readable line"""
+        return (f"🎯 Tracker: {self.active()}/{self.capacity} live tracks, {self.tracks} started, "
+                f"{self.events} events ({self.crossings} tripwire), {self.ignored} ignored as noise, "
+                f"{self.overflows} blobs over capacity")
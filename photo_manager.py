@@ -1,6 +1,7 @@
 import sensor
 import time
 import pyb
+import tracer
 
 # LED for visual feedback
 red_led = pyb.LED(1)
@@ -9,27 +10,26 @@ def debug_print(msg):
     print(msg)
 
 class PhotoManager:
-    def __init__(self, config, file_manager):
+    def __init__(self, config, file_manager, sensor_mode):
         """
         Photo manager responsible for capturing and saving images
         
         Args:
             config: System configuration
             file_manager: Reference to the file manager
+            sensor_mode: Shared SensorModeManager owning the camera sensor
         """
         self.config = config
         self.file_manager = file_manager
-        self.camera_enabled = False
-        self.current_mode = None  # No initial mode
+        self.sensor_mode = sensor_mode
         self.last_photo_path = None  # Tracks the last saved photo path
         
-        # Initial attempt to initialize the camera
-        try:
-            sensor.reset()
-            self.camera_enabled = True
+        # The sensor is reset once by the mode manager
+        self.camera_enabled = sensor_mode.available or sensor_mode.init()
+        if self.camera_enabled:
             debug_print("Camera available for the PhotoManager")
-        except Exception as e:
-            debug_print(f"Error initializing camera in PhotoManager: {e}")
+        else:
+            debug_print("Error initializing camera in PhotoManager")
     
     def init_camera_for_motion(self):
         """Initializes the camera for motion detection (grayscale)"""
@@ -37,21 +37,14 @@ class PhotoManager:
             debug_print("Camera not available")
             return False
             
-        try:
-            sensor.reset()
-            sensor.set_pixformat(sensor.GRAYSCALE)  # Use grayscale for motion detection
-            sensor.set_framesize(self.config.FRAME_SIZE)
-            sensor.set_vflip(False)
-            sensor.set_hmirror(True)
-            sensor.skip_frames(time=2000)
-            
-            self.current_mode = "motion"
-            debug_print("Camera initialized for motion detection")
-            debug_print(f"Image size: {sensor.width()}x{sensor.height()}")
-            return True
-        except Exception as e:
-            debug_print(f"Camera camera error: {e}")
+        # Use grayscale for motion detection
+        if not self.sensor_mode.set_mode("motion", sensor.GRAYSCALE, self.config.FRAME_SIZE, legacy_settle_ms=2000):
+            debug_print("Camera camera error")
             return False
+            
+        debug_print("Camera initialized for motion detection")
+        debug_print(f"Image size: {sensor.width()}x{sensor.height()}")
+        return True
     
     def init_camera_for_photo(self, for_telegram=False):
         """
@@ -64,30 +57,22 @@ class PhotoManager:
             debug_print("Camera not available")
             return False
             
-        try:
-            sensor.reset()
-            sensor.set_pixformat(sensor.RGB565)
-            
-            # Use a lower resolution if the photo is for Telegram
-            if for_telegram and hasattr(self.config, 'TELEGRAM_PHOTO_SIZE'):
-                sensor.set_framesize(self.config.TELEGRAM_PHOTO_SIZE)
-                debug_print("Camera initialized for Telegram photos at low resolution")
-            else:
-                sensor.set_framesize(self.config.PHOTO_SIZE)
-                debug_print("Camera initialized for standard resolution photos")
-                
-            sensor.set_vflip(False)
-            sensor.set_hmirror(True)
-            sensor.skip_frames(time=100)
+        # Use a lower resolution if the photo is for Telegram
+        if for_telegram and hasattr(self.config, 'TELEGRAM_PHOTO_SIZE'):
+            framesize = self.config.TELEGRAM_PHOTO_SIZE
+            debug_print("Camera initialized for Telegram photos at low resolution")
+        else:
+            framesize = self.config.PHOTO_SIZE
+            debug_print("Camera initialized for standard resolution photos")
             
-            self.current_mode = "photo"
-            debug_print("Camera initialized for photos")
-            return True
-        except Exception as e:
-            debug_print(f"Photo camera error: {e}")
+        if not self.sensor_mode.set_mode("photo", sensor.RGB565, framesize, legacy_settle_ms=100):
+            debug_print("Photo camera error")
             return False
+            
+        debug_print("Camera initialized for photos")
+        return True
     
-    def capture_save_photo(self, directory, prefix=None, extra_info=None, for_telegram=False):
+    def capture_save_photo(self, directory, prefix=None, extra_info=None, for_telegram=False, manage_files=True, restore_mode=True):
         """
         Captures a photo and saves it in the specified directory
         
@@ -96,6 +81,8 @@ class PhotoManager:
             prefix: Optional prefix for the file name (default: 'img')
             extra_info: Additional information to include in the file name
             for_telegram: If True, uses lower quality for photos intended for Telegram
+            manage_files: If False, the FIFO cleanup is left to the caller
+            restore_mode: If False, the caller restores the previous sensor mode
             
         Returns:
             bool: True if the photo was captured and saved, False otherwise
@@ -104,17 +91,21 @@ class PhotoManager:
             debug_print("Camera not available for photos")
             return False
             
-        # Switch to photo mode if necessary
-        if self.current_mode != "photo":
-            if not self.init_camera_for_photo(for_telegram):
-                return False
+        # Store the current mode to restore it later
+        prev_state = self.sensor_mode.get_state()
+        
+        # Switch to photo mode (only the changed settings are applied)
+        if not self.init_camera_for_photo(for_telegram):
+            return False
         
         try:
             # Turn on the red LED during capture
             red_led.on()
             
             # Capture the image
+            span_start = tracer.start()
             img = sensor.snapshot()
+            tracer.record(tracer.SNAPSHOT, span_start)
             
             # Generate file name with timestamp
             timestamp = int(time.time())
@@ -144,8 +135,9 @@ class PhotoManager:
                 debug_print(f"Last photo path updated: {self.last_photo_path}")
                 
                 # Handle FIFO logic
-                max_files = self.config.MAX_TELEGRAM_PHOTOS if directory == "telegram_request" else self.config.MAX_IMAGES
-                self.file_manager.manage_files(directory, max_files)
+                if manage_files:
+                    max_files = self.config.MAX_TELEGRAM_PHOTOS if directory == "telegram_request" else self.config.MAX_IMAGES
+                    self.file_manager.manage_files(directory, max_files)
             
             # Turn off the red LED
             red_led.off()
@@ -156,12 +148,99 @@ class PhotoManager:
             red_led.off()
             return False
         finally:
-            # In any case, attempt to restore the camera to motion detection mode
-            # if it was in that mode before
-            if self.current_mode == "photo" and getattr(self, 'previous_mode', None) == "motion":
-                self.init_camera_for_motion()
+            # In any case, restore the mode the camera was in before
+            if restore_mode:
+                self.sensor_mode.restore(prev_state)
                 
-    def capture_telegram_photo(self, directory="telegram_request", prefix="tg", extra_info=None):
+    def capture_event_photos(self, directory, prefix=None, tg_prefix="tg", extra_info=None, telegram=True, manage_files=True, restore_mode=True):
+        """
+        Captures a single frame and saves both the archive photo and the
+        Telegram photo from it, so both show the same moment
+
+        The frame is captured at the archive resolution (PHOTO_SIZE); the
+        Telegram rendition is derived in memory, scaled by TELEGRAM_PHOTO_SCALE
+        and compressed with TELEGRAM_PHOTO_QUALITY.
+        
+        Args:
+            directory: The directory where the images will be saved
+            prefix: Prefix for the archive file name (default: 'img')
+            tg_prefix: Prefix for the Telegram file name
+            extra_info: Additional information to include in the file names
+            telegram: If False, only the archive photo is saved
+            manage_files: If False, the FIFO cleanup is left to the caller
+            restore_mode: If False, the caller restores the previous sensor mode
+            
+        Returns:
+            tuple: (archive_path, telegram_path), None for a photo that was not saved
+        """
+        if not self.camera_enabled:
+            debug_print("Camera not available for photos")
+            return None, None
+            
+        # Store the current mode to restore it later
+        prev_state = self.sensor_mode.get_state()
+        
+        if not self.init_camera_for_photo():
+            return None, None
+        
+        archive_path = None
+        telegram_path = None
+        try:
+            # Capture the image once
+            red_led.on()
+            span_start = tracer.start()
+            img = sensor.snapshot()
+            tracer.record(tracer.SNAPSHOT, span_start)
+            red_led.off()
+            
+            timestamp = int(time.time())
+            
+            # Archive rendition
+            filename = self._photo_filename(directory, prefix or "img", timestamp, extra_info)
+            if self.file_manager.save_image(img, filename, self.config.PHOTO_QUALITY):
+                archive_path = filename
+                self.last_photo_path = filename
+                debug_print(f"Last photo path updated: {self.last_photo_path}")
+            
+            # Telegram rendition derived from the same frame
+            if telegram:
+                scale = self.config.TELEGRAM_PHOTO_SCALE
+                tg_img = img
+                if scale < 1.0:
+                    try:
+                        tg_img = img.copy(x_scale=scale, y_scale=scale)
+                    except MemoryError:
+                        debug_print("Not enough memory to scale the Telegram photo, saving it at full size")
+                
+                filename = self._photo_filename(directory, tg_prefix, timestamp, extra_info)
+                if self.file_manager.save_image(tg_img, filename, self.config.TELEGRAM_PHOTO_QUALITY):
+                    telegram_path = filename
+                    debug_print(f"Telegram photo saved: {telegram_path}")
+                tg_img = None
+            
+            # Handle FIFO logic
+            if manage_files:
+                if archive_path:
+                    self.file_manager.manage_files(directory, self.config.MAX_IMAGES)
+                if telegram_path:
+                    self.file_manager.manage_files(directory, self.config.MAX_TELEGRAM_PHOTOS)
+            
+            return archive_path, telegram_path
+        except Exception as e:
+            debug_print(f"Error capturing event photos: {e}")
+            red_led.off()
+            return archive_path, telegram_path
+        finally:
+            if restore_mode:
+                self.sensor_mode.restore(prev_state)
+    
+    def _photo_filename(self, directory, prefix, timestamp, extra_info=None):
+        """Builds the file name of a photo"""
+        if extra_info:
+            return f"{directory}/{prefix}_{timestamp}_{extra_info}.jpg"
+        return f"{directory}/{prefix}_{timestamp}.jpg"
+                
+    def capture_telegram_photo(self, directory="telegram_request", prefix="tg", extra_info=None, manage_files=True, restore_mode=True):
         """
         Captures a photo specifically optimized for Telegram
         
@@ -169,10 +248,16 @@ class PhotoManager:
             directory: The directory where the image will be saved
             prefix: Prefix for the file name
             extra_info: Additional information to include in the file name
+            manage_files: If False, the FIFO cleanup is left to the caller
+            restore_mode: If False, the caller restores the previous sensor mode
             
         Returns:
             bool: True if the photo was captured and saved, False otherwise
         """
+        if not self.camera_enabled:
+            debug_print("Camera not available for photos")
+            return False
+            
         # Ensure the directory exists
         try:
             self.file_manager.ensure_directory(directory)
@@ -180,7 +265,7 @@ class PhotoManager:
             pass
             
         # Store the current mode to restore it later
-        prev_mode = self.current_mode
+        prev_state = self.sensor_mode.get_state()
         
         # Configure the camera with very low resolution for Telegram
         if hasattr(sensor, 'QQVGA'):  # 160x120
@@ -192,16 +277,15 @@ class PhotoManager:
             
         try:
             # Configure the camera for maximum compression
-            sensor.reset()
-            sensor.set_pixformat(sensor.RGB565)  # RGB565 for color but with less data than JPEG
-            sensor.set_framesize(size_to_use)
-            sensor.set_vflip(False)
-            sensor.set_hmirror(True)
-            sensor.skip_frames(time=100)
+            # RGB565 for color but with less data than JPEG
+            if not self.sensor_mode.set_mode("telegram_photo", sensor.RGB565, size_to_use, legacy_settle_ms=100):
+                return False
             
             # Capture the image
             red_led.on()
+            span_start = tracer.start()
             img = sensor.snapshot()
+            tracer.record(tracer.SNAPSHOT, span_start)
             red_led.off()
             
             # Generate file name with timestamp
@@ -226,11 +310,12 @@ class PhotoManager:
                 debug_print(f"Telegram photo saved: {self.last_photo_path}")
                 
                 # Handle FIFO logic (fewer files for Telegram photos)
-                max_files = 5
-                if hasattr(self.config, 'MAX_TELEGRAM_PHOTOS'):
-                    max_files = self.config.MAX_TELEGRAM_PHOTOS
-                    
-                self.file_manager.manage_files(directory, max_files)
+                if manage_files:
+                    max_files = 5
+                    if hasattr(self.config, 'MAX_TELEGRAM_PHOTOS'):
+                        max_files = self.config.MAX_TELEGRAM_PHOTOS
+                        
+                    self.file_manager.manage_files(directory, max_files)
                 
             return success
             
@@ -239,5 +324,5 @@ class PhotoManager:
             return False
         finally:
             # Restore the previous mode
-            if prev_mode == "motion":
-                self.init_camera_for_motion()
\ No newline at end of file
+            if restore_mode:
+                self.sensor_mode.restore(prev_state)
\ No newline at end of file
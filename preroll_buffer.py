@@ -0,0 +1,158 @@
+import time
+import image
+import sensor
+from array import array
+import logger
+
+class PrerollBuffer:
+    def __init__(self, config):
+        """
+        Ring of the most recent JPEG frames seen while monitoring
+
+        The whole ring is one bytearray allocated at startup and split in
+        fixed-size slots, so feeding it never allocates. Frames are stored
+        at PREROLL_FPS; when a video is recorded the frames of the last
+        PREROLL_SECONDS are written at the start of the clip.
+
+        Args:
+            config: System configuration
+        """
+        self.config = config
+        self.slots = max(1, config.PREROLL_SECONDS * config.PREROLL_FPS)
+        self.slot_size = config.PREROLL_MEMORY_BUDGET // self.slots
+        self.frame_interval = 1000 // config.PREROLL_FPS
+
+        # Preallocated storage
+        self.buffer = bytearray(self.slot_size * self.slots)
+        self.buffer_mv = memoryview(self.buffer)
+        self.lengths = array("I", [0] * self.slots)  # JPEG size in each slot (0 = empty)
+        self.stamps = array("I", [0] * self.slots)   # ticks_ms() of each frame
+
+        self.head = 0          # Next slot to write
+        self.count = 0         # Frames currently in the ring
+        self.width = 0         # Size of the stored frames
+        self.height = 0
+        self.last_add = None   # ticks_ms() of the last stored frame
+
+        # Statistics
+        self.added = 0         # Frames stored in the ring
+        self.overwritten = 0   # Frames evicted before being flushed
+        self.dropped_large = 0 # Frames larger than a slot
+        self.dropped_error = 0 # Frames that failed to compress
+        self.flushed = 0       # Frames written to a video
+        self.max_frame = 0     # Largest JPEG frame seen
+
+        logger.info(f"Pre-roll buffer: {self.slots} slots of {self.slot_size} bytes")
+
+    def due(self):
+        """Returns True if the next frame offered would be stored"""
+        return self.last_add is None or time.ticks_diff(time.ticks_ms(), self.last_add) >= self.frame_interval
+
+    def add(self, img):
+        """
+        Offers a monitoring frame to the ring (decimated to PREROLL_FPS)
+
+        The frame is compressed in place, so it must not be used afterwards.
+
+        Returns:
+            bool: True if the frame was stored, False otherwise
+        """
+        if not self.due():
+            return False
+        now = time.ticks_ms()
+
+        try:
+            # Frame size changed (e.g. FRAME_SIZE updated): old frames can't be mixed
+            if img.width() != self.width or img.height() != self.height:
+                self.clear()
+                self.width = img.width()
+                self.height = img.height()
+
+            img.compress(quality=self.config.PREROLL_QUALITY)
+            data = img.bytearray()
+            length = img.size()
+        except Exception as e:
+            self.dropped_error += 1
+            logger.debug(f"Pre-roll frame compression error: {e}", verbose=True)
+            return False
+
+        if length > self.max_frame:
+            self.max_frame = length
+        if length > self.slot_size:
+            self.dropped_large += 1
+            return False
+
+        start = self.head * self.slot_size
+        self.buffer_mv[start:start + length] = data[:length]
+        self.lengths[self.head] = length
+        self.stamps[self.head] = now
+
+        if self.count == self.slots:
+            self.overwritten += 1
+        else:
+            self.count += 1
+        self.head = (self.head + 1) % self.slots
+        self.last_add = now
+        self.added += 1
+        return True
+
+    def clear(self):
+        """Empties the ring"""
+        for i in range(self.slots):
+            self.lengths[i] = 0
+        self.count = 0
+        self.head = 0
+
+    def flush_into(self, video, repeat=1):
+        """
+        Writes the frames of the last PREROLL_SECONDS into an MJPEG file,
+        oldest first, and empties the ring
+
+        Args:
+            video: Open mjpeg.Mjpeg object
+            repeat: Times each frame is written, to keep the clip timing
+                    when PREROLL_FPS is lower than the video FPS
+
+        Returns:
+            int: Number of frames flushed
+        """
+        now = time.ticks_ms()
+        max_age = self.config.PREROLL_SECONDS * 1000
+        flushed = 0
+
+        index = (self.head - self.count) % self.slots
+        for _ in range(self.count):
+            length = self.lengths[index]
+            if length and time.ticks_diff(now, self.stamps[index]) <= max_age:
+                start = index * self.slot_size
+                frame = image.Image(self.width, self.height, sensor.JPEG,
+                                    buffer=self.buffer_mv[start:start + length])
+                for _ in range(repeat):
+                    video.write(frame)
+                flushed += 1
+            index = (index + 1) % self.slots
+
+        self.flushed += flushed
+        self.clear()
+        return flushed
+
+    def get_stats(self):
+        """Returns the ring counters"""
+        return {
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "count": self.count,
+            "added": self.added,
+            "overwritten": self.overwritten,
+            "dropped_large": self.dropped_large,
+            "dropped_error": self.dropped_error,
+            "flushed": self.flushed,
+            "max_frame": self.max_frame
+        }
+
+    def format_stats(self):
+        """Returns the ring statistics as a readable line"""
+        s = self.get_stats()
+        return (f"🎞️ Pre-roll: {s['count']}/{s['slots']} frames ({s['slot_size']}B slots), "
+                f"stored {s['added']}, flushed {s['flushed']}, overwritten {s['overwritten']}, "
+                f"dropped {s['dropped_large']} too large (max {s['max_frame']}B) + {s['dropped_error']} errors")
@@ -0,0 +1,192 @@
+import sensor
+import time
+import logger
+import tracer
+
+class SensorModeManager:
+    def __init__(self, config):
+        """
+        Owns the camera sensor and switches it between the capture modes
+
+        The sensor is reset only once. Every later mode switch applies only
+        the settings that differ from the current ones and waits for
+        stabilization only when the pixel format changes: a framesize or
+        mirror change takes effect on the next frame.
+
+        Args:
+            config: System configuration
+        """
+        self.config = config
+        self.available = False
+
+        # Current sensor state (None = unknown, e.g. right after a reset)
+        self.mode = None
+        self.pixformat = None
+        self.framesize = None
+        self.hmirror = None
+        self.vflip = None
+
+        self.reset_ms = 0         # Measured cost of a sensor.reset()
+        self.owners = 0           # Captures currently using the sensor (see acquire())
+
+        # Statistics
+        self.resets = 0
+        self.switches = 0         # set_mode() calls that changed at least one setting
+        self.stabilizations = 0   # Switches that had to wait for stabilization
+        self.saved_ms = 0         # Estimated time saved compared to reset + skip_frames
+        self.events = 0
+        self.event_saved_ms = 0   # Time saved during event captures only
+        self.last_event_saved_ms = 0
+        self._event_saved_start = 0
+
+    def init(self):
+        """
+        Resets the sensor (only needed once at startup)
+
+        Returns:
+            bool: True if the camera is available, False otherwise
+        """
+        try:
+            start = time.ticks_ms()
+            sensor.reset()
+            self.reset_ms = time.ticks_diff(time.ticks_ms(), start)
+            self.resets += 1
+            self.available = True
+
+            # After a reset the settings are the sensor defaults
+            self.mode = None
+            self.pixformat = None
+            self.framesize = None
+            self.hmirror = None
+            self.vflip = None
+
+            logger.debug(f"Sensor reset in {self.reset_ms}ms", verbose=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error resetting camera sensor: {e}")
+            self.available = False
+            return False
+
+    def set_mode(self, mode, pixformat, framesize, hmirror=True, vflip=False, legacy_settle_ms=0):
+        """
+        Switches the sensor to a capture mode applying only the deltas
+
+        Args:
+            mode: Name of the mode ("motion", "photo", "video", ...)
+            pixformat: sensor pixel format
+            framesize: sensor frame size
+            hmirror: Horizontal mirror
+            vflip: Vertical flip
+            legacy_settle_ms: skip_frames() time the caller used to wait after
+                              a full reset, used to estimate the time saved
+
+        Returns:
+            bool: True if the sensor is in the requested mode, False otherwise
+        """
+        if not self.available:
+            return False
+
+        span_start = tracer.start()
+        start = time.ticks_ms()
+        try:
+            if self.pixformat is None:
+                # First configuration after a reset: full stabilization
+                settle_ms = self.config.SENSOR_INIT_SETTLE_TIME
+            else:
+                settle_ms = self.config.SENSOR_SETTLE_TIME
+
+            changed = False
+            stabilize = False
+            if pixformat != self.pixformat:
+                sensor.set_pixformat(pixformat)
+                self.pixformat = pixformat
+                changed = True
+                stabilize = True
+            if framesize != self.framesize:
+                sensor.set_framesize(framesize)
+                self.framesize = framesize
+                changed = True
+            if hmirror != self.hmirror:
+                sensor.set_hmirror(hmirror)
+                self.hmirror = hmirror
+                changed = True
+            if vflip != self.vflip:
+                sensor.set_vflip(vflip)
+                self.vflip = vflip
+                changed = True
+
+            if stabilize and settle_ms:
+                sensor.skip_frames(time=settle_ms)
+                self.stabilizations += 1
+
+            self.mode = mode
+            if changed:
+                self.switches += 1
+                tracer.record(tracer.SENSOR_MODE, span_start)
+
+            elapsed = time.ticks_diff(time.ticks_ms(), start)
+            self.saved_ms += self.reset_ms + legacy_settle_ms - elapsed
+            logger.debug(f"Sensor mode {mode} set in {elapsed}ms", verbose=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error setting sensor mode {mode}: {e}")
+            # The state is unknown: force every setting at the next switch
+            self.pixformat = None
+            self.framesize = None
+            self.hmirror = None
+            self.vflip = None
+            return False
+
+    def acquire(self):
+        """
+        Marks the sensor as used by a capture that yields to other tasks
+        (event capture, video): the motion sampling must leave it alone
+        until release()
+        """
+        self.owners += 1
+
+    def release(self):
+        """Ends a capture started with acquire()"""
+        self.owners = max(0, self.owners - 1)
+
+    def busy(self):
+        """Returns True while a capture owns the sensor"""
+        return self.owners > 0
+
+    def get_state(self):
+        """Returns the current mode and settings, to be passed to restore()"""
+        return (self.mode, self.pixformat, self.framesize, self.hmirror, self.vflip)
+
+    def restore(self, state, legacy_settle_ms=0):
+        """
+        Restores a state returned by get_state()
+
+        Returns:
+            bool: True if the state was restored (or there was none), False otherwise
+        """
+        mode, pixformat, framesize, hmirror, vflip = state
+        if mode is None or pixformat is None:
+            return True
+        return self.set_mode(mode, pixformat, framesize, hmirror, vflip, legacy_settle_ms)
+
+    def begin_event(self):
+        """Starts accounting the time saved during the capture of an event"""
+        self._event_saved_start = self.saved_ms
+
+    def end_event(self):
+        """
+        Ends the accounting started by begin_event()
+
+        Returns:
+            int: Milliseconds saved during the event
+        """
+        self.events += 1
+        self.last_event_saved_ms = self.saved_ms - self._event_saved_start
+        self.event_saved_ms += self.last_event_saved_ms
+        return self.last_event_saved_ms
+
+    def format_stats(self):
+        """Returns the mode switch statistics as a readable line"""
+        average = self.event_saved_ms // self.events if self.events else 0
+        return (f"📷 Sensor: {self.resets} resets, {self.switches} mode switches ({self.stabilizations} stabilized), "
+                f"saved {self.last_event_saved_ms}ms last event, {average}ms per event on average")
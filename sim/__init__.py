@@ -0,0 +1,106 @@
+"""
+Host-side simulation runtime for the Nicla Vision Alert Detector
+
+Provides CPython drop-in fakes for the device modules (sensor, image, pyb,
+mjpeg, audio, vl53l1x, machine, network, uasyncio, ulab) plus local stand-ins
+for the Telegram Bot API and Arduino IoT Cloud, so the unmodified firmware
+code can be run, profiled and load-tested on a Linux box.
+
+This package is host-only: do not upload the sim folder to the device.
+
+Usage:
+    import sim
+    sim.install(frames="recordings/frames", pcm="recordings/audio.pcm",
+                distances="recordings/distance.csv")
+    import main
+    main.main()
+
+or simply: python -m sim.run --help
+"""
+
+import gc
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIB_DIR = os.path.join(ROOT_DIR, "lib")
+
+# Device modules replaced by the fakes of this package
+FAKE_MODULES = ("sensor", "image", "pyb", "mjpeg", "audio", "vl53l1x",
+                "machine", "network", "uasyncio", "ulab")
+
+_installed = False
+
+def _patch_time():
+    """Adds the MicroPython specific functions to the time module"""
+    from sim import clock
+
+    for name in ("ticks_ms", "ticks_us", "ticks_diff", "ticks_add",
+                 "sleep_ms", "sleep_us", "clock"):
+        if not hasattr(time, name):
+            setattr(time, name, getattr(clock, name))
+
+def _patch_gc():
+    """Adds the MicroPython memory reporting functions to the gc module"""
+    if not hasattr(gc, "mem_free"):
+        gc.mem_free = lambda: 256 * 1024
+    if not hasattr(gc, "mem_alloc"):
+        gc.mem_alloc = lambda: 0
+
+def install(frames=None, pcm=None, distances=None, cloud=True):
+    """
+    Installs the fake device modules into sys.modules
+
+    Must be called before importing any firmware module.
+
+    Args:
+        frames: Directory of PGM frames (or a single PGM file) replayed by sensor.snapshot()
+        pcm: Raw 16-bit little-endian mono PCM file replayed by audio streaming
+        distances: Text/CSV file with one distance in mm per line replayed by VL53L1X.read()
+        cloud: If True, replaces arduino_iot_cloud with the local stand-in
+    """
+    global _installed
+
+    _patch_time()
+    _patch_gc()
+
+    import importlib
+    for name in FAKE_MODULES:
+        sys.modules[name] = importlib.import_module("sim." + name)
+
+    if cloud:
+        from sim import cloud as cloud_module
+        sys.modules["arduino_iot_cloud"] = cloud_module
+
+    # Firmware modules live in the repository root, libraries in lib/
+    for path in (LIB_DIR, ROOT_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    if frames:
+        sys.modules["sensor"].load_frames(frames)
+    if pcm:
+        sys.modules["audio"].load_pcm(pcm)
+    if distances:
+        sys.modules["vl53l1x"].load_trace(distances)
+
+    _installed = True
+
+def install_telegram(telegram_module=None, server=None):
+    """
+    Redirects the Telegram bot library to the local Bot API stand-in
+
+    Args:
+        telegram_module: The imported lib/telegram.py module (imported if None)
+        server: FakeTelegramServer instance (a new one is created if None)
+
+    Returns:
+        FakeTelegramServer: The server answering the bot requests
+    """
+    from sim import telegram_server
+
+    if telegram_module is None:
+        import telegram as telegram_module
+
+    return telegram_server.install(telegram_module, server)
@@ -0,0 +1,64 @@
+"""
+Fake OpenMV audio module replaying a PCM stream
+
+The stream is a raw 16-bit little-endian mono file at 16 kHz. While
+streaming, a background thread delivers CHUNK_SAMPLES samples to the callback
+at the real-time rate, like the microphone interrupt does on the device.
+Without a recording, silence is delivered.
+"""
+
+import threading
+import time
+
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 512
+
+_pcm = b""
+_offset = 0
+_thread = None
+_streaming = False
+
+def load_pcm(path):
+    global _pcm, _offset
+
+    with open(path, "rb") as f:
+        _pcm = f.read()
+    _offset = 0
+
+def init(channels=1, frequency=16000, gain_db=24, highpass=0.9883, **kwargs):
+    global SAMPLE_RATE
+    SAMPLE_RATE = frequency
+
+def _next_chunk():
+    global _offset
+
+    size = CHUNK_SAMPLES * 2
+    if len(_pcm) < size:
+        return bytearray(size)
+
+    if _offset + size > len(_pcm):
+        _offset = 0
+    chunk = bytearray(_pcm[_offset:_offset + size])
+    _offset += size
+    return chunk
+
+def _stream(callback):
+    period = CHUNK_SAMPLES / SAMPLE_RATE
+    while _streaming:
+        callback(_next_chunk())
+        time.sleep(period)
+
+def start_streaming(callback):
+    global _thread, _streaming
+
+    _streaming = True
+    _thread = threading.Thread(target=_stream, args=(callback,), daemon=True)
+    _thread.start()
+
+def stop_streaming():
+    global _thread, _streaming
+
+    _streaming = False
+    if _thread:
+        _thread.join()
+        _thread = None
@@ -0,0 +1,53 @@
+"""MicroPython time functions (ticks, sleep_ms, clock) for CPython"""
+
+import time
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+def ticks_ms():
+    return int(time.monotonic() * 1000) & _TICKS_MAX
+
+def ticks_us():
+    return int(time.monotonic() * 1000000) & _TICKS_MAX
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+def ticks_diff(end, start):
+    # Same wrap-around semantics as MicroPython
+    return ((end - start + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+class Clock:
+    """Equivalent of the OpenMV time.clock() object"""
+
+    def __init__(self):
+        self.last = None
+        self.frame_ms = 0.0
+        self.count = 0
+        self.total_ms = 0.0
+
+    def tick(self):
+        now = time.monotonic()
+        if self.last is not None:
+            self.frame_ms = (now - self.last) * 1000
+            self.total_ms += self.frame_ms
+            self.count += 1
+        self.last = now
+
+    def avg(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def fps(self):
+        avg = self.avg()
+        return 1000.0 / avg if avg else 0.0
+
+def clock():
+    return Clock()
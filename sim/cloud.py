@@ -0,0 +1,86 @@
+"""
+Local stand-in for the Arduino IoT Cloud client (arduino_iot_cloud module)
+
+Records live in memory. update() publishes the records changed since the
+previous call as one pack (like the real client) and runs the on_write
+callbacks of records written remotely with remote_write(). Counters in
+`stats` let the simulation measure how much cloud traffic the firmware
+generates.
+"""
+
+import time
+
+# Simulated round trip of one update() call (milliseconds)
+UPDATE_TIME_MS = 20
+
+stats = {"update": 0, "publish": 0, "records_published": 0}
+
+# Last client created, so the simulation can drive it
+client = None
+
+class ArduinoCloudObject:
+    def __init__(self, name, value=None, on_write=None, **kwargs):
+        self.name = name
+        self.value = value
+        self.on_write = on_write
+        self.updated = False
+        self.on_write_scheduled = False
+
+class ArduinoCloudClient:
+    def __init__(self, device_id, username=None, password=None, sync_mode=False, **kwargs):
+        global client
+
+        self.device_id = device_id
+        self.sync_mode = sync_mode
+        self.records = {}
+        self.published = []  # (timestamp, {name: value}) of every pack pushed
+        client = self
+
+    def register(self, name, value=None, on_write=None, **kwargs):
+        self.records[name] = ArduinoCloudObject(name, value, on_write)
+
+    def __getitem__(self, key):
+        return self.records[key].value
+
+    def __setitem__(self, key, value):
+        record = self.records[key]
+        if record.value != value:
+            record.updated = True
+        record.value = value
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def get(self, key, default=None):
+        if key in self and self[key] is not None:
+            return self[key]
+        return default
+
+    def remote_write(self, name, value):
+        """Simulates a dashboard write: on_write runs on the next update()"""
+        record = self.records[name]
+        record.value = value
+        record.on_write_scheduled = True
+
+    def update(self):
+        stats["update"] += 1
+        if UPDATE_TIME_MS:
+            time.sleep(UPDATE_TIME_MS / 1000)
+
+        for record in list(self.records.values()):
+            if record.on_write_scheduled and record.on_write:
+                record.on_write_scheduled = False
+                record.on_write(self, record.value)
+
+        pack = {}
+        for record in self.records.values():
+            if record.updated:
+                pack[record.name] = record.value
+                record.updated = False
+        if pack:
+            stats["publish"] += 1
+            stats["records_published"] += len(pack)
+            self.published.append((time.time(), pack))
+
+    def start(self, interval=1.0, backoff=1.2):
+        pass
@@ -0,0 +1,349 @@
+"""
+Fake OpenMV image module
+
+Pixels are stored as 8-bit luminance whatever the pixel format, which is
+enough for the statistics the detectors compute. Images are saved as binary
+PGM data regardless of the file extension, so saved "JPEG" files can be
+inspected by renaming them to .pgm. compress() stands in for JPEG encoding
+with zlib: a compressed image only keeps its size and payload.
+"""
+
+import zlib
+
+GRAYSCALE = 1
+RGB565 = 2
+JPEG = 3
+
+# Scaling hints
+BILINEAR = 1
+AREA = 2
+
+def _bpp(pixformat):
+    return 2 if pixformat == RGB565 else 1
+
+def load_pgm(path):
+    """Loads a binary (P5) PGM file and returns (width, height, bytearray)"""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    # Header: magic, width, height, maxval separated by whitespace/comments
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b"#":
+            pos = data.index(b"\n", pos) + 1
+            continue
+        end = pos
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    pos += 1  # Single whitespace before the raster
+
+    if fields[0] != b"P5":
+        raise ValueError(f"{path}: only binary PGM (P5) frames are supported")
+
+    width, height = int(fields[1]), int(fields[2])
+    return width, height, bytearray(data[pos:pos + width * height])
+
+class Statistics:
+    def __init__(self, pixels):
+        self.pixels = pixels
+
+    def mean(self):
+        return sum(self.pixels) // len(self.pixels) if self.pixels else 0
+
+    def min(self):
+        return min(self.pixels) if self.pixels else 0
+
+    def max(self):
+        return max(self.pixels) if self.pixels else 0
+
+class Histogram:
+    def __init__(self, pixels):
+        self.pixels = pixels
+
+    def get_statistics(self):
+        return Statistics(self.pixels)
+
+    def bins(self):
+        """Normalized 256-bin histogram"""
+        counts = [0] * 256
+        for v in self.pixels:
+            counts[v] += 1
+        total = len(self.pixels) or 1
+        return [c / total for c in counts]
+
+class Blob:
+    def __init__(self, x, y, w, h, pixels, cx, cy):
+        self._rect = (x, y, w, h)
+        self._pixels = pixels
+        self._cx = cx
+        self._cy = cy
+
+    def rect(self):
+        return self._rect
+
+    def x(self):
+        return self._rect[0]
+
+    def y(self):
+        return self._rect[1]
+
+    def w(self):
+        return self._rect[2]
+
+    def h(self):
+        return self._rect[3]
+
+    def pixels(self):
+        return self._pixels
+
+    def cx(self):
+        return self._cx
+
+    def cy(self):
+        return self._cy
+
+class Image:
+    def __init__(self, width, height, pixformat=GRAYSCALE, buffer=None):
+        self._width = width
+        self._height = height
+        self.pixformat = pixformat
+        if buffer is None:
+            self.data = bytearray(width * height)
+        elif pixformat == JPEG:
+            self.data = bytearray(buffer)
+        else:
+            self.data = bytearray(buffer[:width * height])
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def format(self):
+        return self.pixformat
+
+    def size(self):
+        if self.pixformat == JPEG:
+            return len(self.data)
+        return self._width * self._height * _bpp(self.pixformat)
+
+    def compress(self, quality=50, **kwargs):
+        """Compresses the image in place (zlib instead of JPEG)"""
+        if self.pixformat != JPEG:
+            level = max(1, min(9, (100 - quality) // 10))
+            self.data = bytearray(zlib.compress(bytes(self.data), level))
+            self.pixformat = JPEG
+        return self
+
+    def bytearray(self):
+        return self.data
+
+    def _pixels(self, roi=None):
+        if roi is None:
+            return self.data
+        x, y, w, h = roi
+        rows = [self.data[(y + r) * self._width + x:(y + r) * self._width + x + w] for r in range(h)]
+        return b"".join(rows)
+
+    def get_histogram(self, roi=None):
+        return Histogram(self._pixels(roi))
+
+    def get_statistics(self, roi=None):
+        return Statistics(self._pixels(roi))
+
+    def get_pixel(self, x, y):
+        return self.data[y * self._width + x]
+
+    def set_pixel(self, x, y, value):
+        if isinstance(value, tuple):
+            value = sum(value) // len(value)
+        self.data[y * self._width + x] = value
+
+    def draw_rectangle(self, x, y, w, h, color=255, thickness=1, fill=False, **kwargs):
+        """Draws a rectangle (only filled rectangles are simulated)"""
+        if isinstance(color, tuple):
+            color = sum(color) // len(color)
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self._width, x + w), min(self._height, y + h)
+        if fill and x1 > x0:
+            for row in range(y0, y1):
+                start = row * self._width
+                self.data[start + x0:start + x1] = bytes([color]) * (x1 - x0)
+        return self
+
+    def draw_string(self, x, y, text, color=None, scale=1, **kwargs):
+        return self
+
+    def replace(self, img, **kwargs):
+        """Copies the pixels of another image of the same size"""
+        self.data[:] = img.data[:self._width * self._height]
+        return self
+
+    def difference(self, img, **kwargs):
+        """Absolute difference with another image, in place"""
+        other = img.data
+        self.data[:] = bytes(abs(a - b) for a, b in zip(self.data, other))
+        return self
+
+    def b_and(self, img, **kwargs):
+        """Bitwise AND with another image, in place"""
+        other = img.data
+        self.data[:] = bytes(a & b for a, b in zip(self.data, other))
+        return self
+
+    def blend(self, img, alpha=255, mask=None, **kwargs):
+        """Blends another image into this one where mask is set (OpenMV 4.5+: alpha 0-255 = opacity of img)"""
+        other = img.data
+        keep = mask.data if mask is not None else None
+        out = bytearray(self.data)
+        for i in range(len(out)):
+            if keep is None or keep[i]:
+                out[i] = (self.data[i] * (255 - alpha) + other[i] * alpha + 127) // 255
+        self.data[:] = out
+        return self
+
+    def gamma_corr(self, gamma=1.0, contrast=1.0, brightness=0.0, **kwargs):
+        """Applies (pixel ^ gamma) * contrast + brightness on the 0-1 range"""
+        lut = bytearray(min(255, max(0, int(((v / 255) ** gamma * contrast + brightness) * 255 + 0.5))) for v in range(256))
+        self.data[:] = self.data.translate(lut)
+        return self
+
+    def invert(self):
+        """Inverts every pixel"""
+        self.data[:] = self.data.translate(bytes(255 - v for v in range(256)))
+        return self
+
+    def find_blobs(self, thresholds, invert=False, pixels_threshold=10, area_threshold=10,
+                   merge=False, margin=0, **kwargs):
+        """Connected regions (4-connectivity) of pixels inside any threshold"""
+        inside = bytearray(256)
+        for lo, hi in thresholds:
+            for v in range(lo, hi + 1):
+                inside[v] = 1
+        if invert:
+            inside = bytearray(1 - v for v in inside)
+        w, h = self._width, self._height
+        todo = bytearray(inside[v] for v in self.data)
+
+        regions = []  # [x0, y0, x1, y1, pixels, sum_x, sum_y]
+        for start in range(w * h):
+            if not todo[start]:
+                continue
+            todo[start] = 0
+            stack = [start]
+            region = [w, h, -1, -1, 0, 0, 0]
+            while stack:
+                i = stack.pop()
+                x, y = i % w, i // w
+                region[0], region[1] = min(region[0], x), min(region[1], y)
+                region[2], region[3] = max(region[2], x), max(region[3], y)
+                region[4] += 1
+                region[5] += x
+                region[6] += y
+                for j, ok in ((i - 1, x > 0), (i + 1, x < w - 1), (i - w, y > 0), (i + w, y < h - 1)):
+                    if ok and todo[j]:
+                        todo[j] = 0
+                        stack.append(j)
+            if region[4] >= pixels_threshold and (region[2] - region[0] + 1) * (region[3] - region[1] + 1) >= area_threshold:
+                regions.append(region)
+
+        # Merge regions whose rectangles (grown by margin) overlap
+        merged = True
+        while merge and merged:
+            merged = False
+            for a in range(len(regions)):
+                for b in range(a + 1, len(regions)):
+                    ra, rb = regions[a], regions[b]
+                    if (ra[0] - margin <= rb[2] and rb[0] - margin <= ra[2] and
+                            ra[1] - margin <= rb[3] and rb[1] - margin <= ra[3]):
+                        regions[a] = [min(ra[0], rb[0]), min(ra[1], rb[1]), max(ra[2], rb[2]), max(ra[3], rb[3]),
+                                      ra[4] + rb[4], ra[5] + rb[5], ra[6] + rb[6]]
+                        del regions[b]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        return [Blob(r[0], r[1], r[2] - r[0] + 1, r[3] - r[1] + 1, r[4], r[5] // r[4], r[6] // r[4]) for r in regions]
+
+    def mean_pooled(self, x_div, y_div):
+        """Returns a new image averaging x_div * y_div cells"""
+        w, h, data = _pool(self.data, self._width, self._height, x_div, y_div)
+        return Image(w, h, self.pixformat, data)
+
+    def mean_pool(self, x_div, y_div):
+        """Averages x_div * y_div cells in place"""
+        self._width, self._height, self.data = _pool(self.data, self._width, self._height, x_div, y_div)
+        return self
+
+    def binary(self, thresholds, invert=False, **kwargs):
+        """Sets pixels inside any (lo, hi) threshold to 255, the others to 0"""
+        lut = bytearray(256)
+        for lo, hi in thresholds:
+            for v in range(lo, hi + 1):
+                lut[v] = 255
+        if invert:
+            lut = bytearray(255 - v for v in lut)
+        self.data[:] = self.data.translate(lut)
+        return self
+
+    def draw_image(self, img, x=0, y=0, x_scale=1.0, y_scale=1.0, hint=0, roi=None, **kwargs):
+        """Draws another image (or its roi; scaled, area average for AREA) at x, y"""
+        if roi is not None:
+            img = Image(roi[2], roi[3], img.pixformat, img._pixels(roi))
+        if hint == AREA and x_scale < 1.0 and y_scale < 1.0:
+            w, h, data = _pool(img.data, img.width(), img.height(), round(1 / x_scale), round(1 / y_scale))
+            src = Image(w, h, self.pixformat, data)
+        else:
+            src = resize(img, int(img.width() * x_scale), int(img.height() * y_scale))
+        w = min(src.width(), self._width - x)
+        for row in range(min(src.height(), self._height - y)):
+            start = (y + row) * self._width + x
+            self.data[start:start + w] = src.data[row * src.width():row * src.width() + w]
+        return self
+
+    def copy(self, x_scale=1.0, y_scale=1.0, roi=None, **kwargs):
+        return resize(self, int(self._width * x_scale), int(self._height * y_scale))
+
+    def save(self, path, quality=90, **kwargs):
+        with open(path, "wb") as f:
+            f.write(self.to_pgm())
+        return self
+
+    def to_pgm(self):
+        return b"P5\n%d %d\n255\n" % (self._width, self._height) + bytes(self.data)
+
+def _pool(data, width, height, x_div, y_div):
+    """Averages x_div * y_div cells (like mean_pool), returns (w, h, bytearray)"""
+    out_w, out_h = width // x_div, height // y_div
+    area = x_div * y_div
+    out = bytearray(out_w * out_h)
+    for oy in range(out_h):
+        rows = [data[(oy * y_div + r) * width:(oy * y_div + r) * width + out_w * x_div] for r in range(y_div)]
+        for ox in range(out_w):
+            total = 0
+            start = ox * x_div
+            for row in rows:
+                total += sum(row[start:start + x_div])
+            out[oy * out_w + ox] = total // area
+    return out_w, out_h, out
+
+def resize(img, width, height):
+    """Nearest-neighbour resize used by copy() and by the sensor replay"""
+    if width == img.width() and height == img.height():
+        return Image(width, height, img.pixformat, img.data)
+
+    src_w = img.width()
+    x_index = [x * src_w // width for x in range(width)]
+    out = bytearray()
+    for y in range(height):
+        row_start = (y * img.height() // height) * src_w
+        row = img.data[row_start:row_start + src_w]
+        out.extend(bytes(row[i] for i in x_index))
+    return Image(width, height, img.pixformat, out)
@@ -0,0 +1,21 @@
+"""Fake machine module"""
+
+class I2C:
+    def __init__(self, bus_id, **kwargs):
+        self.bus_id = bus_id
+
+class Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, pin_id, mode=None, **kwargs):
+        self.pin_id = pin_id
+        self.state = 0
+
+    def value(self, state=None):
+        if state is None:
+            return self.state
+        self.state = state
+
+def reset():
+    raise SystemExit("machine.reset() called")
@@ -0,0 +1,35 @@
+"""
+Fake OpenMV mjpeg module
+
+Frames are zlib-compressed luminance data framed by a small header, so file
+sizes grow roughly like a real MJPEG clip and upload paths can be exercised.
+"""
+
+import struct
+import zlib
+
+class Mjpeg:
+    def __init__(self, filename, width=None, height=None):
+        self.filename = filename
+        self.file = open(filename, "wb")
+        self.frames = 0
+
+    def write(self, img, quality=90, **kwargs):
+        if img.format() == 3:  # Already compressed (image.JPEG)
+            payload = bytes(img.bytearray())
+        else:
+            level = max(1, min(9, (100 - quality) // 10))
+            payload = zlib.compress(bytes(img.bytearray()), level)
+        self.file.write(struct.pack("<4sHHI", b"SIMF", img.width(), img.height(), len(payload)))
+        self.file.write(payload)
+        self.frames += 1
+        return self
+
+    def count(self):
+        return self.frames
+
+    def size(self):
+        return self.file.tell()
+
+    def close(self, fps=None):
+        self.file.close()
@@ -0,0 +1,45 @@
+"""
+Fake network module
+
+The WiFi link is always available unless set_link(False) is called, which
+lets the simulation exercise the reconnection and offline paths. Like on
+the device, every WLAN object of an interface shares its state, and the
+station starts connected (as if the board had already joined the network).
+"""
+
+STA_IF = 0
+AP_IF = 1
+
+_link_up = True
+
+# Interface -> [active, connected]
+_state = {STA_IF: [True, True], AP_IF: [False, False]}
+
+def set_link(up):
+    """Simulates the WiFi access point going up or down"""
+    global _link_up
+    _link_up = up
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._state = _state[interface]
+
+    def active(self, state=None):
+        if state is None:
+            return self._state[0]
+        self._state[0] = state
+        if not state:
+            self._state[1] = False
+
+    def connect(self, ssid=None, password=None):
+        self._state[1] = self._state[0] and _link_up
+
+    def disconnect(self):
+        self._state[1] = False
+
+    def isconnected(self):
+        return self._state[1] and _link_up
+
+    def ifconfig(self):
+        return ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
@@ -0,0 +1,29 @@
+"""Fake pyb module (LEDs and delays)"""
+
+import time
+
+class LED:
+    def __init__(self, led_id):
+        self.led_id = led_id
+        self.state = False
+
+    def on(self):
+        self.state = True
+
+    def off(self):
+        self.state = False
+
+    def toggle(self):
+        self.state = not self.state
+
+def delay(ms):
+    time.sleep(ms / 1000)
+
+def udelay(us):
+    time.sleep(us / 1000000)
+
+def millis():
+    return int(time.monotonic() * 1000)
+
+def elapsed_millis(start):
+    return millis() - start
@@ -0,0 +1,110 @@
+"""
+Runs the whole firmware main() on the host with the simulated devices
+
+Example:
+    python -m sim.run --frames recordings/frames --distances recordings/dist.csv \
+        --enable camera,distance --duration 60 --storage /tmp/nicla
+
+At the end a summary of the sensor, cloud and Telegram activity is printed.
+"""
+
+import argparse
+import ast
+import os
+import sys
+
+# Allow "python sim/run.py" as well as "python -m sim.run"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Nicla Vision firmware on the host")
+    parser.add_argument("--frames", help="Directory of PGM frames (or one PGM file) replayed by the camera")
+    parser.add_argument("--pcm", help="Raw 16-bit LE mono 16 kHz PCM file replayed by the microphone")
+    parser.add_argument("--distances", help="Text/CSV file with one distance (mm) per line")
+    parser.add_argument("--enable", default="camera",
+                        help="Comma separated detectors to enable: camera,audio,distance")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run before stopping")
+    parser.add_argument("--storage", default="sim_storage", help="Directory used as the device flash")
+    parser.add_argument("--no-cloud", action="store_true", help="Disable the cloud stand-in")
+    parser.add_argument("--no-telegram", action="store_true", help="Disable the Telegram stand-in")
+    parser.add_argument("--message", action="append", default=[],
+                        help="Telegram command injected at startup (can be repeated)")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a Config attribute, e.g. --set PREROLL_ENABLED=True (can be repeated)")
+    parser.add_argument("--debug", action="store_true", help="Enable Config.DEBUG")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Resolve the recordings before moving into the storage directory
+    frames = os.path.abspath(args.frames) if args.frames else None
+    pcm = os.path.abspath(args.pcm) if args.pcm else None
+    distances = os.path.abspath(args.distances) if args.distances else None
+
+    sim.install(frames=frames, pcm=pcm, distances=distances)
+
+    os.makedirs(args.storage, exist_ok=True)
+    os.chdir(args.storage)
+
+    from config import Config
+    import secrets_keys
+
+    enabled = [d.strip() for d in args.enable.split(",") if d.strip()]
+    Config.DEBUG = args.debug
+    for item in args.set:
+        name, value = item.split("=", 1)
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass  # Plain string
+        setattr(Config, name.strip(), value)
+    Config.GLOBAL_ENABLE = True
+    Config.CAMERA_MONITORING_ENABLED = "camera" in enabled
+    Config.AUDIO_MONITORING_ENABLED = "audio" in enabled
+    Config.DISTANCE_MONITORING_ENABLED = "distance" in enabled
+    Config.CLOUD_ENABLED = not args.no_cloud
+    Config.TELEGRAM_ENABLED = not args.no_telegram
+
+    server = sim.install_telegram()
+    for text in args.message:
+        chat_id = secrets_keys.TELEGRAM_AUTHORIZED_USERS[0]
+        server.inject_message(chat_id, text)
+
+    import main as firmware
+    import uasyncio
+    from sim import cloud, sensor
+
+    # The duration starts when main() enters the event loop, after the
+    # blocking initialization
+    loop = uasyncio.get_event_loop()
+    loop.call_soon(lambda: loop.call_later(args.duration, loop.stop))
+
+    # The cloud stand-in must report the enabled detectors, otherwise the
+    # periodic sync_from_cloud() would switch them off again
+    original_register = cloud.ArduinoCloudClient.register
+    def register(self, name, value=None, on_write=None, **kwargs):
+        forced = {"global_enable": Config.GLOBAL_ENABLE,
+                  "camera_monitoring": Config.CAMERA_MONITORING_ENABLED,
+                  "audio_monitoring": Config.AUDIO_MONITORING_ENABLED,
+                  "distance_monitoring": Config.DISTANCE_MONITORING_ENABLED}
+        if name in forced:
+            value = forced[name]
+        original_register(self, name, value, on_write, **kwargs)
+    cloud.ArduinoCloudClient.register = register
+
+    firmware.main()
+
+    print("\n=== Simulation summary ===")
+    print(f"Sensor: {sensor.stats}")
+    print(f"Cloud: {cloud.stats}")
+    print(f"Telegram: {server.stats}")
+    print(f"Telegram messages sent: {len(server.sent_messages)}, uploads: {len(server.uploads)}")
+
+    import tracer
+    print(tracer.format_summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Fake OpenMV sensor module replaying recorded frames
+
+Frames are binary PGM files replayed in order (looping) and resized to the
+current frame size. Without recordings a flat mid-gray scene is returned.
+RESET_TIME_MS and SNAPSHOT_TIME_MS model the blocking cost of the real
+sensor; skip_frames(time=...) sleeps for the requested time.
+"""
+
+import os
+import time
+from sim import image
+
+GRAYSCALE = image.GRAYSCALE
+RGB565 = image.RGB565
+JPEG = image.JPEG
+
+# Frame sizes (constant values are arbitrary, dimensions match OpenMV)
+QQCIF = 1
+QQVGA = 2
+QCIF = 3
+QVGA = 4
+CIF = 5
+VGA = 6
+HD = 7
+
+FRAME_DIMENSIONS = {
+    QQCIF: (88, 72),
+    QQVGA: (160, 120),
+    QCIF: (176, 144),
+    QVGA: (320, 240),
+    CIF: (352, 288),
+    VGA: (640, 480),
+    HD: (1280, 720),
+}
+
+# Simulated blocking costs (milliseconds)
+RESET_TIME_MS = 100
+SNAPSHOT_TIME_MS = 0
+
+# Counters useful when profiling the firmware
+stats = {"reset": 0, "snapshot": 0, "skip_frames_ms": 0}
+
+_state = {
+    "pixformat": RGB565,
+    "framesize": QVGA,
+    "hmirror": False,
+    "vflip": False,
+}
+_frames = []
+_frame_index = 0
+_resized = {}
+
+def load_frames(path):
+    """Loads the PGM frames to replay from a directory or a single file"""
+    global _frames, _frame_index, _resized
+
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.endswith(".pgm"))
+        paths = [os.path.join(path, n) for n in names]
+    else:
+        paths = [path]
+
+    _frames = []
+    for p in paths:
+        width, height, data = image.load_pgm(p)
+        _frames.append(image.Image(width, height, GRAYSCALE, data))
+    _frame_index = 0
+    _resized = {}
+
+def reset():
+    stats["reset"] += 1
+    _state.update(pixformat=RGB565, framesize=QVGA, hmirror=False, vflip=False)
+    time.sleep(RESET_TIME_MS / 1000)
+
+def set_pixformat(pixformat):
+    _state["pixformat"] = pixformat
+
+def get_pixformat():
+    return _state["pixformat"]
+
+def set_framesize(framesize):
+    _state["framesize"] = framesize
+
+def get_framesize():
+    return _state["framesize"]
+
+def set_hmirror(enable):
+    _state["hmirror"] = enable
+
+def set_vflip(enable):
+    _state["vflip"] = enable
+
+def width():
+    return FRAME_DIMENSIONS[_state["framesize"]][0]
+
+def height():
+    return FRAME_DIMENSIONS[_state["framesize"]][1]
+
+def alloc_extra_fb(width, height, pixformat):
+    stats["extra_fb"] = stats.get("extra_fb", 0) + 1
+    return image.Image(width, height, pixformat)
+
+def dealloc_extra_fb():
+    stats["extra_fb"] = stats.get("extra_fb", 0) - 1
+
+def skip_frames(n=None, time=None):
+    if time:
+        stats["skip_frames_ms"] += time
+        _sleep_ms(time)
+
+def _sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+def snapshot():
+    global _frame_index
+
+    stats["snapshot"] += 1
+    if SNAPSHOT_TIME_MS:
+        _sleep_ms(SNAPSHOT_TIME_MS)
+
+    w, h = width(), height()
+    if not _frames:
+        return image.Image(w, h, _state["pixformat"], bytes([128]) * (w * h))
+
+    index = _frame_index % len(_frames)
+    _frame_index += 1
+
+    # Resizing in Python is slow: cache one resized copy per frame and size
+    key = (index, w, h)
+    if key not in _resized:
+        _resized[key] = image.resize(_frames[index], w, h).data
+    return image.Image(w, h, _state["pixformat"], _resized[key])
@@ -0,0 +1,315 @@
+"""
+Local stand-in for the Telegram Bot API
+
+install() swaps the socket and ssl references of lib/telegram.py with fakes
+whose TLS connections talk HTTP/1.1 to an in-memory FakeTelegramServer.
+The server answers getUpdates (including long polling), sendMessage and the
+upload methods, records everything it receives and can simulate handshake
+cost, a slow uplink and a broken link.
+"""
+
+import json
+import time
+
+# Simulated link characteristics
+HANDSHAKE_TIME_MS = 300           # Cost of a TLS handshake
+UPLOAD_BYTES_PER_SEC = 0          # 0 = unlimited
+
+class FakeTelegramServer:
+    def __init__(self):
+        self.updates = []        # Pending incoming updates
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.next_file_id = 1
+        self.link_up = True
+        self.sent_messages = []  # (chat_id, text)
+        self.uploads = []        # (method, chat_id, bytes, reused file_id)
+        self.files = {}          # file_id -> size
+        self.stats = {"handshakes": 0, "requests": 0, "bytes_received": 0, "methods": {}}
+
+    def inject_message(self, chat_id, text, username="sim_user"):
+        """Queues an incoming text message, as if a user sent it to the bot"""
+        self.updates.append({
+            "update_id": self.next_update_id,
+            "message": {
+                "message_id": self.next_message_id,
+                "from": {"id": chat_id, "username": username},
+                "chat": {"id": chat_id, "type": "private"},
+                "date": int(time.time()),
+                "text": text
+            }
+        })
+        self.next_update_id += 1
+        self.next_message_id += 1
+
+    def has_updates(self, offset):
+        return any(u["update_id"] >= offset for u in self.updates)
+
+    def get_updates(self, offset, limit):
+        # Updates below the offset are confirmed and can be forgotten
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        return self.updates[:limit]
+
+    def handle(self, method, path, headers, body):
+        """Returns the JSON reply for one API request"""
+        api_method = path.split("?")[0].rsplit("/", 1)[-1]
+        query = _parse_query(path.split("?", 1)[1]) if "?" in path else {}
+
+        self.stats["requests"] += 1
+        self.stats["bytes_received"] += len(body)
+        self.stats["methods"][api_method] = self.stats["methods"].get(api_method, 0) + 1
+
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            fields = _parse_multipart(body, content_type.split("boundary=")[-1])
+        elif body:
+            fields = _parse_query(body.decode())
+        else:
+            fields = {}
+
+        if api_method == "getUpdates":
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", 100))
+            return {"ok": True, "result": self.get_updates(offset, limit)}
+
+        if api_method == "sendMessage":
+            self.sent_messages.append((fields.get("chat_id"), fields.get("text")))
+            return {"ok": True, "result": self._message(fields.get("chat_id"), text=fields.get("text"))}
+
+        if api_method in ("sendDocument", "sendPhoto", "sendVideo"):
+            return {"ok": True, "result": self._upload(api_method, fields, api_method[4:].lower())}
+
+        if api_method == "sendMediaGroup":
+            media = json.loads(fields.get("media", "[]"))
+            result = []
+            for item in media:
+                ref = item.get("media", "")
+                if ref.startswith("attach://"):
+                    item_fields = {"chat_id": fields.get("chat_id"), "document": fields.get(ref[9:], b"")}
+                else:
+                    item_fields = {"chat_id": fields.get("chat_id"), "document": ref}
+                result.append(self._upload(api_method, item_fields, "document"))
+            return {"ok": True, "result": result}
+
+        return {"ok": True, "result": True}
+
+    def _message(self, chat_id, **extra):
+        message = {"message_id": self.next_message_id, "chat": {"id": chat_id}, "date": int(time.time())}
+        message.update(extra)
+        self.next_message_id += 1
+        return message
+
+    def _upload(self, api_method, fields, field_name):
+        data = fields.get(field_name) or fields.get("document") or b""
+        if isinstance(data, bytes):
+            file_id = f"SIMFILE{self.next_file_id}"
+            self.next_file_id += 1
+            self.files[file_id] = len(data)
+            self.uploads.append((api_method, fields.get("chat_id"), len(data), None))
+        else:
+            file_id = data
+            self.uploads.append((api_method, fields.get("chat_id"), 0, data))
+        return self._message(fields.get("chat_id"), document={"file_id": file_id, "file_size": self.files.get(file_id, 0)})
+
+def _parse_query(text):
+    fields = {}
+    for pair in text.split("&"):
+        if "=" in pair:
+            key, value = pair.split("=", 1)
+            fields[key] = _unquote(value)
+    return fields
+
+def _unquote(value):
+    out = bytearray()
+    i = 0
+    raw = value.replace("+", " ").encode()
+    while i < len(raw):
+        if raw[i:i + 1] == b"%" and i + 2 < len(raw):
+            out.append(int(raw[i + 1:i + 3], 16))
+            i += 3
+        else:
+            out.append(raw[i])
+            i += 1
+    return out.decode("utf-8", "replace")
+
+def _parse_multipart(body, boundary):
+    """Returns text fields as str and file fields as bytes"""
+    fields = {}
+    for part in body.split(b"--" + boundary.encode()):
+        if b"\r\n\r\n" not in part:
+            continue
+        head, data = part.split(b"\r\n\r\n", 1)
+        if data.endswith(b"\r\n"):
+            data = data[:-2]
+        head = head.decode("utf-8", "replace")
+        if 'name="' not in head:
+            continue
+        name = head.split('name="', 1)[1].split('"', 1)[0]
+        fields[name] = data if "filename=" in head else data.decode("utf-8", "replace")
+    return fields
+
+class FakeTLSConnection:
+    """In-memory replacement of an ssl-wrapped socket connected to the server"""
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.blocking = sock.blocking
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.closed = False
+        self.close_after_reply = False
+        self.pending_poll = None  # (path, headers, deadline) of a long poll
+
+        server.stats["handshakes"] += 1
+        if not server.link_up:
+            raise OSError(113, "EHOSTUNREACH")
+        if HANDSHAKE_TIME_MS:
+            time.sleep(HANDSHAKE_TIME_MS / 1000)
+
+    def setblocking(self, flag):
+        self.blocking = flag
+
+    def write(self, data):
+        if self.closed or not self.server.link_up:
+            raise OSError(104, "ECONNRESET")
+        if isinstance(data, str):
+            data = data.encode()
+        data = bytes(data)
+        if UPLOAD_BYTES_PER_SEC:
+            time.sleep(len(data) / UPLOAD_BYTES_PER_SEC)
+        self.inbuf.extend(data)
+        self._process_requests()
+        return len(data)
+
+    def _process_requests(self):
+        while True:
+            header_end = self.inbuf.find(b"\r\n\r\n")
+            if header_end == -1:
+                return
+            lines = bytes(self.inbuf[:header_end]).decode("utf-8", "replace").split("\r\n")
+            method, path = lines[0].split(" ")[:2]
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if len(self.inbuf) < header_end + 4 + length:
+                return
+            body = bytes(self.inbuf[header_end + 4:header_end + 4 + length])
+            del self.inbuf[:header_end + 4 + length]
+
+            if headers.get("connection", "").lower() == "close":
+                self.close_after_reply = True
+
+            query = _parse_query(path.split("?", 1)[1]) if "?" in path else {}
+            timeout = int(query.get("timeout", 0))
+            if path.split("?")[0].endswith("/getUpdates") and timeout > 0:
+                offset = int(query.get("offset", 0))
+                if not self.server.has_updates(offset):
+                    # Long poll: the reply is produced by _check_poll()
+                    self.server.stats["requests"] += 1
+                    self.pending_poll = (path, headers, time.monotonic() + timeout)
+                    return
+
+            self._reply(self.server.handle(method, path, headers, body))
+
+    def _reply(self, result):
+        payload = json.dumps(result).encode()
+        head = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n" % len(payload)
+        head += "Connection: close\r\n\r\n" if self.close_after_reply else "Connection: keep-alive\r\n\r\n"
+        self.outbuf.extend(head.encode() + payload)
+
+    def _check_poll(self):
+        if self.pending_poll is None:
+            return
+        path, headers, deadline = self.pending_poll
+        offset = int(_parse_query(path.split("?", 1)[1]).get("offset", 0))
+        if self.server.has_updates(offset) or time.monotonic() >= deadline:
+            self.pending_poll = None
+            # Counted when the poll started
+            self.server.stats["requests"] -= 1
+            self._reply(self.server.handle("GET", path, headers, b""))
+
+    def readinto(self, buf, nbytes=None):
+        if not self.server.link_up:
+            raise OSError(104, "ECONNRESET")
+        self._check_poll()
+        if self.blocking:
+            while not self.outbuf and self.pending_poll:
+                time.sleep(0.01)
+                self._check_poll()
+        if not self.outbuf:
+            if self.closed or (self.close_after_reply and not self.pending_poll):
+                return 0
+            return None if not self.blocking else 0
+
+        n = min(len(buf), nbytes if nbytes is not None else len(buf), len(self.outbuf))
+        buf[:n] = self.outbuf[:n]
+        del self.outbuf[:n]
+        return n
+
+    def read(self, nbytes=-1):
+        buf = bytearray(nbytes if nbytes > 0 else max(len(self.outbuf), 1))
+        n = self.readinto(buf)
+        if n is None:
+            return None
+        return bytes(buf[:n])
+
+    def close(self):
+        self.closed = True
+
+class FakeSocket:
+    def __init__(self, family=2, *args):
+        self.blocking = True
+        self.connected = False
+
+    def connect(self, addr):
+        # Like lwIP: a non blocking connect() is in progress at the first
+        # call, and the next call reports it connected
+        if self.blocking or self.connected:
+            if self.connected and not self.blocking:
+                raise OSError(127, "EISCONN")
+            self.connected = True
+            return
+        self.connected = True
+        raise OSError(115, "EINPROGRESS")
+
+    def setblocking(self, flag):
+        self.blocking = flag
+
+    def settimeout(self, timeout):
+        self.blocking = timeout is None or timeout > 0
+
+    def close(self):
+        self.connected = False
+
+class FakeSocketModule:
+    AF_INET = 2
+    SOCK_STREAM = 1
+
+    def __init__(self, server):
+        self.server = server
+
+    def getaddrinfo(self, host, port, family=0, *args):
+        if not self.server.link_up:
+            raise OSError(-2, "Name resolution failed")
+        return [(self.AF_INET, self.SOCK_STREAM, 0, "", ("127.0.0.1", port))]
+
+    def socket(self, family=2, *args):
+        return FakeSocket(family)
+
+class FakeSSLModule:
+    def __init__(self, server):
+        self.server = server
+
+    def wrap_socket(self, sock, server_hostname=None, **kwargs):
+        return FakeTLSConnection(self.server, sock)
+
+def install(telegram_module, server=None):
+    """Points the socket/ssl references of lib/telegram.py to the fake server"""
+    if server is None:
+        server = FakeTelegramServer()
+    telegram_module.socket = FakeSocketModule(server)
+    telegram_module.ssl = FakeSSLModule(server)
+    return server
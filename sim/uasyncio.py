@@ -0,0 +1,29 @@
+"""MicroPython uasyncio API on top of CPython asyncio"""
+
+import asyncio
+from asyncio import Event, Lock, sleep, gather, wait_for, CancelledError, TimeoutError  # noqa
+
+_loop = None
+
+def get_event_loop():
+    global _loop
+
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+def new_event_loop():
+    global _loop
+
+    _loop = None
+    return get_event_loop()
+
+def create_task(coro):
+    return get_event_loop().create_task(coro)
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+def run(coro):
+    return get_event_loop().run_until_complete(coro)
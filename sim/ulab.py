@@ -0,0 +1,73 @@
+"""
+Fake ulab module
+
+Uses numpy when it is installed on the host. Otherwise a minimal pure-Python
+subset is provided, covering what the firmware uses (frombuffer, max, mean,
+abs and utils.spectrogram).
+"""
+
+import array
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class _Array(list):
+    def __abs__(self):
+        return _Array(abs(v) for v in self)
+
+class _PurePythonNumpy:
+    int16 = "h"
+    uint16 = "H"
+    uint8 = "B"
+    float = "f"
+
+    @staticmethod
+    def frombuffer(buffer, dtype="h"):
+        return _Array(array.array(dtype, bytes(buffer)))
+
+    @staticmethod
+    def array(values, dtype="f"):
+        return _Array(values)
+
+    @staticmethod
+    def zeros(size, dtype="f"):
+        return _Array([0] * size)
+
+    @staticmethod
+    def max(values):
+        return max(values)
+
+    @staticmethod
+    def min(values):
+        return min(values)
+
+    @staticmethod
+    def mean(values):
+        return sum(values) / len(values) if len(values) else 0.0
+
+class _Utils:
+    @staticmethod
+    def spectrogram(values):
+        # Magnitude of a naive DFT over the first 64 samples: enough to keep
+        # the audio path busy without numpy
+        n = min(64, len(values))
+        result = []
+        for k in range(n // 2):
+            re = sum(values[t] * math.cos(2 * math.pi * k * t / n) for t in range(n))
+            im = sum(values[t] * math.sin(2 * math.pi * k * t / n) for t in range(n))
+            result.append(math.sqrt(re * re + im * im))
+        return _Array(result)
+
+class _NumpyUtils:
+    @staticmethod
+    def spectrogram(values):
+        return numpy.abs(numpy.fft.fft(values))
+
+if numpy is not None:
+    utils = _NumpyUtils()
+else:
+    numpy = _PurePythonNumpy()
+    utils = _Utils()
@@ -0,0 +1,41 @@
+"""
+Fake VL53L1X time-of-flight sensor replaying a distance trace
+
+The trace is a text file with one distance in millimetres per line (CSV
+files are accepted: the last column is used). Readings loop over the trace;
+without a trace the sensor reports a constant DEFAULT_DISTANCE.
+"""
+
+DEFAULT_DISTANCE = 1000
+
+_trace = []
+_index = 0
+
+def load_trace(path):
+    global _trace, _index
+
+    _trace = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                _trace.append(int(float(line.split(",")[-1])))
+            except ValueError:
+                pass  # Header line
+    _index = 0
+
+class VL53L1X:
+    def __init__(self, i2c, address=0x29):
+        self.i2c = i2c
+        self.address = address
+
+    def read(self):
+        global _index
+
+        if not _trace:
+            return DEFAULT_DISTANCE
+        value = _trace[_index % len(_trace)]
+        _index += 1
+        return value
@@ -1,9 +1,13 @@
+import os
 import time
 import pyb
 import uasyncio as asyncio
 import logger
+import tracer
 import secrets_keys
-from telegram import TelegramBot
+from telegram import TelegramBot, PRIORITY_ALERT, PRIORITY_LOW
+from telegram_outbox import TelegramOutbox
+from motion_mask import parse_mask
 
 # LED for visual feedback
 green_led = pyb.LED(2)
@@ -18,6 +22,7 @@ class TelegramManager:
         """
         self.config = config
         self.bot = None
+        self.outbox = None  # Deliveries to retry, kept on flash
         self.cloud_manager = None
         self.debug = config.DEBUG
         self.authorized_users = secrets_keys.TELEGRAM_AUTHORIZED_USERS
@@ -25,16 +30,37 @@ class TelegramManager:
         # References to other managers (will be set by the main)
         self.photo_manager = None
         self.video_manager = None
+        self.event_pipeline = None
+        self.motion_heatmap = None
         
         # Flag to control initialization
         self.is_initialized = False
+
+        # Upload in progress (shown by /pipeline)
+        self.upload_path = None
+        self.upload_sent = 0
+        self.upload_total = 0
+        self.upload_next_report = 0
     
     def initialize(self):
         """Initializes the Telegram bot"""
         try:
             logger.info("Initializing the Telegram bot...")
-            self.bot = TelegramBot(secrets_keys.TELEGRAM_TOKEN, self._telegram_callback)
+            self.bot = TelegramBot(secrets_keys.TELEGRAM_TOKEN, self._telegram_callback,
+                                   upload_pool_size=self.config.TELEGRAM_UPLOAD_POOL_SIZE,
+                                   upload_idle_timeout_ms=self.config.TELEGRAM_UPLOAD_IDLE_TIMEOUT,
+                                   file_id_cache_size=self.config.TELEGRAM_FILE_ID_CACHE_SIZE,
+                                   upload_buffer_size=self.config.TELEGRAM_UPLOAD_BUFFER_SIZE,
+                                   long_poll_timeout=self.config.TELEGRAM_LONG_POLL_TIMEOUT,
+                                   updates_limit=self.config.TELEGRAM_UPDATES_LIMIT,
+                                   rbuf_max_size=self.config.TELEGRAM_RECEIVE_BUFFER_MAX,
+                                   outgoing_max_size=self.config.TELEGRAM_OUTGOING_MAX,
+                                   chat_interval_ms=self.config.TELEGRAM_CHAT_INTERVAL,
+                                   chat_burst=self.config.TELEGRAM_CHAT_BURST)
             self.bot.debug = self.config.DEBUG
+
+            if self.config.TELEGRAM_OUTBOX_ENABLED:
+                self.outbox = TelegramOutbox(self.config)
             
             # Signal initialization completion with LED
             for _ in range(3):
@@ -58,6 +84,8 @@ class TelegramManager:
         
         try:
             asyncio.create_task(self.bot.run())
+            if self.outbox:
+                asyncio.create_task(self._outbox_task())
             logger.info("Telegram bot started successfully")
             return True
         except Exception as e:
@@ -84,77 +112,294 @@ class TelegramManager:
         try:
             for chat_id in self.authorized_users:
                 if chat_id != "*":  # Ignore the asterisk
-                    self.bot.send_message(chat_id, "🟢 Nicla Vision monitoring system started and ready!")
+                    self.bot.send_message(chat_id, "🟢 Nicla Vision monitoring system started and ready!", PRIORITY_LOW)
             return True
         except Exception as e:
             logger.error(f"Error sending startup message: {e}")
             return False
     
-    def send_message_to_all(self, message):
-        """Sends a message to all authorized users"""
+    def send_message_to_all(self, message, priority=PRIORITY_ALERT):
+        """
+        Sends a message to all authorized users
+
+        Args:
+            message: Text of the message
+            priority: Queue priority (alerts are sent before command replies)
+        """
         if not self.is_initialized:
             return False
         
         try:
             for chat_id in self.authorized_users:
                 if chat_id != "*":  # Ignore the asterisk
-                    self.bot.send_message(chat_id, message)
+                    self.bot.send_message(chat_id, message, priority)
             return True
         except Exception as e:
             logger.error(f"Error sending message to all: {e}")
             return False
     
-    def send_photo_to_all(self, photo_path, caption=None):
-        """Sends a photo to all authorized users"""
+    async def send_photo_to_all(self, photo_path, caption=None, trace_id=0):
+        """
+        Sends a photo to all authorized users without blocking the event loop
+
+        Args:
+            photo_path: Path of the photo
+            caption: Optional description
+            trace_id: Event the uploads are traced to (0 = not traced)
+        """
         if not self.is_initialized or not self.config.SEND_PHOTOS_TELEGRAM:
             return False
         
         try:
             for chat_id in self.authorized_users:
                 if chat_id != "*":  # Ignore the asterisk
-                    self.bot.send_photo(chat_id, photo_path, caption)
+                    span_start = tracer.start()
+                    if not await self.send_file(chat_id, photo_path, caption, "photo"):
+                        self._keep_for_retry(chat_id, caption, photo_path=photo_path)
+                    tracer.record(tracer.SEND_PHOTO, span_start, trace_id)
             return True
         except Exception as e:
             logger.error(f"Error sending photo to all: {e}")
             return False
     
-    def send_video_to_all(self, video_path, caption=None):
-        """Sends a video to all authorized users"""
+    async def send_video_to_all(self, video_path, caption=None, trace_id=0):
+        """
+        Sends a video to all authorized users without blocking the event loop
+
+        Args:
+            video_path: Path of the video
+            caption: Optional description
+            trace_id: Event the uploads are traced to (0 = not traced)
+        """
         if not self.is_initialized or not self.config.SEND_VIDEOS_TELEGRAM:
             return False
         
         try:
             for chat_id in self.authorized_users:
                 if chat_id != "*":  # Ignore the asterisk
-                    self.bot.send_video(chat_id, video_path, caption)
+                    span_start = tracer.start()
+                    if not await self.send_file(chat_id, video_path, caption, "video"):
+                        self._keep_for_retry(chat_id, caption, video_path=video_path)
+                    tracer.record(tracer.SEND_VIDEO, span_start, trace_id)
             return True
         except Exception as e:
             logger.error(f"Error sending video to all: {e}")
             return False
     
-    def notify_motion_event(self, photo_path=None, video_path=None):
+    async def send_file(self, chat_id, path, caption=None, kind="photo"):
+        """
+        Uploads a photo or a video to one chat as an asyncio-friendly stream
+
+        Args:
+            chat_id: Chat ID
+            path: Path of the file
+            caption: Optional description
+            kind: "photo" or "video"
+
+        Returns:
+            bool: True if the file was sent, False otherwise
+        """
+        self.upload_path = path
+        self.upload_sent = 0
+        self.upload_total = 0
+        self.upload_next_report = 0
+        try:
+            return await self.bot.send_file_async(chat_id, path, caption, kind, progress=self._upload_progress,
+                                                  chunk_size=self.config.TELEGRAM_UPLOAD_CHUNK_SIZE)
+        finally:
+            self.upload_path = None
+
+    async def send_event_bundle(self, text, photo_path=None, video_path=None, trace_id=0):
+        """
+        Sends the text, photo and video of an event to all authorized users
+        as one album, with a single sendMediaGroup request per user
+
+        The text becomes the caption of the album. With only one file it is
+        its caption, with no file at all it is sent as a plain message.
+
+        Args:
+            text: Event description
+            photo_path: Path of the Telegram photo (optional)
+            video_path: Path of the video (optional)
+            trace_id: Event the uploads are traced to (0 = not traced)
+
+        Returns:
+            bool: True if every user got the event, False otherwise
+        """
+        files = []
+        if photo_path and self.config.SEND_PHOTOS_TELEGRAM:
+            files.append((photo_path, "photo"))
+        if video_path and self.config.SEND_VIDEOS_TELEGRAM:
+            files.append((video_path, "video"))
+        if not files:
+            return self.send_message_to_all(text)
+
+        success = True
+        for chat_id in self.authorized_users:
+            if chat_id != "*":  # Ignore the asterisk
+                span_start = tracer.start()
+                self.upload_path = files[-1][0]
+                self.upload_sent = 0
+                self.upload_total = 0
+                self.upload_next_report = 0
+                try:
+                    sent = await self.bot.send_media_group_async(chat_id, files, text, progress=self._upload_progress,
+                                                                 chunk_size=self.config.TELEGRAM_UPLOAD_CHUNK_SIZE)
+                finally:
+                    self.upload_path = None
+                tracer.record(tracer.SEND_BUNDLE, span_start, trace_id)
+                if not sent:
+                    # The album failed: retry it later, or at least get the alert through
+                    if not self._keep_for_retry(chat_id, text, photo_path, video_path):
+                        self.bot.send_message(chat_id, text, PRIORITY_ALERT)
+                    success = False
+        return success
+
+    def _keep_for_retry(self, chat_id, text, photo_path=None, video_path=None):
+        """
+        Records a failed delivery in the outbox
+
+        Files that can't be sent anyway (missing or too large) are not
+        retried.
+
+        Returns:
+            bool: True if the delivery was recorded, False otherwise
+        """
+        if not self.outbox:
+            return False
+        if photo_path and not self._sendable(photo_path, "photo"):
+            photo_path = None
+        if video_path and not self._sendable(video_path, "video"):
+            video_path = None
+        if not photo_path and not video_path:
+            return False
+        return self.outbox.add(chat_id, text, photo_path, video_path)
+
+    async def _outbox_task(self):
+        """Retries the deliveries recorded in the outbox, oldest first, with backoff"""
+        connected = False
+        while True:
+            # The bot connection is back: don't wait for the backoff delay
+            if not connected and not self.bot.reconnect:
+                self.outbox.reset_backoff()
+            connected = not self.bot.reconnect
+
+            entry = self.outbox.next_due()
+            if entry is None:
+                await asyncio.sleep_ms(1000)
+                continue
+
+            entry_id, chat_id, text, photo_path, video_path = entry
+            files = []
+            for path, kind in ((photo_path, "photo"), (video_path, "video")):
+                if path and self._sendable(path, kind):
+                    files.append((path, kind))
+
+            try:
+                if files:
+                    sent = await self.bot.send_media_group_async(chat_id, files, text or None, quiet=True,
+                                                                 chunk_size=self.config.TELEGRAM_UPLOAD_CHUNK_SIZE)
+                else:
+                    # The files were deleted by the FIFO cleanup meanwhile: only the text is left
+                    if text:
+                        self.bot.send_message(chat_id, text, PRIORITY_ALERT)
+                    sent = True
+            except Exception as e:
+                logger.error(f"Error retrying a Telegram delivery: {e}")
+                sent = False
+
+            if sent:
+                logger.info(f"Delayed Telegram delivery to {chat_id} completed")
+                self.outbox.done(entry_id)
+            else:
+                self.outbox.failed(entry_id)
+            await asyncio.sleep_ms(0)
+
+    def _sendable(self, path, kind):
+        """Returns True if the file exists and is not too large for Telegram"""
+        try:
+            return os.stat(path)[6] <= self.bot.max_file_size(kind)
+        except OSError:
+            return False
+
+    def _upload_progress(self, sent, total):
+        """Progress callback of the uploads"""
+        self.upload_sent = sent
+        self.upload_total = total
+        if sent >= self.upload_next_report:
+            self.upload_next_report = sent + self.config.TELEGRAM_UPLOAD_PROGRESS_STEP
+            logger.debug(f"Uploading {self.upload_path}: {sent // 1024}KB/{total // 1024}KB", verbose=True)
+
+    def send_instant_file(self, chat_id, path, caption, kind="photo"):
+        """Starts the upload of a file requested via command as a background task"""
+        asyncio.create_task(self._send_instant_file(chat_id, path, caption, kind))
+
+    async def _send_instant_file(self, chat_id, path, caption, kind):
+        try:
+            if await self.send_file(chat_id, path, caption, kind):
+                logger.info(f"Instant {kind} sent to chat_id {chat_id}")
+            else:
+                logger.error(f"Error sending the {kind}")
+                self.bot.send_message(chat_id, f"⚠️ Issues sending the {kind}, but it was captured", PRIORITY_LOW)
+        except Exception as e:
+            logger.error(f"Error sending instant {kind}: {e}")
+
+    def _camera_busy(self):
+        """Returns True while an event capture or a video owns the camera sensor"""
+        return self.video_manager is not None and self.video_manager.sensor_mode.busy()
+
+    async def _record_instant_video(self, chat_id):
+        """
+        Records a video requested via command, then uploads it
+
+        The caller acquires the sensor before creating the task, so the
+        ownership is released here once the recording is over.
+        """
+        sensor_mode = self.video_manager.sensor_mode
+        try:
+            try:
+                recorded = await self.video_manager.record_video("manual")
+            finally:
+                sensor_mode.release()
+
+            if recorded:
+                video_path = self.video_manager.last_video_path
+                logger.info(f"Instant video recorded: {video_path}")
+
+                self.bot.send_message(chat_id, "✅ Video successfully recorded!")
+                await self._send_instant_file(chat_id, video_path, "🎥 Instant video requested via Telegram", "video")
+            else:
+                self.bot.send_message(chat_id, "❌ Error: unable to record the video")
+        except Exception as e:
+            logger.error(f"Error recording instant video: {e}")
+            self.bot.send_message(chat_id, f"❌ Error during video recording: {e}")
+
+    async def notify_motion_event(self, photo_path=None, video_path=None, trace_id=0):
         """Notifies a motion detection event"""
         if not self.is_initialized:
             return False
             
         try:
+            if self.config.TELEGRAM_EVENT_BUNDLE:
+                return await self.send_event_bundle("🚨 Camera alert detected!", photo_path, video_path, trace_id)
+
             # Send text message
             self.send_message_to_all("🚨 Camera alert detected!")
             
             # Send photo if available and photo sending is enabled
             if photo_path and self.config.SEND_PHOTOS_TELEGRAM:
-                self.send_photo_to_all(photo_path, "📸 Camera detection photo")
+                await self.send_photo_to_all(photo_path, "📸 Camera detection photo", trace_id)
             
             # Send video if available and video sending is enabled
             if video_path and self.config.SEND_VIDEOS_TELEGRAM:
-                self.send_video_to_all(video_path, "🎥 Camera detection video")
+                await self.send_video_to_all(video_path, "🎥 Camera detection video", trace_id)
                 
             return True
         except Exception as e:
             logger.error(f"⚠️ Error 1 Camera Detection. Please try again.\nIf the problem persists, please report to @destone28, sending screenshot of the last messages with this bot.")
             return False
     
-    def notify_audio_event(self, level, photo_path=None, video_path=None):
+    async def notify_audio_event(self, level, photo_path=None, video_path=None, trace_id=0):
         """
         Notifica un evento di rilevazione audio con gestione ottimizzata.
         Questa funzione segue lo stesso pattern di notify_motion_event e notify_distance_event.
@@ -163,6 +408,7 @@ class TelegramManager:
             level: Livello audio rilevato
             photo_path: Percorso della foto (opzionale)
             video_path: Percorso del video (opzionale)
+            trace_id: Evento a cui attribuire gli upload (0 = non tracciati)
         
         Returns:
             bool: True se la notifica è stata inviata con successo, False altrimenti
@@ -171,15 +417,18 @@ class TelegramManager:
             return False
             
         try:
+            if self.config.TELEGRAM_EVENT_BUNDLE:
+                return await self.send_event_bundle(f"🔊 Audio detection - Level: {level}", photo_path, video_path, trace_id)
+
             # Invia la foto se disponibile e se l'invio foto è abilitato
             photo_sent = True
             if photo_path and self.config.SEND_PHOTOS_TELEGRAM:
                 caption = f"🔊 Audio detection photo - Level: {level}"
-                photo_sent = self.send_photo_to_all(photo_path, caption)
+                photo_sent = await self.send_photo_to_all(photo_path, caption, trace_id)
                 
                 # Pausa prima dell'invio del video
                 if photo_sent and video_path:
-                    time.sleep(0.5)
+                    await asyncio.sleep(0.5)
             
             # Invia il video se disponibile e se l'invio video è abilitato
             video_sent = True
@@ -187,38 +436,59 @@ class TelegramManager:
                 
                 # Invia il video effettivo
                 caption = f"🎥 Sound detection video - Level: {level}"
-                video_sent = self.send_video_to_all(video_path, caption)
+                video_sent = await self.send_video_to_all(video_path, caption, trace_id)
             
             # Restituisci lo stato complessivo dell'operazione
-            return success and photo_sent and video_sent
+            return photo_sent and video_sent
             
         except Exception as e:
             logger.error(f"Error sending audio event notification: {e}")
             return False
     
-    def notify_distance_event(self, distance, photo_path=None, video_path=None):
+    async def notify_distance_event(self, distance, photo_path=None, video_path=None, trace_id=0):
         """Notifies a distance variation detection event"""
         if not self.is_initialized:
             return False
             
         try:
+            if self.config.TELEGRAM_EVENT_BUNDLE:
+                return await self.send_event_bundle(f"📏 Distance variation: {int(distance)}mm", photo_path, video_path, trace_id)
+
             # Send text message
             self.send_message_to_all(f"📏 Distance variation: {int(distance)}mm")
             
             # Send photo if available and photo sending is enabled
             if photo_path and self.config.SEND_PHOTOS_TELEGRAM:
-                self.send_photo_to_all(photo_path, f"📏 Distance variation photo: {int(distance)}mm")
+                await self.send_photo_to_all(photo_path, f"📏 Distance variation photo: {int(distance)}mm", trace_id)
             
             # Send video if available and video sending is enabled
             if video_path and self.config.SEND_VIDEOS_TELEGRAM:
                 self.send_message_to_all("🎥 Distance video recording completed!")
-                self.send_video_to_all(video_path, f"🎥 Distance variation video: {int(distance)}mm")
+                await self.send_video_to_all(video_path, f"🎥 Distance variation video: {int(distance)}mm", trace_id)
                 
             return True
         except Exception as e:
             logger.error(f"Error notifying distance event: {e}")
             return False
     
+    def format_stats(self):
+        """Returns the polling and upload statistics as readable lines"""
+        if not self.bot:
+            return "📡 Uploads: bot not initialized"
+        s = self.bot.upload_pool.get_stats()
+        cache = self.bot.file_ids
+        out = self.bot.outgoing
+        outbox = "\n" + self.outbox.format_stats() if self.outbox else ""
+        if self.upload_path and self.upload_total:
+            uploading = f"uploading {self.upload_path} {self.upload_sent * 100 // self.upload_total}%; "
+        else:
+            uploading = ""
+        return (f"📡 Uploads: {uploading}{s['requests']} requests, {s['handshakes']} TLS handshakes, "
+                f"reuse {s['reuse_ratio'] * 100:.0f}%, {s['failures']} dropped connections, {s['idle']} idle; "
+                f"file_id reuse {cache.hits}/{cache.hits + cache.misses} ({cache.bytes_saved // 1024}KB not re-uploaded)\n"
+                f"💬 Bot: {self.bot.polls} polls, {self.bot.updates} updates received ({self.bot.skipped_updates} too large), {self.bot.messages_sent} messages sent; "
+                f"outbox {len(out)}/{out.max_size}, {out.coalesced} coalesced, {out.dropped} dropped, {out.deferred} rate-limit waits{outbox}")
+
     def set_cloud_manager(self, cloud_manager):
         """Sets the reference to the cloud manager"""
         self.cloud_manager = cloud_manager
@@ -230,6 +500,14 @@ class TelegramManager:
     def set_video_manager(self, video_manager):
         """Sets the reference to the video manager"""
         self.video_manager = video_manager
+
+    def set_event_pipeline(self, event_pipeline):
+        """Sets the reference to the event pipeline"""
+        self.event_pipeline = event_pipeline
+
+    def set_motion_heatmap(self, motion_heatmap):
+        """Sets the reference to the motion heatmap"""
+        self.motion_heatmap = motion_heatmap
     
     def _telegram_callback(self, bot, msg_type, chat_name, sender_name, chat_id, text, entry):
         """
@@ -286,6 +564,11 @@ class TelegramManager:
                     - `/set_audio_threshold X` - Set audio threshold (%) (0-100)\n
                     - `/set_distance_threshold X` - Set distance threshold (mm) (50-2000)\n
                     \n
+                    Motion Mask\n
+                    - `/motion_mask` - Show the area watched by the camera\n
+                    - `/set_motion_mask MASK` - Watch only part of the frame, e.g. `roi 0,30,100,70; exclude 80,0,20,40` (percent)\n
+                    - `/set_motion_mask clear` - Watch the whole frame\n
+                    \n
                     Video Settings\n
                     - `/set_video_duration X` - Set video duration in seconds (3-30)\n
                     - `/set_video_fps X` - Set frames per second (5-15)\n
@@ -299,7 +582,10 @@ class TelegramManager:
                     - `/set_audio_gain X` - Set audio gain in dB (0-48)\n
                     \n
                     Other Information\n
-                    - `/show_settings` - Show all current settings\n"""
+                    - `/show_settings` - Show all current settings\n
+                    - `/pipeline` - Show event pipeline queue statistics\n
+                    - `/latency` - Show per-stage latency of detection events (p50/p95/max)\n
+                    - `/heatmap` - Show where and when the camera saw motion\n"""
                 )
 
             # Status command
@@ -435,7 +721,28 @@ class TelegramManager:
             elif text.startswith("/set_distance_threshold "):
                 self._set_threshold(bot, chat_id, "distance", text)
 
+            # Motion mask
+            elif text == "/motion_mask":
+                bot.send_message(chat_id, f"🎯 Motion mask: {self.config.MOTION_MASK or 'whole frame'}")
+
+            elif text.startswith("/set_motion_mask "):
+                mask = text.split(" ", 1)[1].strip()
+                if mask == "clear":
+                    mask = ""
+                try:
+                    parse_mask(mask)
+                    self.config.MOTION_MASK = mask
+                    bot.send_message(chat_id, f"🎯 Motion mask set to {mask or 'whole frame'}")
+                    logger.info(f"Motion mask changed to '{mask}' via Telegram")
+                    if self.cloud_manager:
+                        self.cloud_manager.sync_to_cloud()
+                except ValueError as e:
+                    bot.send_message(chat_id, f"❌ Invalid motion mask: {e}\nExample: roi 0,30,100,70; exclude 80,0,20,40")
+
             # Instant photo command
+            elif (text == "/photo" or text == "/foto") and self._camera_busy():
+                bot.send_message(chat_id, "⏳ The camera is recording an event, try again in a few seconds")
+
             elif text == "/photo" or text == "/foto":
                 bot.send_message(chat_id, "📸 Taking an instant photo...")
 
@@ -445,14 +752,8 @@ class TelegramManager:
                         photo_path = self.photo_manager.last_photo_path
                         logger.info(f"Instant photo taken: {photo_path}")
 
-                        # Send the photo directly using the blocking method
-                        success = bot.send_photo(chat_id, photo_path, "📷 Instant photo requested via Telegram")
-
-                        if success:
-                            logger.info(f"Instant photo sent to chat_id {chat_id}")
-                        else:
-                            logger.error("Error sending the photo")
-                            bot.send_message(chat_id, "⚠️ Issues sending the photo, but the image was captured")
+                        # Upload in the background, the bot loop keeps running
+                        self.send_instant_file(chat_id, photo_path, "📷 Instant photo requested via Telegram", "photo")
                     else:
                         bot.send_message(chat_id, "❌ Error: unable to take the photo")
                 except Exception as e:
@@ -491,26 +792,17 @@ class TelegramManager:
 
             # Instant video command
             elif text == "/video":
-                try:
-                    if self.video_manager and self.video_manager.record_video("manual"):
-                        video_path = self.video_manager.last_video_path
-                        logger.info(f"Instant video recorded: {video_path}")
-
-                        bot.send_message(chat_id, "✅ Video successfully recorded!")
-
-                        # Send the video
-                        success = bot.send_video(chat_id, video_path, "🎥 Instant video requested via Telegram")
-
-                        if success:
-                            logger.info(f"Instant video sent to chat_id {chat_id}")
-                        else:
-                            logger.error("Error sending the video")
-                            bot.send_message(chat_id, "⚠️ Issues sending the video, but the recording was completed")
-                    else:
-                        bot.send_message(chat_id, "❌ Error: unable to record the video")
-                except Exception as e:
-                    logger.error(f"Error recording instant video: {e}")
-                    bot.send_message(chat_id, f"❌ Error during video recording: {e}")
+                if self._camera_busy():
+                    bot.send_message(chat_id, "⏳ The camera is recording an event, try again in a few seconds")
+                elif self.video_manager:
+                    # Recorded in the background, the bot loop keeps running.
+                    # The sensor is owned right away, so a second /video of the
+                    # same batch or an event capture sees it busy before the
+                    # task starts.
+                    self.video_manager.sensor_mode.acquire()
+                    asyncio.create_task(self._record_instant_video(chat_id))
+                else:
+                    bot.send_message(chat_id, "❌ Error: unable to record the video")
 
             # Parameter settings
             elif text.startswith("/set_video_duration "):
@@ -549,6 +841,31 @@ class TelegramManager:
             elif text.startswith("/set_max_telegram_photos "):
                 self._set_parameter(bot, chat_id, "max_telegram_photos", text)
 
+            # Latency of the event path
+            elif text == "/latency":
+                bot.send_message(chat_id, tracer.format_summary())
+
+            # Event pipeline statistics
+            elif text == "/pipeline":
+                if self.event_pipeline:
+                    bot.send_message(chat_id, self.event_pipeline.format_stats())
+                else:
+                    bot.send_message(chat_id, "❌ Event pipeline not available")
+
+            elif text == "/heatmap":
+                heatmap = self.motion_heatmap
+                if not heatmap:
+                    bot.send_message(chat_id, "❌ Motion heatmap not available")
+                elif not heatmap.frames:
+                    bot.send_message(chat_id, "🔥 No frames analysed yet (the heatmap needs the blocks or background detection mode)")
+                else:
+                    # Saved with the periodic heatmaps, the /photo images are left alone
+                    path = heatmap.save_snapshot()
+                    if path:
+                        self.send_instant_file(chat_id, path, heatmap.format_summary(), "photo")
+                    else:
+                        bot.send_message(chat_id, "❌ Error rendering the motion heatmap")
+
             # Show settings
             elif text == "/show_settings":
                 settings_report = self._generate_settings_report()
@@ -869,6 +1186,7 @@ class TelegramManager:
             # Threshold settings
             report.append("**Threshold Settings:**")
             report.append(f"- Camera Threshold: {self.config.MOTION_THRESHOLD}% (min: {self.config.MOTION_THRESHOLD_MIN}, max: {self.config.MOTION_THRESHOLD_MAX})")
+            report.append(f"- Motion Mask: {self.config.MOTION_MASK or 'whole frame'}")
             report.append(f"- Audio Threshold: {self.config.SOUND_THRESHOLD} (min: {self.config.SOUND_THRESHOLD_MIN}, max: {self.config.SOUND_THRESHOLD_MAX})")
             report.append(f"- Distance Threshold: {self.config.DISTANCE_THRESHOLD}mm (min: {self.config.DISTANCE_THRESHOLD_MIN}, max: {self.config.DISTANCE_THRESHOLD_MAX})")
             report.append(f"- Inhibition Period: {self.config.INHIBIT_PERIOD}s (min: {self.config.INHIBIT_PERIOD_MIN}, max: {self.config.INHIBIT_PERIOD_MAX})")
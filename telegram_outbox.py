@@ -0,0 +1,239 @@
+import os
+import time
+import struct
+import logger
+
+# Journal records: header, then the payload of the ADD records
+RECORD_MAGIC = 0xA5
+RECORD_ADD = 1    # A delivery to make (payload: chat id, text, photo, video)
+RECORD_DONE = 2   # A delivery completed or dropped (no payload)
+HEADER_FORMAT = "<BBHIH"  # magic, op, payload length, delivery id, payload checksum
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# The journal is rewritten when it holds this many records more than the pending deliveries
+COMPACT_SLACK = 32
+
+def _checksum(payload):
+    return sum(payload) & 0xFFFF
+
+def _pack_fields(fields):
+    """Packs strings as length-prefixed UTF-8"""
+    payload = bytearray()
+    for field in fields:
+        data = (field or "").encode()
+        payload.extend(struct.pack("<H", len(data)))
+        payload.extend(data)
+    return payload
+
+def _unpack_fields(payload, count):
+    """Inverse of _pack_fields(), raises ValueError if the payload is malformed"""
+    fields = []
+    pos = 0
+    for _ in range(count):
+        if pos + 2 > len(payload):
+            raise ValueError("truncated field")
+        length = struct.unpack_from("<H", payload, pos)[0]
+        pos += 2
+        if pos + length > len(payload):
+            raise ValueError("truncated field")
+        fields.append(bytes(payload[pos:pos + length]).decode())
+        pos += length
+    return fields
+
+class TelegramOutbox:
+    def __init__(self, config):
+        """
+        Durable queue of the Telegram deliveries that failed
+
+        Every delivery (chat, text, photo, video) is appended to a binary
+        journal on flash and marked as done by a second record once sent,
+        so pending deliveries survive WiFi drops and reboots without
+        rescanning the alert folders. The journal is replayed at startup
+        and compacted through a temporary file when it grows.
+
+        Args:
+            config: System configuration
+        """
+        self.config = config
+        self.path = config.TELEGRAM_OUTBOX_FILE
+        self.tmp_path = self.path + ".tmp"
+        self.max_entries = config.TELEGRAM_OUTBOX_MAX_ENTRIES
+
+        self.pending = []     # [id, chat_id, text, photo, video], oldest first
+        self.next_id = 1
+        self.records = 0      # Records currently in the journal
+
+        # Retry schedule of the oldest delivery
+        self.attempts = 0
+        self.retry_delay = config.TELEGRAM_OUTBOX_RETRY_MIN
+        self.next_retry = time.ticks_ms()
+
+        # Statistics
+        self.added = 0
+        self.delivered = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+        self.load()
+
+    def load(self):
+        """Replays the journal, dropping a torn or corrupt tail"""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+
+        pending = {}
+        pos = 0
+        valid = True
+        while pos < len(data):
+            if pos + HEADER_SIZE > len(data):
+                valid = False
+                break
+            magic, op, length, entry_id, checksum = struct.unpack_from(HEADER_FORMAT, data, pos)
+            payload = data[pos + HEADER_SIZE:pos + HEADER_SIZE + length]
+            if magic != RECORD_MAGIC or len(payload) != length or _checksum(payload) != checksum:
+                valid = False
+                break
+            try:
+                if op == RECORD_ADD:
+                    pending[entry_id] = [entry_id] + _unpack_fields(payload, 4)
+                elif op == RECORD_DONE:
+                    pending.pop(entry_id, None)
+                else:
+                    raise ValueError("unknown record")
+            except (ValueError, UnicodeError):
+                valid = False
+                break
+            if entry_id >= self.next_id:
+                self.next_id = entry_id + 1
+            self.records += 1
+            pos += HEADER_SIZE + length
+
+        self.pending = sorted(pending.values(), key=lambda entry: entry[0])
+        if not valid:
+            logger.warning(f"Telegram outbox damaged at byte {pos}, keeping {len(self.pending)} deliveries")
+            self.compact()
+        elif self.pending:
+            logger.info(f"Telegram outbox: {len(self.pending)} deliveries pending")
+
+    def _append(self, op, entry_id, payload=b""):
+        """Appends a record to the journal"""
+        try:
+            with open(self.path, "ab") as f:
+                f.write(struct.pack(HEADER_FORMAT, RECORD_MAGIC, op, len(payload), entry_id, _checksum(payload)))
+                f.write(payload)
+            self.records += 1
+        except OSError as e:
+            logger.error(f"Error writing Telegram outbox: {e}")
+            return False
+
+        if self.records > len(self.pending) + COMPACT_SLACK:
+            self.compact()
+        return True
+
+    def compact(self):
+        """Rewrites the journal with only the pending deliveries"""
+        try:
+            with open(self.tmp_path, "wb") as f:
+                for entry in self.pending:
+                    payload = _pack_fields(entry[1:])
+                    f.write(struct.pack(HEADER_FORMAT, RECORD_MAGIC, RECORD_ADD, len(payload), entry[0], _checksum(payload)))
+                    f.write(payload)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            os.rename(self.tmp_path, self.path)
+            self.records = len(self.pending)
+            logger.debug(f"Telegram outbox compacted: {self.records} deliveries", verbose=True)
+        except Exception as e:
+            logger.error(f"Error compacting Telegram outbox: {e}")
+
+    def add(self, chat_id, text, photo_path=None, video_path=None):
+        """
+        Records a delivery to retry later
+
+        The same delivery is recorded only once. When the outbox is full
+        the oldest delivery is dropped.
+
+        Returns:
+            bool: True if the delivery was recorded, False otherwise
+        """
+        fields = [str(chat_id), text or "", photo_path or "", video_path or ""]
+        for entry in self.pending:
+            if entry[1:] == fields:
+                self.duplicates += 1
+                return True
+
+        if len(self.pending) >= self.max_entries:
+            oldest = self.pending[0]
+            logger.warning(f"Telegram outbox full, dropping the delivery of {oldest[3] or oldest[4] or oldest[2]}")
+            self.done(oldest[0], delivered=False)
+
+        # In the list before the write, in case the write compacts the journal
+        entry = [self.next_id] + fields
+        self.pending.append(entry)
+        if not self._append(RECORD_ADD, entry[0], _pack_fields(fields)):
+            self.pending.pop()
+            return False
+        self.next_id += 1
+        self.added += 1
+        if len(self.pending) == 1:
+            self.reset_backoff()
+        return True
+
+    def done(self, entry_id, delivered=True):
+        """Marks a delivery as completed (or dropped)"""
+        for i in range(len(self.pending)):
+            if self.pending[i][0] == entry_id:
+                del self.pending[i]
+                break
+        else:
+            return
+        if delivered:
+            self.delivered += 1
+        else:
+            self.dropped += 1
+        if i == 0:
+            # The next delivery starts its own retry schedule
+            self.reset_backoff()
+        self._append(RECORD_DONE, entry_id)
+
+    def next_due(self):
+        """
+        Returns the oldest pending delivery if its retry time has come
+
+        Returns:
+            list: [id, chat_id, text, photo_path, video_path] or None
+        """
+        if not self.pending or time.ticks_diff(time.ticks_ms(), self.next_retry) < 0:
+            return None
+        return self.pending[0]
+
+    def failed(self, entry_id):
+        """Schedules the next attempt of a delivery, doubling the delay"""
+        self.attempts += 1
+        if self.attempts >= self.config.TELEGRAM_OUTBOX_MAX_ATTEMPTS:
+            logger.warning(f"Telegram delivery dropped after {self.attempts} attempts")
+            self.done(entry_id, delivered=False)
+            return
+        self.next_retry = time.ticks_add(time.ticks_ms(), self.retry_delay)
+        self.retry_delay = min(self.retry_delay * 2, self.config.TELEGRAM_OUTBOX_RETRY_MAX)
+
+    def reset_backoff(self):
+        """Lets the next delivery be attempted right away"""
+        self.attempts = 0
+        self.retry_delay = self.config.TELEGRAM_OUTBOX_RETRY_MIN
+        self.next_retry = time.ticks_ms()
+
+    def format_stats(self):
+        """Returns the outbox statistics as a readable line"""
+        if self.pending:
+            wait = max(0, time.ticks_diff(self.next_retry, time.ticks_ms())) // 1000
+            retry = f", next attempt in {wait}s (attempt {self.attempts + 1})"
+        else:
+            retry = ""
+        return (f"📮 Outbox: {len(self.pending)}/{self.max_entries} pending{retry}, "
+                f"{self.added} recorded, {self.delivered} delivered later, {self.duplicates} duplicates, {self.dropped} dropped")
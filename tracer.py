@@ -0,0 +1,163 @@
+import time
+from array import array
+from config import Config
+
+# Stages traced along the event path (index into STAGE_NAMES)
+DETECT = 0         # Detector check that produced the event
+QUEUE = 1          # Wait in the detection queue before the capture stage
+SENSOR_MODE = 2    # Sensor reconfiguration before a capture
+SNAPSHOT = 3       # sensor.snapshot() of a photo
+JPEG_SAVE = 4      # JPEG compression and write to flash
+MANAGE_FILES = 5   # FIFO cleanup of a directory
+CLOUD_NOTIFY = 6   # Cloud variables update for the event
+VIDEO_START = 7    # From the recording request to the first frame written
+VIDEO_STOP = 8     # Closing the MJPEG file
+SEND_PHOTO = 9     # One Telegram photo upload
+SEND_VIDEO = 10    # One Telegram video upload
+SEND_BUNDLE = 11   # One Telegram album (text, photo and video of an event)
+TOTAL = 12         # From the detection to the end of the Telegram delivery
+
+STAGE_NAMES = ("detect", "queue", "sensor_mode", "snapshot", "jpeg_save", "manage_files",
+               "cloud_notify", "video_start", "video_stop", "send_photo", "send_video", "send_bundle", "total")
+
+# Number of events whose start time is remembered for the TOTAL span
+EVENT_SLOTS = 8
+
+# Span ring, preallocated so that tracing never allocates on the event path
+_size = Config.TRACE_RING_SIZE
+_span_event = array("I", [0] * _size)   # Event id of the span (0 = free slot)
+_span_stage = array("B", [0] * _size)   # Stage of the span
+_span_us = array("I", [0] * _size)      # Duration in microseconds
+_next = 0                               # Next slot to overwrite
+_spans = 0                              # Spans recorded since startup
+
+# Start time of the most recent events, indexed by event id % EVENT_SLOTS
+_event_start = array("I", [0] * EVENT_SLOTS)
+_event_ids = array("I", [0] * EVENT_SLOTS)
+
+_last_event = 0      # Last event id assigned
+_current_event = 0   # Event the nested spans are attributed to (0 = none)
+
+def start():
+    """Returns the start stamp of a span"""
+    return time.ticks_us()
+
+def new_event(start_us=None):
+    """
+    Assigns an id to a new event and makes it the current one
+
+    Args:
+        start_us: ticks_us() stamp of the detection (default: now)
+
+    Returns:
+        int: Event id
+    """
+    global _last_event, _current_event
+
+    _last_event = (_last_event % 0x7FFFFFFF) + 1
+    slot = _last_event % EVENT_SLOTS
+    _event_ids[slot] = _last_event
+    _event_start[slot] = start_us if start_us is not None else time.ticks_us()
+    _current_event = _last_event
+    return _last_event
+
+def set_event(event_id):
+    """Attributes the following spans to an event (0 stops attributing them)"""
+    global _current_event
+    _current_event = event_id
+
+def current_event():
+    """Returns the event the following spans are attributed to (0 = none)"""
+    return _current_event
+
+def clear_event():
+    """Stops attributing spans to the current event"""
+    global _current_event
+    _current_event = 0
+
+def record(stage, start_us, event_id=None):
+    """
+    Records a span that started at start_us and ends now
+
+    Spans outside of an event (e.g. an instant photo requested via
+    Telegram) are not recorded.
+
+    Args:
+        stage: Stage constant (DETECT, SNAPSHOT, ...)
+        start_us: Value returned by start()
+        event_id: Event of the span (default: the current event)
+    """
+    global _next, _spans
+
+    if not Config.TRACE_ENABLED:
+        return
+    if event_id is None:
+        event_id = _current_event
+    if not event_id:
+        return
+
+    duration = time.ticks_diff(time.ticks_us(), start_us)
+    _span_event[_next] = event_id
+    _span_stage[_next] = stage
+    _span_us[_next] = duration if duration > 0 else 0
+    _next = (_next + 1) % _size
+    _spans += 1
+
+def finish_event(event_id):
+    """Records the TOTAL span of an event, from its detection to now"""
+    slot = event_id % EVENT_SLOTS
+    # The start time was overwritten by a newer event
+    if _event_ids[slot] != event_id:
+        return
+    record(TOTAL, _event_start[slot], event_id)
+
+def span_count():
+    """Returns the number of spans recorded since startup"""
+    return _spans
+
+def _percentile(values, p):
+    # Nearest-rank percentile of a sorted list
+    index = (len(values) * p + 99) // 100 - 1
+    return values[index if index > 0 else 0]
+
+def summary():
+    """
+    Computes the latency distribution of every stage in the ring
+
+    Returns:
+        dict: stage name -> (count, p50_us, p95_us, max_us)
+    """
+    durations = [[] for _ in STAGE_NAMES]
+    for i in range(_size):
+        if _span_event[i]:
+            durations[_span_stage[i]].append(_span_us[i])
+
+    result = {}
+    for stage, values in enumerate(durations):
+        if values:
+            values.sort()
+            result[STAGE_NAMES[stage]] = (len(values), _percentile(values, 50), _percentile(values, 95), values[-1])
+    return result
+
+def format_summary():
+    """Returns the latency summary as a readable report"""
+    stats = summary()
+    if not stats:
+        return "⏱️ No latency traces recorded yet"
+
+    report = [f"⏱️ **Latency per stage** (last {min(_spans, _size)} spans, p50/p95/max)"]
+    for name in STAGE_NAMES:
+        if name in stats:
+            count, p50, p95, peak = stats[name]
+            report.append(f"- {name}: {p50 // 1000}/{p95 // 1000}/{peak // 1000} ms (n={count})")
+    return "\n".join(report)
+
+def format_compact():
+    """Returns the latency summary in one line (ms), e.g. for a cloud variable"""
+    stats = summary()
+    parts = []
+    for name in STAGE_NAMES:
+        if name in stats:
+            count, p50, p95, peak = stats[name]
+            parts.append(f"{name}:{p50 // 1000}/{p95 // 1000}/{peak // 1000}")
+    return " ".join(parts)
@@ -4,25 +4,29 @@ import mjpeg
 import os
 import gc
 import pyb
+import uasyncio as asyncio
 import logger
+import tracer
 
 # LEDs for debugging
 red_led = pyb.LED(1)
 blue_led = pyb.LED(3)
 
 class VideoManager:
-    def __init__(self, config, file_manager):
+    def __init__(self, config, file_manager, sensor_mode, preroll=None):
         """
         Video manager responsible for recording and saving videos
         
         Args:
             config: System configuration
             file_manager: Reference to the file manager
+            sensor_mode: Shared SensorModeManager owning the camera sensor
+            preroll: Optional PrerollBuffer flushed at the start of each video
         """
         self.config = config
         self.file_manager = file_manager
-        self.camera_enabled = False
-        self.current_mode = None  # No initial mode
+        self.sensor_mode = sensor_mode
+        self.preroll = preroll
         self.last_video_path = None  # Tracks the last saved video
         self.telegram_manager = None  # Will be set by the main program
         
@@ -31,42 +35,49 @@ class VideoManager:
         self.file_manager.ensure_directory("audio_videos")
         self.file_manager.ensure_directory("distance_videos")
         
-        # Initial attempt to initialize the camera
-        try:
-            sensor.reset()
-            self.camera_enabled = True
+        # The sensor is reset once by the mode manager
+        self.camera_enabled = sensor_mode.available or sensor_mode.init()
+        if self.camera_enabled:
             logger.info("Camera available for VideoManager")
-        except Exception as e:
-            logger.error(f"Error initializing camera in VideoManager: {e}")
+        else:
+            logger.error("Error initializing camera in VideoManager")
     
     def init_camera_for_video(self):
-        """Initializes the camera for video recording (RGB565)"""
+        """Initializes the camera for video recording (RGB565, or GRAYSCALE with the pre-roll)"""
         if not self.camera_enabled:
             logger.warning("Camera not available for video")
             return False
-            
-        try:
-            sensor.reset()
-            sensor.set_pixformat(sensor.RGB565)  # RGB565 for video
-            sensor.set_framesize(sensor.QVGA)    # QVGA (320x240) for video
-            sensor.set_vflip(False)
-            sensor.set_hmirror(True)
-            sensor.skip_frames(time=1000)  # Wait for stabilization
-            
-            self.current_mode = "video"
-            logger.info("Camera initialized for video recording")
-            return True
-        except Exception as e:
-            logger.error(f"Camera video error: {e}")
+
+        # RGB565 QVGA (320x240) for video, stabilization only if the format changes.
+        # With the pre-roll the live frames must match the buffered ones, which
+        # come from the grayscale motion frames: same format and size, so the
+        # clip doesn't turn from gray to colour at the trigger (and the sensor
+        # is already in that mode).
+        if self.preroll:
+            pixformat, framesize = sensor.GRAYSCALE, self.config.FRAME_SIZE
+        else:
+            pixformat, framesize = sensor.RGB565, sensor.QVGA
+        if not self.sensor_mode.set_mode("video", pixformat, framesize, legacy_settle_ms=1000):
+            logger.error("Camera video error")
             return False
+            
+        logger.info("Camera initialized for video recording")
+        return True
     
-    def record_video(self, event_type, extra_info=None):
+    async def record_video(self, event_type, extra_info=None, manage_files=True, restore_mode=True, trace_id=None):
         """
         Records a video and saves it in the appropriate directory
-        
+
+        The frames are paced with asyncio.sleep_ms(), so the other tasks
+        (detectors, bot, pipeline stages) keep running during the clip.
+
         Args:
             event_type: Type of event ("camera", "audio", "distance")
             extra_info: Additional information to include in the file name
+            manage_files: If False, the FIFO cleanup is left to the caller
+            restore_mode: If False, the caller restores the previous sensor mode
+            trace_id: Tracer event of the recording (default: the current event
+                      when the recording starts, other tasks may change it later)
             
         Returns:
             bool: True if the video was recorded and saved, False otherwise
@@ -76,7 +87,13 @@ class VideoManager:
             return False
             
         # Store the current mode to restore it later
-        prev_mode = self.current_mode
+        prev_state = self.sensor_mode.get_state()
+        span_start = tracer.start()
+        if trace_id is None:
+            trace_id = tracer.current_event()
+
+        # The sensor stays in video mode while other tasks run between frames
+        self.sensor_mode.acquire()
         
         try:
             # Initialize the camera for video
@@ -116,8 +133,15 @@ class VideoManager:
             # Create the Mjpeg object
             video = mjpeg.Mjpeg(filename)
             
+            # Start with the frames buffered before the trigger
+            if self.preroll:
+                repeat = max(1, self.config.VIDEO_FPS // self.config.PREROLL_FPS)
+                preroll_frames = self.preroll.flush_into(video, repeat)
+                logger.info(f"Pre-roll: {preroll_frames} frames written before the live recording")
+            
             # Record the video for the configured duration
             frames_to_record = self.config.VIDEO_DURATION * self.config.VIDEO_FPS
+            frame_ms = 1000 // self.config.VIDEO_FPS
             
             clock = time.clock()  # To track FPS
             
@@ -129,6 +153,7 @@ class VideoManager:
                     break
                     
                 clock.tick()
+                frame_start = time.ticks_ms()
                 
                 # Force garbage collection periodically
                 if actual_frames % 5 == 0:
@@ -151,14 +176,13 @@ class VideoManager:
                 # Write the frame to the video with the specified quality
                 video.write(img, quality=self.config.VIDEO_QUALITY)
                 actual_frames += 1
+                if actual_frames == 1:
+                    tracer.record(tracer.VIDEO_START, span_start, trace_id)
                 
-                # If recording faster than the target FPS, add a delay
-                target_frame_time = 1.0 / self.config.VIDEO_FPS
-                elapsed = clock.avg() / 1000.0  # convert to seconds
-                
-                if elapsed < target_frame_time:
-                    delay = target_frame_time - elapsed
-                    time.sleep(delay)
+                # Wait for the next frame time letting the other tasks run
+                # (at least one yield per frame, even when late)
+                elapsed = time.ticks_diff(time.ticks_ms(), frame_start)
+                await asyncio.sleep_ms(max(0, frame_ms - elapsed))
                     
                 # Debug update every 10 frames
                 if actual_frames % 10 == 0:
@@ -169,7 +193,10 @@ class VideoManager:
                         blue_led.toggle()
             
             # Close the video
+            span_start = tracer.start()
             video.close()
+            self.file_manager.register_file(filename)
+            tracer.record(tracer.VIDEO_STOP, span_start, trace_id)
             
             # Turn off the LEDs
             red_led.off()
@@ -183,11 +210,12 @@ class VideoManager:
             gc.collect()
             
             # Handle FIFO file management
-            max_videos = 5  # Default limit
-            if hasattr(self.config, 'MAX_VIDEOS'):
-                max_videos = self.config.MAX_VIDEOS
-                
-            self.file_manager.manage_files(directory, max_videos)
+            if manage_files:
+                max_videos = 5  # Default limit
+                if hasattr(self.config, 'MAX_VIDEOS'):
+                    max_videos = self.config.MAX_VIDEOS
+                    
+                self.file_manager.manage_files(directory, max_videos)
             
             return True
             
@@ -202,15 +230,6 @@ class VideoManager:
             gc.collect()
             
             # Restore the previous camera mode
-            if prev_mode == "motion":
-                # Restore the mode for motion detection
-                try:
-                    sensor.reset()
-                    sensor.set_pixformat(sensor.GRAYSCALE)
-                    sensor.set_framesize(self.config.FRAME_SIZE)
-                    sensor.set_vflip(False)
-                    sensor.set_hmirror(True)
-                    sensor.skip_frames(time=500)
-                    self.current_mode = "motion"
-                except Exception as e:
-                    logger.error(f"Error restoring motion camera mode: {e}")
+            if restore_mode and not self.sensor_mode.restore(prev_state, legacy_settle_ms=500):
+                logger.error("Error restoring the previous camera mode")
+            self.sensor_mode.release()